@@ -0,0 +1,199 @@
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+import networkx as nx
+from utils.ifc_input import IFC_FILE_PATTERNS, get_model_name
+from config import batch_input, batch_output_dir, batch_workers, cache_dir, partial_loading
+
+# Pipeline stages in the order they are run for every model
+BATCH_STAGES = ("extraction", "graph", "community")
+
+
+def find_ifc_files(input_path):
+    """Returns the IFC files (also .ifczip, .ifc.gz) of a folder or the files matching a glob pattern, sorted."""
+    if os.path.isdir(input_path):
+        patterns = [os.path.join(input_path, pattern) for pattern in IFC_FILE_PATTERNS]
+    else:
+        patterns = [input_path]
+    return sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+
+
+def get_model_output_dir(output_root, ifc_file_path):
+    model_name = get_model_name(ifc_file_path)
+    return os.path.join(output_root, f"{model_name}_Output")
+
+
+def process_model(ifc_file_path, model_output_dir, stage_times):
+    """
+    Runs extraction -> combine -> graph -> community detection for a single IFC file.
+
+    The outputs are written to model_output_dir. The duration of every finished stage is added to stage_times,
+    so a failure can be traced back to the stage that raised it.
+    """
+    # Imported here so the batch process itself does not load ifcopenshell, matplotlib, ...
+    from ifc_classes.ifc_project import IfcProject, CIRCULATION_ENTITY_TYPES
+    from ifc_to_csv_or_json import run_pipeline
+    from ifc_to_graph import IfcGraph
+    from community_detection_analysis import analyze_communities
+
+    model_name = get_model_name(ifc_file_path)
+    graph_name = f"Spatial Proximity Graph - {model_name}"
+
+    start = time.time()
+    with IfcProject(ifc_file_path, cache_dir=cache_dir,
+                    include_types=CIRCULATION_ENTITY_TYPES if partial_loading else None) as model:
+        combined_dict = run_pipeline(ifc_file_path, model_output_dir, model=model)
+    stage_times["extraction"] = time.time() - start
+
+    start = time.time()
+    ifc_graph = IfcGraph(combined_dictionary=combined_dict, graph_name=graph_name)
+    ifc_graph.generate(save_dir=model_output_dir, include_indirect_accessibility=False, include_exit_doors=True)
+    ifc_graph.generate_graph_for_each_storey(save_dir=model_output_dir, include_indirect_accessibility=True,
+                                             include_exit_doors=True)
+    stage_times["graph"] = time.time() - start
+
+    # Community detection on the storey graphs, as in community_detection_analysis.py
+    start = time.time()
+    cd_output_folder = os.path.join(model_output_dir, "Community Analysis")
+    os.makedirs(cd_output_folder, exist_ok=True)
+    json_file = os.path.join(model_output_dir, f"{model_name}_space_info_dict.json")
+    storey_pattern = glob.escape(os.path.join(model_output_dir, f"adjacent_rooms_graph_{graph_name}_")) + "*.dot"
+    for dot_file_path in sorted(glob.glob(storey_pattern)):
+        graph = nx.drawing.nx_pydot.read_dot(dot_file_path)
+        if graph.number_of_edges() == 0:
+            # e.g. a storey with a single room, modularity is not defined without edges
+            print(f"Skipping community detection for {dot_file_path}: graph has no edges")
+            continue
+        storey_graph_name = os.path.splitext(os.path.basename(dot_file_path))[0]
+        analyze_communities(graph, json_file, cd_output_folder, storey_graph_name)
+    stage_times["community"] = time.time() - start
+
+
+def run_model_worker(ifc_file_path, model_output_dir, results):
+    """
+    Entry point of a worker process. The console output of the model goes to batch_log.txt in its output folder
+    and the result (with the traceback on failure) is put on the results queue.
+    """
+    os.makedirs(model_output_dir, exist_ok=True)
+    stage_times = {}
+    result = {"file": ifc_file_path, "output_dir": model_output_dir, "status": "ok", "stage": None, "error": None}
+    start = time.time()
+    with open(os.path.join(model_output_dir, "batch_log.txt"), 'w') as log_file, \
+            contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            process_model(ifc_file_path, model_output_dir, stage_times)
+        except Exception as error:
+            traceback.print_exc()
+            failed_stage = next(stage for stage in BATCH_STAGES if stage not in stage_times)
+            result.update(status="failed", stage=failed_stage, error=f"{type(error).__name__}: {error}")
+    result["seconds"] = time.time() - start
+    result["stage_seconds"] = stage_times
+    results.put(result)
+
+
+def run_batch(ifc_files, output_root, workers):
+    """
+    Processes the IFC files on up to `workers` processes and returns one result dict per file.
+
+    Every model runs in its own freshly spawned process, so the module level dictionaries of the extraction, the
+    memory of a large model and even a crash of the IFC parser stay confined to that model.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    pending = list(ifc_files)
+    running = {}
+    finished = []
+
+    while pending or running:
+        while pending and len(running) < workers:
+            ifc_file_path = pending.pop(0)
+            process = context.Process(target=run_model_worker,
+                                      args=(ifc_file_path, get_model_output_dir(output_root, ifc_file_path), results))
+            process.start()
+            running[ifc_file_path] = (process, time.time())
+
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            # A worker that died without reporting (e.g. a segfault in the parser) only fails its own model
+            for ifc_file_path, (process, start) in list(running.items()):
+                if process.exitcode is not None and process.exitcode != 0:
+                    running.pop(ifc_file_path)
+                    finished.append({"file": ifc_file_path,
+                                     "output_dir": get_model_output_dir(output_root, ifc_file_path),
+                                     "status": "failed", "stage": None, "seconds": time.time() - start,
+                                     "stage_seconds": {},
+                                     "error": f"Worker process exited with code {process.exitcode}"})
+                    print_progress(finished[-1], len(finished), len(ifc_files))
+            continue
+
+        if result["file"] not in running:
+            continue
+        process, _ = running.pop(result["file"])
+        process.join()
+        finished.append(result)
+        print_progress(result, len(finished), len(ifc_files))
+
+    return finished
+
+
+def print_progress(result, done_count, total_count):
+    model_name = os.path.basename(result["file"])
+    if result["status"] == "ok":
+        print(f"[{done_count}/{total_count}] {model_name} done in {result['seconds']:.1f} s")
+    else:
+        print(f"[{done_count}/{total_count}] {model_name} FAILED: {result['error']}")
+
+
+def summarize_batch(results, elapsed_seconds, output_root):
+    """Prints the failure summary and the throughput, and saves both to batch_summary.json in output_root."""
+    succeeded = [result for result in results if result["status"] == "ok"]
+    failed = [result for result in results if result["status"] != "ok"]
+    models_per_hour = len(succeeded) / elapsed_seconds * 3600 if elapsed_seconds > 0 else 0.0
+
+    print(f"\nBatch finished: {len(succeeded)} of {len(results)} models processed in {elapsed_seconds:.1f} s")
+    print(f"Throughput: {models_per_hour:.1f} models/hour")
+    if failed:
+        print(f"\n{len(failed)} model(s) failed:")
+        for result in failed:
+            stage = f" ({result['stage']})" if result.get("stage") else ""
+            print(f"  {os.path.basename(result['file'])}{stage}: {result['error']}")
+            print(f"    log: {os.path.join(result['output_dir'], 'batch_log.txt')}")
+
+    summary = {
+        "models": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(failed),
+        "elapsed_seconds": elapsed_seconds,
+        "models_per_hour": models_per_hour,
+        "results": results,
+    }
+    summary_path = os.path.join(output_root, "batch_summary.json")
+    with open(summary_path, 'w') as json_file:
+        json.dump(summary, json_file, indent=4)
+    print(f"Batch summary saved to {summary_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the circulation analysis for a folder of IFC models.")
+    parser.add_argument("input", nargs="?", default=batch_input, help="Folder or glob pattern of IFC files")
+    parser.add_argument("--output", default=batch_output_dir, help="Folder for the <model>_Output folders")
+    parser.add_argument("--workers", type=int, default=batch_workers, help="Number of models processed in parallel")
+    args = parser.parse_args()
+
+    ifc_files = find_ifc_files(args.input)
+    if not ifc_files:
+        raise FileNotFoundError(f"No IFC files found for {args.input}")
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f"Processing {len(ifc_files)} model(s) with {args.workers} worker(s)")
+    batch_start = time.time()
+    batch_results = run_batch(ifc_files, args.output, max(1, args.workers))
+    summarize_batch(batch_results, time.time() - batch_start, args.output)
@@ -0,0 +1,57 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from ifc_classes.ifc_project import IfcProject
+from ifc_classes.adj_space import IfcGeometry
+
+# Model bundled with the repository
+DEFAULT_IFC_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "models", "AC20-FZK-Haus.ifc")
+VOXEL_ENGINES = ("contains", "scanline")
+
+
+def time_voxelization(model, voxel_distance, voxel_engine, cache_dir, repeat):
+    """
+    Returns the best voxelization time of `repeat` runs (tessellation, mesh extraction and the space map write
+    excluded) and the resulting label grid.
+    """
+    # per_storey, so the constructor extracts the space meshes and the voxel locations (never reading the space map
+    # of an earlier run) but voxelizes no grid; voxelize_spaces then builds the grid of the whole building
+    ifc_geometry = IfcGeometry(model.file_path, model.model_name, voxel_distance=voxel_distance, model=model,
+                               cache_dir=cache_dir, voxel_engine=voxel_engine, per_storey=True)
+    ifc_geometry.per_storey = False
+    best_seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ifc_geometry.voxelize_spaces()
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds, ifc_geometry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the voxelization engines of IfcGeometry.")
+    parser.add_argument("ifc_file", nargs="?", default=DEFAULT_IFC_FILE, help="IFC file to voxelize")
+    parser.add_argument("--voxel-distances", type=float, nargs="+", default=[0.5, 0.25, 0.1])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one is reported")
+    args = parser.parse_args()
+
+    model = IfcProject(args.ifc_file)
+    # The spaces are tessellated once up front, so only the voxelization itself is measured
+    model.geometry.tessellate(["IfcSpace"], world_coords=True)
+
+    print(f"Voxelization of {model.model_name}")
+    print(f"{'voxel distance':>15} {'grid':>16} " + " ".join(f"{engine:>10}" for engine in VOXEL_ENGINES)
+          + f" {'speedup':>9} {'identical':>10}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for voxel_distance in args.voxel_distances:
+            results = {engine: time_voxelization(model, voxel_distance, engine, cache_dir, args.repeat)
+                       for engine in VOXEL_ENGINES}
+            grids = [ifc_geometry.space_idx_grid.to_dense() for _, ifc_geometry in results.values()]
+            identical = all(np.array_equal(grids[0], grid) for grid in grids[1:])
+            speedup = results["contains"][0] / results["scanline"][0]
+            grid_shape = "x".join(str(size) for size in results["contains"][1].grid_shape)
+            print(f"{voxel_distance:>15} {grid_shape:>16} "
+                  + " ".join(f"{results[engine][0]:>9.3f}s" for engine in VOXEL_ENGINES)
+                  + f" {speedup:>8.1f}x {str(identical):>10}")
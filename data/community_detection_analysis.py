@@ -1,5 +1,5 @@
 import glob
-from config import output_dir, json_file, dot_file_path, cd_output_folder
+from config import output_dir, dot_file_path, cd_output_folder
 import networkx as nx
 from networkx.drawing.nx_pydot import write_dot
 import matplotlib.pyplot as plt
@@ -196,4 +196,4 @@ if __name__ == "__main__":
     graph_name = os.path.splitext(os.path.basename(dot_file_path))[0]
 
     # Run community analysis
-    analyze_communities(graph, json_file, cd_output_folder, graph_name)
\ No newline at end of file
+    analyze_communities(graph, dict_file_path, cd_output_folder, graph_name)
\ No newline at end of file
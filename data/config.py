@@ -1,7 +1,24 @@
 ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC9R1-Haus-G-H-Ver2-2x3.ifc'
 output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\AC9R1-Haus-G-H-Ver2-2x3_Output'
+cache_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\cache'   # set to None to disable the model cache
+partial_loading = False     # only parse the entity types needed for the circulation analysis (large federated models)
+voxel_distance = 0.5        # horizontal distance between the voxels of the space adjacency grid in m
+voxel_engine = "contains"   # "contains" (trimesh ray tests) or "scanline" (column parity fill)
+voxel_workers = 1           # processes voxelizing the spaces for the space adjacency (1 = no process pool)
+voxel_block_budget = 2 ** 20    # voxels tested at once per space, bounds the memory of the voxelization
+adaptive_grid = False       # coarse voxels in room interiors, fine voxels only near the space surfaces
+voxel_height = None         # vertical voxel spacing in m, layers aligned to the storeys (None = as horizontal)
+per_storey = False          # one voxel grid per storey, bounds the memory by the largest storey
+vertical_relations = False  # also export the adjacency of spaces on consecutive storeys (vertical_space_relation.json)
+virtual_boundary_access = False     # a shared VIRTUAL INTERNAL space boundary makes spaces directly accessible
 graph_name= "Spatial Proximity Graph - House"
 dot_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\AC9R1-Haus-G-H-Ver2-2x3_Output\adjacent_rooms_graph_Spatial Proximity Graph - Office Building_1. Obergeschoss.dot'
+cd_output_folder = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\AC9R1-Haus-G-H-Ver2-2x3_Output\Community Analysis'
+
+#Batch Processing
+batch_input = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models'    # folder or glob pattern, e.g. ...\models\AC20-*.ifc
+batch_output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output'  # one <model>_Output folder per model
+batch_workers = 4   # number of models processed in parallel
 
 #Sub-Community Analysis
 community_id = 2
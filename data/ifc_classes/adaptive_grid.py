@@ -0,0 +1,95 @@
+import itertools
+import numpy as np
+
+
+def get_block_chunks(block, chunk_size):
+    """Returns the chunk indices along x, y and z of the chunks overlapping block (a tuple of x, y, z slices)."""
+    return [np.arange(axis_slice.start // chunk_size, (axis_slice.stop - 1) // chunk_size + 1) for axis_slice in block]
+
+
+def get_boundary_chunks(vertices, faces, block_chunks, location_vecs, chunk_size, margin):
+    """
+    Returns a boolean array over block_chunks (chunk indices along x, y, z), True for the chunks whose voxel centers
+    come within margin of the bounding box of a triangle of the mesh. Only these chunks can hold both voxels inside
+    and outside of the mesh.
+    """
+    triangles = vertices[faces]
+    triangle_min = triangles.min(axis=1) - margin
+    triangle_max = triangles.max(axis=1) + margin
+    first_chunk, stop_chunk = [], []
+    for axis, (chunk_idx, location_vec) in enumerate(zip(block_chunks, location_vecs)):
+        # Location of the first and last voxel center of every chunk
+        lower = location_vec[chunk_idx * chunk_size]
+        upper = location_vec[np.minimum((chunk_idx + 1) * chunk_size, len(location_vec)) - 1]
+        first_chunk.append(np.searchsorted(upper, triangle_min[:, axis], side='left'))
+        stop_chunk.append(np.searchsorted(lower, triangle_max[:, axis], side='right'))
+    valid = np.all([first < stop for first, stop in zip(first_chunk, stop_chunk)], axis=0)
+
+    # Mark the chunk range of every triangle at once: +1/-1 at the corners of each range, summed up along the axes
+    corner_counts = np.zeros([len(chunk_idx) + 1 for chunk_idx in block_chunks], dtype=np.int32)
+    for corner in itertools.product((0, 1), repeat=3):
+        corner_idx = tuple((stop_chunk if upper_corner else first_chunk)[axis][valid]
+                           for axis, upper_corner in enumerate(corner))
+        np.add.at(corner_counts, corner_idx, (-1) ** sum(corner))
+    return corner_counts.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2)[:-1, :-1, :-1] > 0
+
+
+def merge_boxes(boxes, axis):
+    """
+    Merges boxes ((N,6) starts and stops along x, y, z) that follow each other along axis and have the same extent
+    along the other axes.
+    """
+    if len(boxes) == 0:
+        return boxes
+    other_axes = [other_axis for other_axis in range(3) if other_axis != axis]
+    extents = boxes[:, other_axes + [other_axis + 3 for other_axis in other_axes]]
+    order = np.lexsort((boxes[:, axis],) + tuple(extents.T[::-1]))
+    boxes, extents = boxes[order], extents[order]
+    follows = np.all(extents[1:] == extents[:-1], axis=1) & (boxes[1:, axis] == boxes[:-1, axis + 3])
+    group_starts = np.flatnonzero(np.r_[True, ~follows])
+    merged = boxes[group_starts]
+    merged[:, axis + 3] = boxes[np.r_[group_starts[1:], len(boxes)] - 1, axis + 3]
+    return merged
+
+
+def get_chunk_boxes(chunk_mask):
+    """
+    Covers the True entries of a boolean (X,Y,Z) array with boxes ((N,6) starts and stops along x, y, z): the runs
+    along z, merged along y and then along x. Slabs of chunks along the floors, ceilings and walls of a space become
+    one box each, so they are tested in a few large blocks instead of chunk by chunk.
+    """
+    steps = np.diff(np.pad(chunk_mask, ((0, 0), (0, 0), (1, 1))).astype(np.int8), axis=2)
+    start_x, start_y, start_z = np.nonzero(steps == 1)
+    stop_z = np.nonzero(steps == -1)[2]
+    boxes = np.column_stack((start_x, start_y, start_z, start_x + 1, start_y + 1, stop_z))
+    return merge_boxes(merge_boxes(boxes, 1), 0)
+
+
+def get_adaptive_blocks(vertices, faces, block, location_vecs, chunk_size, sample_inside):
+    """
+    Splits the voxel block of a space into coarse and fine parts.
+
+    Returns the (N,3) chunk positions that lie entirely inside the mesh and the voxel blocks (boxes of chunks, cut to
+    block) that still have to be tested voxel by voxel. A chunk that no triangle comes near is either entirely inside
+    or entirely outside of the mesh, so one voxel per chunk decides for all of its voxels: sample_inside(x_vec, y_vec,
+    z_vec) returns the inside voxels of a grid of points, it is called once with the first voxel of every chunk.
+    """
+    block_chunks = get_block_chunks(block, chunk_size)
+    if any(len(chunk_idx) == 0 for chunk_idx in block_chunks):
+        return np.empty((0, 3), dtype=np.int64), []
+    # Half the largest voxel spacing of the grid, so no voxel center near a surface is taken for a coarse voxel
+    margin = max(np.max(np.diff(location_vec), initial=0) for location_vec in location_vecs) / 2
+    boundary = get_boundary_chunks(vertices, faces, block_chunks, location_vecs, chunk_size, margin)
+
+    sample_idx = [np.maximum(chunk_idx * chunk_size, axis_slice.start)
+                  for chunk_idx, axis_slice in zip(block_chunks, block)]
+    inside = sample_inside(*[location_vec[idx] for location_vec, idx in zip(location_vecs, sample_idx)])
+    chunk_offset = np.array([chunk_idx[0] for chunk_idx in block_chunks])
+    inside_chunks = np.argwhere(inside & ~boundary) + chunk_offset
+
+    fine_blocks = []
+    for box in get_chunk_boxes(boundary):
+        fine_blocks.append(tuple(slice(max((start + offset) * chunk_size, axis_slice.start),
+                                       min((stop + offset) * chunk_size, axis_slice.stop))
+                                 for start, stop, offset, axis_slice in zip(box[:3], box[3:], chunk_offset, block)))
+    return inside_chunks, fine_blocks
@@ -1,19 +1,35 @@
 # misc non-standard libraries
 import ifcopenshell
 import ifcopenshell.geom
+import ifcopenshell.util.placement
+import ifcopenshell.util.unit
 import trimesh
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
+import plotly.graph_objects as go
 # custom
 from data.utils.progressbar import progressbar
+from data.utils.ifc_input import open_ifc_file
+from data.utils.model_cache import ModelCache
+from data.ifc_classes.ifc_geometry_service import ShapeGeometry
+from data.ifc_classes.parallel_voxelizer import parallel_voxelize, voxelize_block
+from data.ifc_classes.voxel_label_grid import ChunkedLabelGrid, get_label_dtype, split_block, CHUNK_SIZE
+from data.ifc_classes.adaptive_grid import get_adaptive_blocks
 
 # standard
 import math
+import copy
+import multiprocessing
 import os
 import numpy as np
 import itertools
 import json
+import hashlib
+
+# Format of the cached space map, older files are not read
+SPACE_MAP_VERSION = 3
+# Voxels per coarse voxel along each axis on the adaptive grid
+ADAPTIVE_CHUNK_SIZE = 4
 
 
 class IfcGeometry:
@@ -22,13 +38,30 @@ class IfcGeometry:
                  name=None,  # Name of the SpaceGeometryContainer
                  force_init=False,  # Force the creation of a new SpaceGeometryContainer object
                  exclude_space_list=[],  # List with names of rooms that should not be included
-                 voxel_distance=0.5):  # Distance between grid voxels along each axis X, Y, Z
+                 voxel_distance=0.5,  # Distance between grid voxels along X and Y (and Z if voxel_height is None)
+                 voxel_height=None,  # Distance between the voxel layers along Z, snapped to the storey elevations
+                 model=None,  # Already opened model session (IfcProject), reused instead of opening the file
+                 cache_dir=None,  # Folder of the space map; default: the model cache, otherwise this folder
+                 voxel_engine="contains",  # "contains" (trimesh ray tests) or "scanline" (column parity fill)
+                 voxel_workers=1,  # Number of processes voxelizing the spaces, 1 voxelizes in this process
+                 voxel_block_budget=2 ** 20,  # Maximum number of voxels tested at once (bounds the memory use)
+                 adaptive_grid=False,  # Test voxel by voxel only near the space surfaces, coarse voxels elsewhere
+                 per_storey=False):  # One grid per storey (only adjacency within a storey), see get_storey_adjacent_spaces_dict
 
         self.ifc_file_path = ifc_file_path
+        self.model = model
         self.name = name
         self.force_init = force_init
         self.exclude_space_list = exclude_space_list
         self.voxel_distance = voxel_distance
+        self.voxel_height = voxel_height
+        self.cache_dir = cache_dir
+        self.voxel_engine = voxel_engine
+        self.voxel_workers = voxel_workers
+        self.voxel_block_budget = voxel_block_budget
+        self.adaptive_grid = adaptive_grid
+        self.per_storey = per_storey
+        self.space_map_filename = None
         self.x_size = None
         self.y_size = None
         self.z_size = None
@@ -36,7 +69,9 @@ class IfcGeometry:
         self.voxel_y_location_vec = None
         self.voxel_z_location_vec = None
         self.grid_shape = None
+        self.storey_elevation_list = []
         self.space_idx_dict = {}
+        self.space_idx_grid = None  # ChunkedLabelGrid of the space index of every voxel
         self.neutral_idx = -50
         self.ambient_idx = -100
 
@@ -46,61 +81,134 @@ class IfcGeometry:
         self.init_geometry()
         self.init_3D_space_idx_array()
 
+    def get_space_map_path(self):
+        """
+        Returns the path of the cached label grid. The file name contains a key of the model content and the
+        voxelization parameters, so a changed model, voxel_distance or exclude_space_list never reads an old grid.
+        """
+        if self.model is not None:
+            content_key = self.model.cache_key
+            cache_dir = self.cache_dir or (os.path.join(self.model.cache.cache_dir, content_key)
+                                           if self.model.cache is not None else None)
+        else:
+            content_key = ModelCache.get_key(self.ifc_file_path)
+            cache_dir = self.cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.dirname(os.path.realpath(__file__))
+        parameters = (f"{content_key}|{self.voxel_distance!r}|{json.dumps(sorted(self.exclude_space_list))}"
+                      f"|{self.voxel_engine}|{SPACE_MAP_VERSION}|{self.voxel_height!r}")
+        space_map_key = hashlib.sha256(parameters.encode()).hexdigest()[:16]
+        return os.path.join(cache_dir, f"space_map_{self.name}_{space_map_key}.npz")
+
+    def load_space_map(self, space_map_filename):
+        # The space meshes are not cached, only the label grid and the tables needed for the adjacency
+        with np.load(space_map_filename) as space_map:
+            self.space_idx_grid = ChunkedLabelGrid.from_arrays(
+                {key[len("grid_"):]: space_map[key] for key in space_map.files if key.startswith("grid_")})
+            self.voxel_x_location_vec = space_map["voxel_x_location_vec"]
+            self.voxel_y_location_vec = space_map["voxel_y_location_vec"]
+            self.voxel_z_location_vec = space_map["voxel_z_location_vec"]
+            tables = json.loads(str(space_map["tables"]))
+        self.grid_shape = self.space_idx_grid.shape
+        self.x_size, self.y_size, self.z_size = self.grid_shape
+        self.space_name_list = tables["space_name_list"]
+        self.space_name_neutral_list = tables["space_name_neutral_list"]
+        self.space_type_name_dict = tables["space_type_name_dict"]
+        self.space_storey_dict = tables["space_storey_dict"]
+        self.space_idx_dict = tables["space_idx_dict"]
+        self.space_mesh_list = []
+        self.space_mesh_neutral_list = []
+        self.space_storey_list = []
+        self.space_storey_neutral_list = []
+
+    def save_space_map(self, space_map_filename):
+        tables = {
+            "space_name_list": self.space_name_list,
+            "space_name_neutral_list": self.space_name_neutral_list,
+            "space_type_name_dict": self.space_type_name_dict,
+            "space_storey_dict": self.space_storey_dict,
+            "space_idx_dict": self.space_idx_dict,
+        }
+        os.makedirs(os.path.dirname(space_map_filename), exist_ok=True)
+        # Write to a temporary file first so an interrupted run does not leave a truncated grid behind
+        temp_filename = space_map_filename + ".tmp"
+        with open(temp_filename, 'wb') as file:
+            np.savez_compressed(file,
+                                **{f"grid_{key}": array for key, array in self.space_idx_grid.get_arrays().items()},
+                                voxel_x_location_vec=self.voxel_x_location_vec,
+                                voxel_y_location_vec=self.voxel_y_location_vec,
+                                voxel_z_location_vec=self.voxel_z_location_vec,
+                                tables=np.array(json.dumps(tables)))
+        os.replace(temp_filename, space_map_filename)
+
     def init_geometry(self):
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        space_map_filename = current_dir + "/" + "space_map_" + self.name + ".pickle"
-        if self.force_init or os.path.isfile(space_map_filename) == False:
+        self.space_map_filename = self.get_space_map_path()
+        # The storey grids are not cached, they need the space meshes
+        if self.force_init or self.per_storey or os.path.isfile(self.space_map_filename) == False:
             settings = ifcopenshell.geom.settings()
             settings.set(settings.USE_WORLD_COORDS, True)
             id_iter = itertools.count()
 
             # print("Extracting geometry from ifc...")
             neutral_space_name = "Area"  # spaces that doesnt classify as a room but is a part of the building
-            ifc_file = ifcopenshell.open(self.ifc_file_path)
-            ifc_space_list = ifc_file.by_type("IfcSpace")
-            ifc_storey_list = ifc_file.by_type("IfcBuildingStorey")
+            if self.model is not None:
+                ifc_space_list = self.model.spaces
+                ifc_storey_list = self.model.storeys
+                # Tessellate all spaces in one multi-threaded pass instead of one create_shape call per space
+                self.model.geometry.tessellate(["IfcSpace"], world_coords=True)
+                unit_scale = self.model.geometry.unit_scale
+            else:
+                ifc_file = open_ifc_file(self.ifc_file_path)
+                ifc_space_list = ifc_file.by_type("IfcSpace")
+                ifc_storey_list = ifc_file.by_type("IfcBuildingStorey")
+                unit_scale = ifcopenshell.util.unit.calculate_unit_scale(ifc_file)
+
+            self.storey_elevation_list = [elevation for elevation in
+                                          (self.get_storey_elevation(storey, unit_scale) for storey in ifc_storey_list)
+                                          if elevation is not None]
 
             if len(ifc_space_list) == 0:
                 print("Ifc-file does not contain any space objects -> quitting...")
             else:
                 self.space_name_list = []
                 self.space_mesh_list = []
+                self.space_storey_list = []
                 self.space_type_name_dict = {}
                 self.space_storey_dict = {}
 
                 self.space_name_neutral_list = []
                 self.space_mesh_neutral_list = []
+                self.space_storey_neutral_list = []
 
                 space_counter = 0
                 for storey_counter, storey in enumerate(ifc_storey_list):
                     for ifc_rel_aggregates in storey.IsDecomposedBy:
                         for space in ifc_rel_aggregates.RelatedObjects:
-                            shape = ifcopenshell.geom.create_shape(settings, space)
-                            vertices = shape.geometry.verts
-                            edges = shape.geometry.edges
-                            faces = shape.geometry.faces
-
-                            if space.Name is None:  # If the space has no name, give it a generic name
-                                space.Name = "Space_" + str(next(id_iter))
+                            if self.model is not None:
+                                geometry = self.model.geometry.get_geometry(space, world_coords=True)
+                            else:
+                                geometry = ShapeGeometry(ifcopenshell.geom.create_shape(settings, space))
 
-                            grouped_vertices = np.array(
-                                [[vertices[i], vertices[i + 1], vertices[i + 2]] for i in range(0, len(vertices), 3)])
-                            grouped_edges = np.array([[edges[i], edges[i + 1]] for i in range(0, len(edges), 2)])
-                            grouped_faces = np.array(
-                                [[faces[i], faces[i + 1], faces[i + 2]] for i in range(0, len(faces), 3)])
+                            # If the space has no name, give it a generic name (without writing it back to the shared model)
+                            space_name = space.Name
+                            if space_name is None:
+                                space_name = "Space_" + str(next(id_iter))
 
-                            mesh = trimesh.Trimesh(vertices=grouped_vertices,
-                                                   faces=grouped_faces)
+                            # (N,3) vertex and face arrays viewed directly from the ifcopenshell buffers
+                            mesh = trimesh.Trimesh(vertices=geometry.vertices,
+                                                   faces=geometry.faces)
 
-                            if (space.Name in self.exclude_space_list) == False:
+                            if (space_name in self.exclude_space_list) == False:
                                 if space.LongName == neutral_space_name:
-                                    self.space_name_neutral_list.append(space.Name)
+                                    self.space_name_neutral_list.append(space_name)
                                     self.space_mesh_neutral_list.append(mesh)
+                                    self.space_storey_neutral_list.append(storey_counter)
                                 else:
-                                    self.space_name_list.append(space.Name)
+                                    self.space_name_list.append(space_name)
                                     self.space_mesh_list.append(mesh)
-                                    self.space_type_name_dict[space.Name] = space.LongName
-                                    self.space_storey_dict[space.Name] = storey_counter
+                                    self.space_storey_list.append(storey_counter)
+                                    self.space_type_name_dict[space_name] = space.LongName
+                                    self.space_storey_dict[space_name] = storey_counter
 
                             # progressbar(space_counter, 0, len(ifc_space_list) - 1)
                             space_counter += 1
@@ -108,8 +216,56 @@ class IfcGeometry:
                 # Check for duplicate room names
                 if len(set(self.space_name_list)) != len(self.space_name_list):
                     print("Warning: duplicate space names found in IFC.")
+        else:
+            # Label grid of an earlier run, no tessellation and voxelization needed
+            self.load_space_map(self.space_map_filename)
+
+    @staticmethod
+    def get_storey_elevation(storey, unit_scale):
+        # World Z of the storey in meters (as the tessellated spaces): from its placement, otherwise its Elevation
+        if storey.ObjectPlacement is not None:
+            return ifcopenshell.util.placement.get_local_placement(storey.ObjectPlacement)[2, 3] * unit_scale
+        if storey.Elevation is not None:
+            return storey.Elevation * unit_scale
+        return None
+
+    def get_storey_z_location_vec(self, min_z, max_z):
+        """
+        Returns the Z locations of the voxel layers between min_z and max_z when voxel_height is set. The height is
+        divided at the storey elevations and every storey into layers of about voxel_height, with the layer centers
+        in between: the slab at a storey elevation falls between the top layer of the storey below and the bottom
+        layer of the storey above. As on the uniform grid, one outdoor layer is added below and above.
+        """
+        breakpoints = [min_z]
+        for elevation in sorted(self.storey_elevation_list):
+            # Elevations outside of the spaces, or closer than half a layer to the previous one, add no layer
+            if breakpoints[-1] + self.voxel_height / 2 <= elevation <= max_z - self.voxel_height / 2:
+                breakpoints.append(elevation)
+        breakpoints.append(max_z)
+
+        layer_list = [min_z - self.voxel_height / 2]
+        for bottom, top in zip(breakpoints[:-1], breakpoints[1:]):
+            layer_count = max(1, round((top - bottom) / self.voxel_height))
+            layer_list.extend(bottom + (top - bottom) / layer_count * (np.arange(layer_count) + 0.5))
+        layer_list.append(max_z + self.voxel_height / 2)
+        return np.array(layer_list)
 
     def init_3D_space_idx_array(self):
+        if self.space_idx_grid is not None:
+            # Loaded from the space map cache
+            return
+
+        self.init_voxel_locations()
+        if self.per_storey:
+            # No grid of the whole building, the storeys are voxelized one by one in get_storey_adjacent_spaces_dict;
+            # the spaces keep the indices they have on the grid of the whole building
+            self.space_idx_dict.update((space_name, space_counter)
+                                       for space_counter, space_name in enumerate(self.space_name_list))
+            return
+        self.voxelize_spaces()
+        self.save_space_map(self.space_map_filename)
+
+    def init_voxel_locations(self):
         min_x_list = []
         min_y_list = []
         min_z_list = []
@@ -160,181 +316,274 @@ class IfcGeometry:
         max_y = max_y - y_rem * 0.5 + self.voxel_distance  # add additional outdoor block
         max_z = max_z - z_rem * 0.5 + self.voxel_distance  # add additional outdoor block
 
-        voxel_x_idx_vec = np.arange(self.x_size)  # (x_size)
-        voxel_y_idx_vec = np.arange(self.y_size)  # (y_size)
-        voxel_z_idx_vec = np.arange(self.z_size)  # (z_size)
-
         self.voxel_x_location_vec = np.linspace(min_x, max_x, self.x_size)  # (x_size) // location of voxel
         self.voxel_y_location_vec = np.linspace(min_y, max_y, self.y_size)  # (y_size)
         self.voxel_z_location_vec = np.linspace(min_z, max_z, self.z_size)  # (conv_z_size)
 
-        voxel_x_idx_mesh, voxel_y_idx_mesh, voxel_z_idx_mesh = np.meshgrid(voxel_x_idx_vec, voxel_y_idx_vec,
-                                                                           voxel_z_idx_vec)
-        voxel_x_location_mesh, voxel_y_location_mesh, voxel_z_location_mesh = np.meshgrid(self.voxel_x_location_vec,
-                                                                                          self.voxel_y_location_vec,
-                                                                                          self.voxel_z_location_vec)
-
-        idx_mesh = np.swapaxes(np.array([voxel_x_idx_mesh, voxel_y_idx_mesh, voxel_z_idx_mesh]), 0,
-                               3)  # (conv_x_size,conv_y_size,conv_z_size,3)
-        location_mesh = np.swapaxes(np.array([voxel_x_location_mesh, voxel_y_location_mesh, voxel_z_location_mesh]), 0,
-                                    3)  # (conv_x_size,conv_y_size,conv_z_size)
-
-        idx_mesh_vec = np.reshape(idx_mesh,
-                                  (idx_mesh.shape[0] * idx_mesh.shape[1] * idx_mesh.shape[2], idx_mesh.shape[3]))
-        location_mesh_vec = np.reshape(location_mesh, (
-            location_mesh.shape[0] * location_mesh.shape[1] * location_mesh.shape[2], location_mesh.shape[3]))
+        if self.voxel_height is not None:
+            # Layers of their own spacing along Z, aligned to the storeys
+            self.voxel_z_location_vec = self.get_storey_z_location_vec(np.min(min_z_list), np.max(max_z_list))
+            self.z_size = len(self.voxel_z_location_vec)
 
         # print("Generating space to position index map...")
         self.grid_shape = (self.x_size, self.y_size, self.z_size)
-        self._3D_space_idx_array = np.ones(self.grid_shape, dtype=np.int64) * self.ambient_idx
+
+    def voxelize_spaces(self):
+        # Only the chunks holding more than one label are stored voxel by voxel, in the narrowest dtype for this model
+        label_dtype = get_label_dtype(min(self.ambient_idx, self.neutral_idx), len(self.space_mesh_list) - 1)
+        self.space_idx_grid = ChunkedLabelGrid(self.grid_shape, self.ambient_idx, label_dtype,
+                                               ADAPTIVE_CHUNK_SIZE if self.adaptive_grid else CHUNK_SIZE)
+
+        if self.voxel_workers > 1:
+            # Neutral spaces first, then the normal spaces in their order, as in the loops below
+            space_meshes = self.space_mesh_neutral_list + self.space_mesh_list
+            space_indices = [self.neutral_idx] * len(self.space_mesh_neutral_list) + list(range(len(self.space_mesh_list)))
+            space_chunks, space_blocks = zip(*[self.get_space_blocks(space_mesh) for space_mesh in space_meshes])
+            parallel_voxelize(
+                space_meshes, space_indices, space_blocks, space_chunks,
+                (self.voxel_x_location_vec, self.voxel_y_location_vec, self.voxel_z_location_vec),
+                self.space_idx_grid, self.voxel_engine, self.voxel_workers)
+            self.space_idx_grid.compact()
+            self.space_idx_dict.update((space_name, space_counter)
+                                       for space_counter, space_name in enumerate(self.space_name_list))
+            return
 
         # Set indices for neutral space
         for space_counter, space_mesh in enumerate(self.space_mesh_neutral_list):
-            bool_vec = space_mesh.contains(location_mesh_vec)
-            x_idx = idx_mesh_vec[bool_vec, 0]
-            y_idx = idx_mesh_vec[bool_vec, 1]
-            z_idx = idx_mesh_vec[bool_vec, 2]
-            self._3D_space_idx_array[x_idx, y_idx, z_idx] = self.neutral_idx
+            self.fill_space_voxels(space_mesh, self.neutral_idx)
 
             # progressbar(space_counter, 0, len(self.space_mesh_neutral_list) - 1)
 
         # Set indices for normal space
         for space_counter, space_mesh in enumerate(self.space_mesh_list):
-            bool_vec = space_mesh.contains(location_mesh_vec)
-            x_idx = idx_mesh_vec[bool_vec, 0]
-            y_idx = idx_mesh_vec[bool_vec, 1]
-            z_idx = idx_mesh_vec[bool_vec, 2]
-            self._3D_space_idx_array[x_idx, y_idx, z_idx] = space_counter
+            self.fill_space_voxels(space_mesh, space_counter)
             self.space_idx_dict[self.space_name_list[space_counter]] = space_counter
 
             # progressbar(space_counter, 0, len(self.space_mesh_list) - 1)
 
+        self.space_idx_grid.compact()
+
+    def get_voxel_block(self, space_mesh):
+        """
+        Returns the (x, y, z) index slices of the voxels whose centers lie inside the bounding box of space_mesh.
+        Voxels outside of it cannot be contained in the mesh, so only this sub-block has to be tested.
+        """
+        bounds_min, bounds_max = space_mesh.bounds
+        block = []
+        for location_vec, axis_min, axis_max in zip((self.voxel_x_location_vec, self.voxel_y_location_vec,
+                                                     self.voxel_z_location_vec), bounds_min, bounds_max):
+            block.append(slice(np.searchsorted(location_vec, axis_min, side='left'),
+                               np.searchsorted(location_vec, axis_max, side='right')))
+        return tuple(block)
+
+    def get_space_blocks(self, space_mesh):
+        """
+        Returns the chunks of the label grid that lie entirely inside space_mesh and the voxel blocks (of at most
+        voxel_block_budget voxels) that are tested voxel by voxel. On the uniform grid all voxels of the bounding box
+        of the space are tested, on the adaptive grid only the chunks near its surface.
+        """
+        block = self.get_voxel_block(space_mesh)
+        if self.adaptive_grid:
+            location_vecs = (self.voxel_x_location_vec, self.voxel_y_location_vec, self.voxel_z_location_vec)
+            inside_chunks, blocks = get_adaptive_blocks(
+                space_mesh.vertices, space_mesh.faces, block, location_vecs, self.space_idx_grid.chunk_size,
+                lambda x_vec, y_vec, z_vec: voxelize_block(space_mesh.vertices, space_mesh.faces, x_vec, y_vec, z_vec,
+                                                           self.voxel_engine, space_mesh))
+        else:
+            inside_chunks, blocks = np.empty((0, 3), dtype=np.int64), [block]
+        return inside_chunks, [sub_block for block in blocks for sub_block in split_block(block, self.voxel_block_budget)]
+
+    def fill_space_voxels(self, space_mesh, space_idx):
+        """
+        Sets the label of the voxels inside space_mesh, testing only the voxels of its bounding box (see
+        get_space_blocks). The query points of a block are generated from the 1-D location vectors when it is tested.
+        """
+        inside_chunks, blocks = self.get_space_blocks(space_mesh)
+        self.space_idx_grid.set_chunks(inside_chunks, space_idx)
+        for block in blocks:
+            inside = voxelize_block(space_mesh.vertices, space_mesh.faces, self.voxel_x_location_vec[block[0]],
+                                    self.voxel_y_location_vec[block[1]], self.voxel_z_location_vec[block[2]],
+                                    self.voxel_engine, space_mesh)
+            self.space_idx_grid.set_block(block, inside, space_idx)
+
     def get_point_space_idx(self, x_idx, y_idx, z_idx):
-        return self._3D_space_idx_array[x_idx, y_idx, z_idx]
+        return self.space_idx_grid.get_labels(x_idx, y_idx, z_idx)
+
+    def get_spaces_block(self, space_meshes):
+        # Voxel block of the bounding boxes of all space_meshes, with one voxel of margin (as the outdoor block)
+        blocks = [self.get_voxel_block(space_mesh) for space_mesh in space_meshes]
+        return tuple(slice(max(min(block[axis].start for block in blocks) - 1, 0),
+                           min(max(block[axis].stop for block in blocks) + 1, size))
+                     for axis, size in enumerate(self.grid_shape))
+
+    def get_sub_geometry(self, space_counters, neutral_counters, block):
+        """
+        Returns a copy of this geometry with only the spaces space_counters and the neutral spaces neutral_counters,
+        on the part block (tuple of x, y, z slices) of the voxel grid. The voxel centers stay where they are on the
+        grid of the whole building. The copy holds no model, so it can be sent to a worker process.
+        """
+        sub_geometry = copy.copy(self)
+        sub_geometry.model = None
+        sub_geometry.per_storey = False
+        sub_geometry.voxel_workers = 1
+        sub_geometry.space_map_filename = None
+        sub_geometry.space_idx_grid = None
+        sub_geometry.space_idx_dict = {}
+        sub_geometry.space_name_list = [self.space_name_list[space_counter] for space_counter in space_counters]
+        sub_geometry.space_mesh_list = [self.space_mesh_list[space_counter] for space_counter in space_counters]
+        sub_geometry.space_mesh_neutral_list = [self.space_mesh_neutral_list[space_counter]
+                                                for space_counter in neutral_counters]
+        sub_geometry.voxel_x_location_vec = self.voxel_x_location_vec[block[0]]
+        sub_geometry.voxel_y_location_vec = self.voxel_y_location_vec[block[1]]
+        sub_geometry.voxel_z_location_vec = self.voxel_z_location_vec[block[2]]
+        sub_geometry.grid_shape = (len(sub_geometry.voxel_x_location_vec), len(sub_geometry.voxel_y_location_vec),
+                                   len(sub_geometry.voxel_z_location_vec))
+        sub_geometry.x_size, sub_geometry.y_size, sub_geometry.z_size = sub_geometry.grid_shape
+        return sub_geometry
+
+    def map_sub_geometries(self, sub_geometries):
+        # Adjacency of every sub geometry, on a pool of voxel_workers processes if there is more than one
+        if self.voxel_workers > 1 and len(sub_geometries) > 1:
+            # spawn, as on Windows, so the workers do not inherit the state of the parent process
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(min(self.voxel_workers, len(sub_geometries))) as pool:
+                return pool.map(get_sub_geometry_adjacency, sub_geometries, chunksize=1)
+        return [get_sub_geometry_adjacency(sub_geometry) for sub_geometry in sub_geometries]
+
+    def get_storey_adjacent_spaces_dict(self):
+        """
+        Returns the adjacent spaces of every space within its storey. Every storey is voxelized on its own grid (the
+        part of the building grid around its spaces), so the memory is bounded by the largest storey instead of the
+        whole building; with voxel_workers > 1 the storeys are processed concurrently.
+        """
+        sub_geometries = []
+        for storey_counter in sorted(set(self.space_storey_list)):
+            space_counters = [space_counter for space_counter, space_storey in enumerate(self.space_storey_list)
+                              if space_storey == storey_counter]
+            neutral_counters = [space_counter for space_counter, space_storey in enumerate(self.space_storey_neutral_list)
+                                if space_storey == storey_counter]
+            block = self.get_spaces_block([self.space_mesh_list[space_counter] for space_counter in space_counters])
+            sub_geometries.append(self.get_sub_geometry(space_counters, neutral_counters, block))
+
+        adjacent_spaces_dict = {space_name: [] for space_name in self.space_name_list}
+        for storey_adjacent_spaces_dict in self.map_sub_geometries(sub_geometries):
+            adjacent_spaces_dict.update(storey_adjacent_spaces_dict)
+        return adjacent_spaces_dict
+
+    def get_vertical_adjacent_spaces_dict(self):
+        """
+        Returns the adjacent spaces of every space on the storeys below and above it, a separate pass next to the
+        adjacency within the storeys. For every two consecutive storeys only the spaces whose plans overlap a space of
+        the other storey are voxelized, and only in the layers from the lowest ceiling of the lower spaces to the
+        highest floor of the upper spaces. Needs the space meshes, which are not kept in the space map cache: the
+        geometry has to be created with per_storey (which voxelizes no grid of the whole building) or force_init.
+        """
+        if len(self.space_mesh_list) != len(self.space_name_list):
+            raise ValueError("The vertical adjacency needs the space meshes, which are not loaded from the space map "
+                             "cache. Create the IfcGeometry with per_storey=True or force_init=True.")
+        storey_counters = sorted(set(self.space_storey_list))
+        sub_geometries = []
+        for lower_storey, upper_storey in zip(storey_counters[:-1], storey_counters[1:]):
+            lower_counters = [space_counter for space_counter, space_storey in enumerate(self.space_storey_list)
+                              if space_storey == lower_storey]
+            upper_counters = [space_counter for space_counter, space_storey in enumerate(self.space_storey_list)
+                              if space_storey == upper_storey]
+            lower_counters, upper_counters = (
+                [space_counter for space_counter in counters
+                 if any(self.get_plan_overlap(space_counter, other_counter) for other_counter in other_counters)]
+                for counters, other_counters in ((lower_counters, upper_counters), (upper_counters, lower_counters)))
+            if not lower_counters:
+                continue
+            block = list(self.get_spaces_block([self.space_mesh_list[space_counter]
+                                                for space_counter in lower_counters + upper_counters]))
+            # The top layer of the lower spaces up to the bottom layer of the upper spaces (the vertical search)
+            z_start = min(self.get_voxel_block(self.space_mesh_list[space_counter])[2].stop - 1
+                          for space_counter in lower_counters)
+            z_stop = max(self.get_voxel_block(self.space_mesh_list[space_counter])[2].start + 1
+                         for space_counter in upper_counters)
+            block[2] = slice(max(z_start, 0), max(z_stop, z_start + 1))
+            neutral_counters = [space_counter for space_counter, space_storey in enumerate(self.space_storey_neutral_list)
+                                if space_storey in (lower_storey, upper_storey)]
+            sub_geometries.append(self.get_sub_geometry(lower_counters + upper_counters, neutral_counters, tuple(block)))
+
+        adjacent_spaces_dict = {space_name: [] for space_name in self.space_name_list}
+        for pair_adjacent_spaces_dict in self.map_sub_geometries(sub_geometries):
+            for space_name, adjacent_space_names in pair_adjacent_spaces_dict.items():
+                adjacent_spaces_dict[space_name].extend(
+                    adjacent_space_name for adjacent_space_name in adjacent_space_names
+                    if self.space_storey_dict[adjacent_space_name] != self.space_storey_dict[space_name])
+        return adjacent_spaces_dict
+
+    def get_plan_overlap(self, space_counter, other_counter):
+        # True if the bounding boxes of two spaces overlap in the XY plane
+        bounds = self.space_mesh_list[space_counter].bounds
+        other_bounds = self.space_mesh_list[other_counter].bounds
+        return bool(np.all(bounds[0, :2] <= other_bounds[1, :2]) and np.all(other_bounds[0, :2] <= bounds[1, :2]))
 
     def get_adjacent_spaces_dict(self):
-        x_bool = np.equal(self._3D_space_idx_array[:-1, :, :], self._3D_space_idx_array[1:, :, :]) == False
-        y_bool = (self._3D_space_idx_array[:, :-1, :] == self._3D_space_idx_array[:, 1:, :]) == False
-        z_bool = (self._3D_space_idx_array[:, :, :-1] == self._3D_space_idx_array[:, :, 1:]) == False
-
-        dx_idx_space_1_x, dx_idx_space_1_y, dx_idx_space_1_z = np.where(x_bool)
-        dy_idx_space_1_x, dy_idx_space_1_y, dy_idx_space_1_z = np.where(y_bool)
-        dz_idx_space_1_x, dz_idx_space_1_y, dz_idx_space_1_z = np.where(z_bool)
-
-        dx_idx_space_2_x = dx_idx_space_1_x + 1
-        dy_idx_space_2_x = dy_idx_space_1_x
-        dz_idx_space_2_x = dz_idx_space_1_x
-
-        dx_idx_space_2_y = dx_idx_space_1_y
-        dy_idx_space_2_y = dy_idx_space_1_y + 1
-        dz_idx_space_2_y = dz_idx_space_1_y
-
-        dx_idx_space_2_z = dx_idx_space_1_z
-        dy_idx_space_2_z = dy_idx_space_1_z
-        dz_idx_space_2_z = dz_idx_space_1_z + 1
-
-        dx_idx_pair_1 = self._3D_space_idx_array[dx_idx_space_1_x, dx_idx_space_1_y, dx_idx_space_1_z]
-        dx_idx_pair_2 = self._3D_space_idx_array[dx_idx_space_2_x, dx_idx_space_2_y, dx_idx_space_2_z]
-        dy_idx_pair_1 = self._3D_space_idx_array[dy_idx_space_1_x, dy_idx_space_1_y, dy_idx_space_1_z]
-        dy_idx_pair_2 = self._3D_space_idx_array[dy_idx_space_2_x, dy_idx_space_2_y, dy_idx_space_2_z]
-        dz_idx_pair_1 = self._3D_space_idx_array[dz_idx_space_1_x, dz_idx_space_1_y, dz_idx_space_1_z]
-        dz_idx_pair_2 = self._3D_space_idx_array[dz_idx_space_2_x, dz_idx_space_2_y, dz_idx_space_2_z]
-
-        # For each point in the generated mesh, it is checked which space the adjacent point is encapsulated by.
-        # If the adjacent point does not belong to a space, the subsequent point is checked.
-        # This is done up until "n_search_blocks" away from the original point.
-        n_search_blocks = 2
-        for i in range(n_search_blocks):
-            dx_temp = dx_idx_space_2_x + i + 1
-            dx_temp[dx_temp >= self.grid_shape[0]] = dx_idx_space_2_x[dx_temp >= self.grid_shape[0]]
-            temp = self._3D_space_idx_array[
-                dx_temp, dx_idx_space_2_y, dx_idx_space_2_z]  ###     If +1 point is not a room then check +2 point
-            bool_dx = np.logical_or(dx_idx_pair_2 == self.neutral_idx, dx_idx_pair_2 == self.ambient_idx)  ###
-            dx_idx_pair_2[bool_dx] = temp[bool_dx]  ###
-
-            dy_temp = dy_idx_space_2_y + i + 1
-            dy_temp[dy_temp >= self.grid_shape[1]] = dy_idx_space_2_y[dy_temp >= self.grid_shape[1]]
-            temp = self._3D_space_idx_array[dy_idx_space_2_x, dy_temp, dy_idx_space_2_z]  ###
-            bool_dy = np.logical_or(dy_idx_pair_2 == self.neutral_idx, dy_idx_pair_2 == self.ambient_idx)  ###
-            dy_idx_pair_2[bool_dy] = temp[bool_dy]  ###
-
-            dz_temp = dz_idx_space_2_z + i + 1
-            dz_temp[dz_temp >= self.grid_shape[2]] = dz_idx_space_2_z[dz_temp >= self.grid_shape[2]]
-            temp = self._3D_space_idx_array[dz_idx_space_2_x, dz_idx_space_2_y, dz_temp]  ###
-            bool_dz = np.logical_or(dz_idx_pair_2 == self.neutral_idx, dz_idx_pair_2 == self.ambient_idx)  ###
-            dz_idx_pair_2[bool_dz] = temp[bool_dz]  ###
-
-        dx_idx_pair = np.array([dx_idx_pair_1, dx_idx_pair_2])
-        dy_idx_pair = np.array([dy_idx_pair_1, dy_idx_pair_2])
-        dz_idx_pair = np.array([dz_idx_pair_1, dz_idx_pair_2])
-
-        dx_pair_list = []
-        while True:
-            dx_pair_list.append(dx_idx_pair[:, 0])
-            is_equal_bool = np.equal(dx_idx_pair[:, 0].reshape((2, 1)), dx_idx_pair)
-            is_equal_bool = np.logical_and(is_equal_bool[0], is_equal_bool[1])
-            if np.all(is_equal_bool):
-                break
-            else:
-                dx_idx_pair = dx_idx_pair[:, is_equal_bool == False]
-
-        dy_pair_list = []
-        while True:
-            dy_pair_list.append(dy_idx_pair[:, 0])
-            is_equal_bool = np.equal(dy_idx_pair[:, 0].reshape((2, 1)), dy_idx_pair)
-            is_equal_bool = np.logical_and(is_equal_bool[0], is_equal_bool[1])
-            if np.all(is_equal_bool):
-                break
-            else:
-                dy_idx_pair = dy_idx_pair[:, is_equal_bool == False]
-
-        dz_pair_list = []
-        while True:
-            dz_pair_list.append(dz_idx_pair[:, 0])
-            is_equal_bool = np.equal(dz_idx_pair[:, 0].reshape((2, 1)), dz_idx_pair)
-            is_equal_bool = np.logical_and(is_equal_bool[0], is_equal_bool[1])
-            if np.all(is_equal_bool):
-                break
-            else:
-                dz_idx_pair = dz_idx_pair[:, is_equal_bool == False]
-
-        pair_list = []
-        pair_list.extend(dx_pair_list)
-        pair_list.extend(dy_pair_list)
-        pair_list.extend(dz_pair_list)
-        pair_vec = np.array(pair_list).transpose()
-        bool_no_self_reference = pair_vec[0, :] != pair_vec[1, :]
-        pair_vec = pair_vec[:, bool_no_self_reference]
-        pair_list_no_duplicates = []
-        while True:
-            pair_1 = pair_vec[:, 0]
-            pair_2 = np.array([pair_vec[1, 0], pair_vec[0, 0]])
-            pair_list_no_duplicates.append(pair_1)
-            is_equal_bool_1 = np.equal(pair_1.reshape((2, 1)), pair_vec)
-            is_equal_bool_1 = np.logical_and(is_equal_bool_1[0], is_equal_bool_1[1])
-            is_equal_bool_2 = np.equal(pair_2.reshape((2, 1)), pair_vec)
-            is_equal_bool_2 = np.logical_and(is_equal_bool_2[0], is_equal_bool_2[1])
-            is_equal_bool = np.logical_or(is_equal_bool_1, is_equal_bool_2)
-            if np.all(is_equal_bool):
-                break
-            else:
-                pair_vec = pair_vec[:, is_equal_bool == False]
+        if self.per_storey:
+            return self.get_storey_adjacent_spaces_dict()
+        # The boundaries are found chunk by chunk, only the boundary voxels are gathered from the label grid
+        pair_1_list = []
+        pair_2_list = []
+        for axis in range(3):
+            idx_space_1 = self.space_idx_grid.get_boundaries(axis)
+            idx_space_2 = list(idx_space_1)
+            idx_space_2[axis] = idx_space_1[axis] + 1
+            idx_pair_1 = self.space_idx_grid.get_labels(*idx_space_1).astype(np.int64)
+            idx_pair_2 = self.space_idx_grid.get_labels(*idx_space_2).astype(np.int64)
+
+            # For each point in the generated mesh, it is checked which space the adjacent point is encapsulated by.
+            # If the adjacent point does not belong to a space, the subsequent point is checked.
+            # This is done up until "n_search_blocks" away from the original point.
+            n_search_blocks = 2
+            for i in range(n_search_blocks):
+                idx_temp = list(idx_space_2)
+                axis_temp = idx_space_2[axis] + i + 1
+                axis_temp[axis_temp >= self.grid_shape[axis]] = idx_space_2[axis][axis_temp >= self.grid_shape[axis]]
+                idx_temp[axis] = axis_temp
+                temp = self.space_idx_grid.get_labels(*idx_temp)  # If +1 point is not a room then check +2 point
+                bool_d = np.logical_or(idx_pair_2 == self.neutral_idx, idx_pair_2 == self.ambient_idx)
+                idx_pair_2[bool_d] = temp[bool_d]
+
+            pair_1_list.append(idx_pair_1)
+            pair_2_list.append(idx_pair_2)
+
+        # All boundary pairs in the order X, Y, Z (each in the order of np.where), without self references
+        pair_1 = np.concatenate(pair_1_list)
+        pair_2 = np.concatenate(pair_2_list)
+        bool_no_self_reference = pair_1 != pair_2
+        pair_1 = pair_1[bool_no_self_reference]
+        pair_2 = pair_2[bool_no_self_reference]
+
+        # Pack every unordered pair into one integer and keep its first occurrence (with the orientation it has there),
+        # so (a, b) and (b, a) count once and the pairs stay in the order they are found along the axes
+        min_idx = min(self.ambient_idx, self.neutral_idx)
+        label_count = len(self.space_name_list) - min_idx
+        packed_pairs = ((np.minimum(pair_1, pair_2) - min_idx) * label_count
+                        + (np.maximum(pair_1, pair_2) - min_idx))
+        _, first_occurrence = np.unique(packed_pairs, return_index=True)
+        first_occurrence = np.sort(first_occurrence)
+        pair_1 = pair_1[first_occurrence]
+        pair_2 = pair_2[first_occurrence]
+
+        # Group the pairs by space in one step: first the partners of the pairs where the space comes first, then
+        # those where it comes second, each in pair order. Neutral and ambient partners are not adjacent spaces.
+        pair_order = np.arange(len(pair_1))
+        owner_vec = np.concatenate((pair_1, pair_2))
+        partner_vec = np.concatenate((pair_2, pair_1))
+        role_vec = np.repeat([0, 1], len(pair_1))
+        order_vec = np.concatenate((pair_order, pair_order))
+        bool_adjacent = (owner_vec >= 0) & (partner_vec >= 0)
+        owner_vec, partner_vec = owner_vec[bool_adjacent], partner_vec[bool_adjacent]
+        sort_idx = np.lexsort((order_vec[bool_adjacent], role_vec[bool_adjacent], owner_vec))
+        owner_vec, partner_vec = owner_vec[sort_idx], partner_vec[sort_idx]
+        group_bounds = np.searchsorted(owner_vec, np.arange(len(self.space_name_list) + 1))
 
         adjacent_spaces_dict = {}
-        pair_vec_no_duplicates = np.array(pair_list_no_duplicates).transpose()
         for space_counter, space_name in enumerate(self.space_name_list):
-            bool_1 = space_counter == pair_vec_no_duplicates[0, :]
-            bool_2 = space_counter == pair_vec_no_duplicates[1, :]
-            idx_vec_1 = pair_vec_no_duplicates[1, bool_1]
-            idx_vec_2 = pair_vec_no_duplicates[0, bool_2]
-            adjacent_space_list = []
-            for el in idx_vec_1:
-                if el != -50 and el != -100:
-                    adjacent_space_list.append(self.space_name_list[el])
-            for el in idx_vec_2:
-                if el != -50 and el != -100:
-                    adjacent_space_list.append(self.space_name_list[el])
-            adjacent_spaces_dict[space_name] = adjacent_space_list
+            adjacent_spaces_dict[space_name] = [self.space_name_list[el] for el in
+                                                partner_vec[group_bounds[space_counter]:group_bounds[space_counter + 1]]]
 
         ####### IF duplicate space names occur in the IFC and these spaces are adjacent then the resulting adjacent_space_dict will have elements that reference themselves #########
 
@@ -346,6 +595,13 @@ class IfcGeometry:
     def get_space_storey_dict(self):
         return self.space_storey_dict
 
+    def get_space_idx_array(self):
+        # Dense label grid of the whole building, for the visualizations
+        if self.space_idx_grid is None:
+            raise ValueError("per_storey voxelizes the storeys one by one and keeps no grid of the whole building, "
+                             "create the IfcGeometry without per_storey to visualize the voxel grid.")
+        return self.space_idx_grid.to_dense()
+
     def visualize_plotly(self):
         # Create a list to hold the Plotly Mesh3d traces
         mesh_traces = []
@@ -407,6 +663,14 @@ class IfcGeometry:
         # Show the figure
         fig.show()
 
+def get_sub_geometry_adjacency(sub_geometry):
+    # Module level, so it can run in a worker process; the grid is dropped before the next sub geometry is voxelized
+    sub_geometry.voxelize_spaces()
+    adjacent_spaces_dict = sub_geometry.get_adjacent_spaces_dict()
+    sub_geometry.space_idx_grid = None
+    return adjacent_spaces_dict
+
+
 def filter_by_storey(dict1, dict2):
     dict3 = {}
     for key, adjacents in dict1.items():
@@ -417,16 +681,12 @@ def filter_by_storey(dict1, dict2):
     return dict3
 
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-
-
 def visualize_voxel_grid(ifc_geometry):
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
 
     # Plot voxels
-    voxels = ifc_geometry._3D_space_idx_array != ifc_geometry.ambient_idx
+    voxels = ifc_geometry.get_space_idx_array() != ifc_geometry.ambient_idx
 
     ax.voxels(voxels, facecolors='cyan', edgecolor='k')
 
@@ -437,14 +697,9 @@ def visualize_voxel_grid(ifc_geometry):
     plt.show()
 
 
-import os
-import numpy as np
-import plotly.graph_objects as go
-
-
 def visualize_voxel_grid_plotly(ifc_geometry):
     # Extract the voxel indices where space exists (not ambient)
-    voxels = ifc_geometry._3D_space_idx_array != ifc_geometry.ambient_idx
+    voxels = ifc_geometry.get_space_idx_array() != ifc_geometry.ambient_idx
     x, y, z = np.where(voxels)
 
     # Create a 3D plot using multiple cube traces
@@ -537,21 +792,22 @@ def visualize_v_grid(ifc_geometry, save_dir=None, storey_filter=None):
     colors = plt.cm.Set3(np.linspace(0, 1, len(space_indices)))
 
     # Create a color array the same shape as the voxel grid
-    color_array = np.zeros((*ifc_geometry._3D_space_idx_array.shape, 4))
+    space_idx_array = ifc_geometry.get_space_idx_array()
+    color_array = np.zeros((*space_idx_array.shape, 4))
 
     # Assign colors to spaces
     for idx, space_idx in enumerate(space_indices):
-        mask = (ifc_geometry._3D_space_idx_array == space_idx)
+        mask = (space_idx_array == space_idx)
         color_array[mask] = colors[idx]
 
     # Handle neutral spaces (if any)
-    neutral_mask = (ifc_geometry._3D_space_idx_array == ifc_geometry.neutral_idx)
+    neutral_mask = (space_idx_array == ifc_geometry.neutral_idx)
     if np.any(neutral_mask):
         color_array[neutral_mask] = [0.8, 0.8, 0.8, 1.0]  # Gray color for neutral spaces
 
     # Create boolean array for where voxels should be plotted
-    voxels = (ifc_geometry._3D_space_idx_array != ifc_geometry.ambient_idx) & (
-        np.isin(ifc_geometry._3D_space_idx_array, space_indices)
+    voxels = (space_idx_array != ifc_geometry.ambient_idx) & (
+        np.isin(space_idx_array, space_indices)
     )
 
     # Plot colored voxels
@@ -622,9 +878,8 @@ if __name__ == "__main__":
 
     ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\Residential House.ifc'
     ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\NBU_MedicalClinic_Arch_Door_Modified.ifc'
-    project_name = "test"
     model_name, _ = os.path.splitext(os.path.basename(ifc_file_path))
-    ifc_geometry = IfcGeometry(ifc_file_path, project_name, force_init=False)
+    ifc_geometry = IfcGeometry(ifc_file_path, model_name, force_init=False)
     adjacent_spaces_dict = ifc_geometry.get_adjacent_spaces_dict()
     space_idx_dict = ifc_geometry.space_idx_dict
     print(space_idx_dict)
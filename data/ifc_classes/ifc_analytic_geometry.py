@@ -0,0 +1,146 @@
+import numpy as np
+import ifcopenshell.util.placement
+from .ifc_geometry_service import ElementGeometry
+
+# Profiles whose bounding box is spanned by their corner points (rounded or curved profiles are tessellated)
+RECTANGLE_PROFILE_TYPES = ("IfcRectangleProfileDef", "IfcRectangleHollowProfileDef")
+ARBITRARY_PROFILE_TYPES = ("IfcArbitraryClosedProfileDef", "IfcArbitraryProfileDefWithVoids")
+# Tolerance (in metres) for an opening reaching a face of the bounding box of its element
+OPENING_TOLERANCE = 1e-9
+
+
+def get_body_items(element):
+    """Returns the items of the 'Body' representation of an element, or None if it has none."""
+    if element.Representation is None:
+        return None
+    for representation in element.Representation.Representations:
+        if representation.RepresentationIdentifier == "Body":
+            return representation.Items
+    return None
+
+
+def get_profile_points(profile):
+    """Returns the corner points (K,2) of a rectangle or polyline profile in the profile plane, or None."""
+    profile_type = profile.is_a()
+    if profile_type in RECTANGLE_PROFILE_TYPES:
+        half_x, half_y = profile.XDim / 2, profile.YDim / 2
+        points = np.array([[-half_x, -half_y], [half_x, -half_y], [half_x, half_y], [-half_x, half_y]])
+    elif profile_type in ARBITRARY_PROFILE_TYPES:
+        curve = profile.OuterCurve
+        if curve.is_a("IfcPolyline"):
+            points = np.array([point.Coordinates for point in curve.Points], dtype=np.float64)
+        elif curve.is_a("IfcIndexedPolyCurve") and not any(segment.is_a("IfcArcIndex")
+                                                           for segment in curve.Segments or ()):
+            points = np.array(curve.Points.CoordList, dtype=np.float64)
+        else:
+            return None
+        if points.ndim != 2 or points.shape[1] != 2:
+            return None
+    else:
+        return None
+
+    position = getattr(profile, "Position", None)
+    if position is not None:
+        matrix = ifcopenshell.util.placement.get_axis2placement(position)
+        points = points @ matrix[:2, :2].T + matrix[:2, 3]
+    return points
+
+
+class Extrusion:
+    """Profile points (K,2), extrusion vector (3,) and 4x4 position of an IfcExtrudedAreaSolid, in SI units."""
+    def __init__(self, solid, unit_scale):
+        self.profile_points = None
+        points = get_profile_points(solid.SweptArea)
+        if points is None:
+            return
+        direction = np.array(solid.ExtrudedDirection.DirectionRatios, dtype=np.float64)
+        self.profile_points = points * unit_scale
+        self.vector = direction / np.linalg.norm(direction) * solid.Depth * unit_scale
+        self.position = np.eye(4)
+        if solid.Position is not None:
+            self.position = ifcopenshell.util.placement.get_axis2placement(solid.Position).copy()
+            self.position[:3, 3] *= unit_scale
+
+    def get_local_vertices(self):
+        """Returns the corners of the extruded prism in the coordinates of its position."""
+        base = np.hstack((self.profile_points, np.zeros((len(self.profile_points), 1))))
+        return np.vstack((base, base + self.vector))
+
+    def get_vertices(self):
+        vertices = self.get_local_vertices()
+        return vertices @ self.position[:3, :3].T + self.position[:3, 3]
+
+
+def get_item_vertices(item, unit_scale):
+    """
+    Returns points (N,3) spanning the bounding box of a representation item, or None for items that have to be
+    tessellated (booleans, curved profiles, mapped items, ...).
+    """
+    if item.is_a("IfcExtrudedAreaSolid"):
+        extrusion = Extrusion(item, unit_scale)
+        if extrusion.profile_points is None:
+            return None
+        return extrusion.get_vertices()
+    if item.is_a("IfcFacetedBrep"):
+        # The tessellation of a faceted BRep has exactly the points of its polygon loops as vertices
+        points = [point.Coordinates for face in item.Outer.CfsFaces for bound in face.Bounds
+                  for point in bound.Bound.Polygon]
+        return np.array(points, dtype=np.float64) * unit_scale
+    return None
+
+
+def covers_bbox_face(bbox_min, bbox_max, opening_vertices):
+    """
+    True if an opening may cut away a complete face of the bounding box (bbox_min, bbox_max), i.e. it reaches the face
+    and spans the box along both other axes. The bounding box of the voided element is then no longer exact.
+    """
+    opening_min = opening_vertices.min(axis=0)
+    opening_max = opening_vertices.max(axis=0)
+    reaches_min = opening_min <= bbox_min + OPENING_TOLERANCE
+    reaches_max = opening_max >= bbox_max - OPENING_TOLERANCE
+    spans = reaches_min & reaches_max
+    for axis in range(3):
+        other_axes = [other for other in range(3) if other != axis]
+        if spans[other_axes].all() and (reaches_min[axis] or reaches_max[axis]):
+            return True
+    return False
+
+
+class AnalyticGeometry(ElementGeometry):
+    """
+    ElementGeometry computed from the representation parameters of an element instead of its tessellation.
+
+    The vertices are the corners of the extruded profiles and the points of faceted BReps, so their bounding box
+    is the one of the tessellated body.
+    """
+    __slots__ = ()
+
+
+def get_analytic_geometry(element, unit_scale, openings=()):
+    """
+    Returns the AnalyticGeometry of an element whose body consists of extrusions of rectangle/polyline profiles and
+    faceted BReps, or None if the element has to be tessellated. An element with openings is only handled if all
+    openings are extrusions that leave every face of its bounding box in place.
+    """
+    items = get_body_items(element)
+    if not items:
+        return None
+    item_vertices = [get_item_vertices(item, unit_scale) for item in items]
+    if any(vertices is None for vertices in item_vertices):
+        return None
+
+    matrix = ifcopenshell.util.placement.get_local_placement(element.ObjectPlacement).copy()
+    matrix[:3, 3] *= unit_scale
+    geometry = AnalyticGeometry(np.vstack(item_vertices), matrix)
+
+    if openings:
+        bbox_min, bbox_max = geometry.get_bbox()
+        to_element = np.linalg.inv(matrix)
+        for opening in openings:
+            opening_geometry = get_analytic_geometry(opening, unit_scale)
+            if opening_geometry is None:
+                return None
+            opening_vertices = opening_geometry.transform_vertices(to_element @ opening_geometry.matrix)
+            if covers_bbox_face(bbox_min, bbox_max, opening_vertices):
+                return None
+    return geometry
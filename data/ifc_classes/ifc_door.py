@@ -4,5 +4,5 @@ from .ifc_element import IfcElement
 import numpy as np
 
 class IfcDoor(IfcElement):
-    def __init__(self, element):
-        super().__init__(element)
+    def __init__(self, element, project=None):
+        super().__init__(element, project)
@@ -2,38 +2,55 @@ import ifcopenshell.util.shape
 import ifcopenshell.util.placement
 import ifcopenshell.util.element
 import ifcopenshell.geom
+import ifcopenshell.util.unit
 # from ifc_project import IfcProject
 from .ifc_project import IfcProject
+from .ifc_geometry_service import get_geometry_settings, ShapeGeometry
+from .ifc_analytic_geometry import get_analytic_geometry
+from .ifc_oriented_box import get_oriented_boxes
 import numpy as np
 class IfcElement:
-    def __init__(self, ifc_element):
+    def __init__(self, ifc_element, project=None):
         self.ifc_element = ifc_element
+        self.project = project  # Model session; if given, relationship queries use its relationship index
         self.id = ifc_element.id()
         self.Name = ifc_element.Name
         self.GlobalId = ifc_element.GlobalId
 
     @staticmethod
-    def get_global_vertices(element):
-        # Get the local placement of the element
-        local_placement = ifcopenshell.util.placement.get_local_placement(element.ObjectPlacement)
+    def create_geometry(element, project=None, world_coords=False):
+        # With a model session the shape comes from its geometry service, which tessellates whole element types at once
+        if project is not None:
+            return project.geometry.get_geometry(element, world_coords)
+        return ShapeGeometry(ifcopenshell.geom.create_shape(get_geometry_settings(world_coords), element))
 
-        # Get the vertices of the element
-        settings = ifcopenshell.geom.settings()
-        shape = ifcopenshell.geom.create_shape(settings, element)
-        geometry = shape.geometry
-        vertices = ifcopenshell.util.shape.get_vertices(geometry)
+    def get_geometry(self, world_coords=False):
+        """Returns the tessellated shape of the element as a MeshGeometry (vertex and face arrays, placement)."""
+        return self.create_geometry(self.ifc_element, self.project, world_coords)
 
-        # Transform the vertices to the global coordinate system
-        global_vertices = []
-        for vertex in vertices:
-            local_vertex = np.append(vertex, 1)  # Make it a homogenous coordinate for transformation
-            global_vertex = local_placement @ local_vertex  # Apply the transformation
-            global_vertices.append(global_vertex[:3])  # Extract the x, y, z coordinates
+    @staticmethod
+    def create_bbox_geometry(element, project=None):
+        # Extrusions and faceted BReps are bounded from their parameters, booleans etc. fall back to the tessellation
+        if project is not None:
+            return project.geometry.get_bbox_geometry(element, project.relationships.get_openings(element))
+        openings = [rel.RelatedOpeningElement for rel in getattr(element, "HasOpenings", ())]
+        geometry = get_analytic_geometry(element, ifcopenshell.util.unit.calculate_unit_scale(element.file), openings)
+        return geometry if geometry is not None else IfcElement.create_geometry(element)
+
+    def get_bbox_geometry(self):
+        """Returns an ElementGeometry with the bounding box of the element, without tessellating it if possible."""
+        return self.create_bbox_geometry(self.ifc_element, self.project)
 
-        return np.array(global_vertices)
+    @staticmethod
+    def get_global_vertices(element, project=None):
+        # Get the local placement of the element
+        local_placement = ifcopenshell.util.placement.get_local_placement(element.ObjectPlacement)
+
+        # Transform all vertices of the element to the global coordinate system at once
+        return IfcElement.create_bbox_geometry(element, project).transform_vertices(local_placement)
 
     def get_bounding_box_data(self):
-        global_vertices = self.get_global_vertices(self.ifc_element)
+        global_vertices = self.get_global_vertices(self.ifc_element, self.project)
         min_coords = np.min(global_vertices, axis=0)
         max_coords = np.max(global_vertices, axis=0)
 
@@ -48,24 +65,64 @@ class IfcElement:
             'MaxZ': max_coords[2]
         }
 
+    @staticmethod
+    def get_centerline_data(elements):
+        """
+        Returns Length, Width and the base centerline (Start/Mid/End points) of the oriented bounding box of each
+        element, for all elements in one vectorized pass (see ifc_oriented_box.get_oriented_boxes).
+        """
+        if not elements:
+            return []
+        centers, axes, half_extents = get_oriented_boxes([element.get_bbox_geometry() for element in elements])
+        # Center of the bottom face, the centerline runs along the length axis
+        base_centers = centers - axes[:, :, 2] * half_extents[:, 2:3]
+        start_points = base_centers - axes[:, :, 0] * half_extents[:, 0:1]
+        end_points = base_centers + axes[:, :, 0] * half_extents[:, 0:1]
+        return [{
+            'Length': 2 * half_extent[0],
+            'Width': 2 * half_extent[1],
+            'Start_Point': start_point.tolist(),
+            'Mid_Point': mid_point.tolist(),
+            'End_Point': end_point.tolist()
+        } for half_extent, start_point, mid_point, end_point in zip(half_extents, start_points, base_centers,
+                                                                    end_points)]
+
 
     def get_local_placement(self):
         return ifcopenshell.util.placement.get_local_placement(self.ifc_element.ObjectPlacement)
 
+    def get_container(self, element=None):
+        element = element if element is not None else self.ifc_element
+        if self.project is not None:
+            return self.project.relationships.get_container(element)
+        return ifcopenshell.util.element.get_container(element)
+
     def get_storey_elevation(self):         #does not work for ifcspace
-        container = ifcopenshell.util.element.get_container(self.ifc_element)
+        container = self.get_container()
         while container:
             if container.is_a('IfcBuildingStorey'):
                 return container.Elevation
-            container = ifcopenshell.util.element.get_container(container)
+            container = self.get_container(container)
         return None
 
     def get_container_name(self):
-        container = ifcopenshell.util.element.get_container(self.ifc_element)
+        container = self.get_container()
         return container.Name if container else 'Unknown'
 
     # New function to get the name and elevation of the building storey
     def get_storey_name_and_elevation(self):
+        if self.project is not None:
+            container = self.project.relationships.get_storey(self.ifc_element)
+            if container is not None:
+                return {
+                    'Storey Name': container.Name,
+                    'Storey Elevation': container.Elevation
+                }
+            return {
+                'Storey Name': 'Unknown',
+                'Storey Elevation': None
+            }
+
         # Step 1: Retrieve all `IfcRelAggregates` relationships where this `IfcSpace` is the `RelatedObjects`
         for rel in self.ifc_element.Rel:
             if rel.is_a('IfcRelAggregates'):
@@ -77,10 +134,9 @@ class IfcElement:
                         'Storey Elevation': container.Elevation
                     }
 
-        print("No IfcBuildingStorey found.")  # Debugging: when no storey is found
         return {
-            'StoreyName': 'Unknown',
-            'StoreyElevation': None
+            'Storey Name': 'Unknown',
+            'Storey Elevation': None
         }
 
 
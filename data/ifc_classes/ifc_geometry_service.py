@@ -0,0 +1,246 @@
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+import ifcopenshell.geom
+import ifcopenshell.util.unit
+
+# Default memory budget of the shape cache of a model session
+DEFAULT_SHAPE_CACHE_BYTES = 1 << 30
+# Python object overhead per cached shape (shape, geometry and transformation wrappers), added to the array sizes
+SHAPE_OVERHEAD_BYTES = 1024
+
+
+def get_geometry_settings(world_coords=False):
+    settings = ifcopenshell.geom.settings()
+    if world_coords:
+        settings.set(settings.USE_WORLD_COORDS, True)
+    return settings
+
+
+class ElementGeometry:
+    """
+    Vertices (N,3) of an element in its local coordinates and the 4x4 placement matrix of the element, both in SI
+    units. The vertices span the same bounding box as the body of the element.
+    """
+    __slots__ = ("vertices", "matrix")
+
+    def __init__(self, vertices, matrix):
+        self.vertices = vertices
+        self.matrix = matrix
+
+    @property
+    def nbytes(self):
+        return self.vertices.nbytes + self.matrix.nbytes
+
+    def get_bbox(self):
+        """Returns the (min, max) corners of the vertices, as arrays of shape (3,)."""
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def transform_vertices(self, matrix):
+        """Applies a 4x4 transformation to all vertices at once: homogeneous (N,4) @ (4,4)^T."""
+        homogeneous_vertices = np.hstack((self.vertices, np.ones((len(self.vertices), 1))))
+        return (homogeneous_vertices @ matrix.T)[:, :3]
+
+    def get_edge_vectors(self):
+        """Returns the vectors (K,3) between consecutive vertices, e.g. along the corners of an extruded profile."""
+        return np.diff(self.vertices, axis=0)
+
+
+class MeshGeometry(ElementGeometry):
+    """
+    Tessellated shape as arrays: vertices (N,3) float64, faces (M,3) int32 and edges (K,2) int32 indexing the
+    vertices, and the 4x4 placement matrix. The vertices are in local coordinates, or in world coordinates if the
+    shape was produced with USE_WORLD_COORDS.
+    """
+    __slots__ = ("faces", "edges")
+
+    def __init__(self, vertices, faces, edges, matrix):
+        super().__init__(vertices, matrix)
+        self.faces = faces
+        self.edges = edges
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.faces.nbytes + self.edges.nbytes
+
+    def get_edge_vectors(self):
+        return self.vertices[self.edges[:, 1]] - self.vertices[self.edges[:, 0]]
+
+    def get_arrays(self):
+        return {"vertices": self.vertices, "faces": self.faces, "edges": self.edges, "matrix": self.matrix}
+
+
+class ShapeGeometry(MeshGeometry):
+    """
+    Array view of a tessellated shape.
+
+    The arrays are views of the geometry buffers of the shape, read once from ifcopenshell and not copied again.
+    matrix is the 4x4 placement of the shape.
+    """
+    __slots__ = ("shape",)
+
+    def __init__(self, shape):
+        geometry = shape.geometry
+        super().__init__(np.frombuffer(geometry.verts_buffer, dtype=np.float64).reshape(-1, 3),
+                         np.frombuffer(geometry.faces_buffer, dtype=np.int32).reshape(-1, 3),
+                         np.frombuffer(geometry.edges_buffer, dtype=np.int32).reshape(-1, 2),
+                         np.frombuffer(shape.transformation_buffer, dtype=np.float64).reshape((4, 4), order="F"))
+        self.shape = shape
+
+
+class ShapeCache:
+    """
+    Memory-bounded LRU cache of MeshGeometry objects, keyed by element id and geometry settings.
+
+    When the estimated size of the cached shapes exceeds max_bytes, the least recently used shapes are evicted.
+    hits, misses and evictions are counted, so a run can check that no shape was produced twice.
+    """
+    def __init__(self, max_bytes=DEFAULT_SHAPE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._shapes = OrderedDict()    # (element id, settings key) -> (MeshGeometry, size)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __contains__(self, key):
+        return key in self._shapes
+
+    def get(self, key):
+        entry = self._shapes.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._shapes.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, geometry):
+        if key in self._shapes:
+            self.size -= self._shapes.pop(key)[1]
+        shape_size = geometry.nbytes + SHAPE_OVERHEAD_BYTES
+        self._shapes[key] = (geometry, shape_size)
+        self.size += shape_size
+        # Always keep the newest shape, even if it alone is larger than the budget
+        while self.size > self.max_bytes and len(self._shapes) > 1:
+            _, (_, evicted_size) = self._shapes.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+
+class IfcGeometryService:
+    """
+    Tessellates the elements of a model with the multi-threaded ifcopenshell geometry iterator.
+
+    The first shape requested for an element type triggers one iterator pass over all elements of that type, the
+    resulting shapes are kept as MeshGeometry arrays in a ShapeCache and handed out to the element classes and the
+    voxel engine, so every element is tessellated once per run. Shapes are produced in local coordinates (with the
+    placement in shape.transformation, as create_shape with default settings) or in world coordinates
+    (USE_WORLD_COORDS). Elements the iterator skips, and shapes evicted from the cache, are produced again with
+    create_shape.
+
+    With a GeometryStore (data.utils.geometry_store), shapes tessellated in an earlier run are read from disk and only
+    elements that are new or whose representation changed are tessellated; their shapes are added to the store. The
+    shapes of an iterator pass are written at its end, the ones produced with create_shape by close().
+    """
+    def __init__(self, ifc_file, num_threads=None, max_cache_bytes=DEFAULT_SHAPE_CACHE_BYTES, store=None):
+        self.ifc_file = ifc_file
+        self.num_threads = num_threads or multiprocessing.cpu_count()
+        self.shape_cache = ShapeCache(max_cache_bytes)
+        self.store = store
+        self._representation_hashes = {}    # entity id -> hash, shared by all elements (see get_entity_hash)
+        self._settings = {}
+        self._tessellated_types = {False: set(), True: set()}
+        self._unit_scale = None
+        self._analytic_geometries = {}    # element id -> AnalyticGeometry, None if the element needs its shape
+
+    def get_settings(self, world_coords=False):
+        if world_coords not in self._settings:
+            self._settings[world_coords] = get_geometry_settings(world_coords)
+        return self._settings[world_coords]
+
+    def tessellate(self, ifc_types, world_coords=False):
+        """Tessellates all elements of the given types (that are not tessellated yet) in one iterator pass."""
+        pending_types = [ifc_type for ifc_type in ifc_types if ifc_type not in self._tessellated_types[world_coords]]
+        elements = {element.id(): element for ifc_type in pending_types for element in self.ifc_file.by_type(ifc_type)}
+        self._tessellated_types[world_coords].update(pending_types)
+        elements = [element for element_id, element in elements.items()
+                    if (element_id, world_coords) not in self.shape_cache]
+        if self.store is not None:
+            elements = [element for element in elements if not self._load_from_store(element, world_coords)]
+        if not elements:
+            return
+
+        iterator = ifcopenshell.geom.iterator(self.get_settings(world_coords), self.ifc_file, self.num_threads,
+                                              include=elements)
+        if iterator.initialize():
+            while True:
+                shape = iterator.get()
+                geometry = ShapeGeometry(shape)
+                self.shape_cache.put((shape.id, world_coords), geometry)
+                self._add_to_store(self.ifc_file.by_id(shape.id), geometry, world_coords)
+                if not iterator.next():
+                    break
+        if self.store is not None:
+            self.store.save()
+
+    def close(self):
+        # Writes the shapes not saved by a tessellate() pass yet (the create_shape fallback of get_geometry)
+        if self.store is not None:
+            self.store.close()
+
+    def _load_from_store(self, element, world_coords):
+        arrays = self.store.get(element.GlobalId, self._get_representation_hash(element), world_coords)
+        if arrays is None:
+            return False
+        self.shape_cache.put((element.id(), world_coords), MeshGeometry(**arrays))
+        return True
+
+    def _add_to_store(self, element, geometry, world_coords):
+        if self.store is not None:
+            self.store.put(element.GlobalId, self._get_representation_hash(element), geometry.get_arrays(),
+                           world_coords)
+
+    def _get_representation_hash(self, element):
+        # Imported here, the store lives in data.utils and is optional for the service
+        from data.utils.geometry_store import get_representation_hash
+        return get_representation_hash(element, self._representation_hashes)
+
+    def get_geometry(self, element, world_coords=False):
+        """Returns the MeshGeometry of element, tessellating all elements of its type on the first request."""
+        key = (element.id(), world_coords)
+        geometry = self.shape_cache.get(key)
+        if geometry is None and element.is_a() not in self._tessellated_types[world_coords]:
+            self.tessellate([element.is_a()], world_coords)
+            geometry = self.shape_cache.get(key)
+        if geometry is None and self.store is not None and self._load_from_store(element, world_coords):
+            geometry = self.shape_cache.get(key)
+        if geometry is None:
+            # Not handled by the iterator (e.g. no body representation) or evicted, create_shape raises the usual error
+            geometry = ShapeGeometry(ifcopenshell.geom.create_shape(self.get_settings(world_coords), element))
+            self.shape_cache.put(key, geometry)
+            self._add_to_store(element, geometry, world_coords)
+        return geometry
+
+    @property
+    def unit_scale(self):
+        if self._unit_scale is None:
+            self._unit_scale = ifcopenshell.util.unit.calculate_unit_scale(self.ifc_file)
+        return self._unit_scale
+
+    def get_bbox_geometry(self, element, openings=()):
+        """
+        Returns an ElementGeometry spanning the bounding box of element: computed from its extrusion parameters
+        (see ifc_analytic_geometry) where possible, otherwise its tessellated MeshGeometry in local coordinates.
+        """
+        key = element.id()
+        if key not in self._analytic_geometries:
+            # Imported here, ifc_analytic_geometry builds on the ElementGeometry of this module
+            from .ifc_analytic_geometry import get_analytic_geometry
+            self._analytic_geometries[key] = get_analytic_geometry(element, self.unit_scale, openings)
+        geometry = self._analytic_geometries[key]
+        # The tessellated fallback is not kept here but in the shape cache, within its memory budget
+        return geometry if geometry is not None else self.get_geometry(element)
@@ -5,78 +5,44 @@ from .ifc_element import IfcElement
 import numpy as np
 
 class IfcOpeningElement(IfcElement):
-    def __init__(self, element):
-        super().__init__(element)
+    def __init__(self, element, project=None):
+        super().__init__(element, project)
 
     def calculate_bounding_box(self):
-        settings = ifcopenshell.geom.settings()
-        shape = ifcopenshell.geom.create_shape(settings, self.ifc_element)
-        geometry = shape.geometry
-        vertices = self.get_vertices(geometry)
-        bbox = self.get_bbox(vertices)
-        return bbox
-
-    def get_vertices(self, geometry):
-        coords = geometry.verts
-        return [(coords[i], coords[i + 1], coords[i + 2]) for i in range(0, len(coords), 3)]
-
-    def get_bbox(self, vertices):
-        minx = min(v[0] for v in vertices)
-        miny = min(v[1] for v in vertices)
-        minz = min(v[2] for v in vertices)
-        maxx = max(v[0] for v in vertices)
-        maxy = max(v[1] for v in vertices)
-        maxz = max(v[2] for v in vertices)
-        return (minx, miny, minz), (maxx, maxy, maxz)
+        return self.get_bbox_geometry().get_bbox()
 
     def get_transformation_matrix(self):
-        settings = ifcopenshell.geom.settings()
-        shape = ifcopenshell.geom.create_shape(settings, self.ifc_element)
-        return ifcopenshell.util.shape.get_shape_matrix(shape)
+        return self.get_bbox_geometry().matrix
 
     def get_container_name(self):
+        if self.project is not None:
+            container = self.project.relationships.get_direct_container(self.ifc_element)
+            return container.Name if container else ''
         container = self.ifc_element.ContainedInStructure
         if container:
             return container[0].RelatingStructure.Name
         return ''
 
-    def get_bounding_box_data(self):
-        min_coords, max_coords = self.calculate_bounding_box()
-        minx, miny, minz = min_coords
-        maxx, maxy, maxz = max_coords
-        length_x = maxx - minx
-        width_y = maxy - miny
-
-        matrix = self.get_transformation_matrix()
-
-        # Extract the translation part (last column, excluding the last row)
-        translation_vector = matrix[:3, 3]
-
-        # Extract the rotation part (upper-left 3x3 submatrix)
-        rotation_matrix = matrix[:3, :3]
-
-        # The local X-axis direction
-        x_axis = rotation_matrix[:, 0]
-
-        # Calculate the second point using the computed length
-        second_point = translation_vector + length_x * x_axis
-
-        # Calculate the midpoint
-        midpoint = (translation_vector + second_point) / 2
+    def get_bounding_box_data(self, centerline_data=None):
+        # Oriented box of the element, computed here unless it comes from a batch (IfcElement.get_centerline_data)
+        if centerline_data is None:
+            centerline_data = self.get_centerline_data([self])[0]
 
         return {
             'Name': self.ifc_element.Name if hasattr(self.ifc_element, 'Name') else '',
             'GUID': self.ifc_element.GlobalId if hasattr(self.ifc_element, 'GlobalId') else '',
-            'Length': length_x,
-            'Width': width_y,
-            'Start_Point': translation_vector.tolist(),
-            'Mid_Point': midpoint.tolist(),
-            'End_Point': second_point.tolist(),
+            **centerline_data,
             'Building_Storey': self.get_container_name()
         }
 
     def get_wall_containing_door(self):
         # Get the wall that contains this door (IfcOpeningElement)
+        if self.project is not None:
+            # door -> IfcRelFillsElement -> opening -> IfcRelVoidsElement -> wall, both looked up in the index
+            relationships = self.project.relationships
+            opening = relationships.get_filled_opening(self.ifc_element) or self.ifc_element
+            wall = relationships.get_voided_element(opening)
+            return wall if wall is not None and wall.is_a("IfcWall") else None
         for rel in self.ifc_element.HasOpenings:
             if rel.RelatingBuildingElement.is_a("IfcWall"):
                 return rel.RelatingBuildingElement
@@ -93,5 +59,5 @@ class IfcOpeningElement(IfcElement):
         return {}
 
 class IfcDoor(IfcElement):
-    def __init__(self, element):
-        super().__init__(element)
\ No newline at end of file
+    def __init__(self, element, project=None):
+        super().__init__(element, project)
\ No newline at end of file
@@ -0,0 +1,100 @@
+import numpy as np
+
+# Candidate angles (in radians) that agree to this many decimals are the same orientation
+ANGLE_DECIMALS = 9
+
+
+def get_segment_starts(counts):
+    return np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+
+def get_candidate_angles(xy, edge_vectors, element_of_vertex, element_of_edge, starts, counts):
+    """
+    Returns (element index, angle) of the box orientations tried per element: the principal axis of its XY vertices
+    and the directions of its edges in the XY plane. The minimum-area rectangle around a polygon has a side on one of
+    its hull edges, so for prismatic elements (walls, openings) one of the candidates gives the exact box.
+    """
+    element_count = len(counts)
+    mean = np.add.reduceat(xy, starts) / counts[:, None]
+    centered = xy - mean[element_of_vertex]
+    cxx = np.add.reduceat(centered[:, 0] ** 2, starts)
+    cyy = np.add.reduceat(centered[:, 1] ** 2, starts)
+    cxy = np.add.reduceat(centered[:, 0] * centered[:, 1], starts)
+    principal_angles = 0.5 * np.arctan2(2 * cxy, cxx - cyy)
+
+    # Vertical edges have no direction in the XY plane
+    horizontal = np.hypot(edge_vectors[:, 0], edge_vectors[:, 1]) > 1e-9
+    edge_angles = np.arctan2(edge_vectors[horizontal, 1], edge_vectors[horizontal, 0])
+
+    elements = np.concatenate((np.arange(element_count), element_of_edge[horizontal]))
+    # A rectangle at angle a is the same as at a + 90 degrees
+    angles = np.mod(np.concatenate((principal_angles, edge_angles)), np.pi / 2)
+    _, unique = np.unique(np.column_stack((elements, np.round(angles, ANGLE_DECIMALS))), axis=0, return_index=True)
+    return elements[unique], angles[unique]
+
+
+def get_oriented_boxes(geometries):
+    """
+    Computes the oriented bounding boxes of many elements in one vectorized pass.
+
+    The boxes stand upright: per element the horizontal axes come from the minimum-area rectangle around its vertices
+    in the XY plane (over the candidate orientations of get_candidate_angles), the third axis is the world Z axis.
+    Returns centers (E,3), axes (E,3,3) with the box axes as columns (length, width, height direction) and
+    half_extents (E,3), all in world coordinates. The length axis is the longer horizontal side and points along the
+    local X axis of the element where possible.
+    """
+    vertex_sets = [geometry.transform_vertices(geometry.matrix) for geometry in geometries]
+    edge_sets = [geometry.get_edge_vectors() @ geometry.matrix[:3, :3].T for geometry in geometries]
+    counts = np.array([len(vertices) for vertices in vertex_sets])
+    edge_counts = np.array([len(edges) for edges in edge_sets])
+    element_count = len(counts)
+    starts = get_segment_starts(counts)
+
+    vertices = np.vstack(vertex_sets)
+    xy = vertices[:, :2]
+    element_of_vertex = np.repeat(np.arange(element_count), counts)
+    element_of_edge = np.repeat(np.arange(element_count), edge_counts)
+    candidate_elements, candidate_angles = get_candidate_angles(xy, np.vstack(edge_sets), element_of_vertex,
+                                                                element_of_edge, starts, counts)
+
+    # Project the vertices of every element onto the axes of each of its candidates: (candidate, vertex) pairs
+    pair_counts = counts[candidate_elements]
+    pair_starts = get_segment_starts(pair_counts)
+    candidate_of_pair = np.repeat(np.arange(len(candidate_elements)), pair_counts)
+    vertex_of_pair = (starts[candidate_elements][candidate_of_pair]
+                      + np.arange(pair_counts.sum()) - pair_starts[candidate_of_pair])
+    cos, sin = np.cos(candidate_angles), np.sin(candidate_angles)
+    pair_xy = xy[vertex_of_pair]
+    u = pair_xy[:, 0] * cos[candidate_of_pair] + pair_xy[:, 1] * sin[candidate_of_pair]
+    v = pair_xy[:, 1] * cos[candidate_of_pair] - pair_xy[:, 0] * sin[candidate_of_pair]
+    u_min, u_max = np.minimum.reduceat(u, pair_starts), np.maximum.reduceat(u, pair_starts)
+    v_min, v_max = np.minimum.reduceat(v, pair_starts), np.maximum.reduceat(v, pair_starts)
+    areas = (u_max - u_min) * (v_max - v_min)
+
+    # Smallest rectangle per element (candidates are sorted by element)
+    order = np.lexsort((areas, candidate_elements))
+    best = order[get_segment_starts(np.bincount(candidate_elements, minlength=element_count))]
+    cos, sin = cos[best], sin[best]
+    u_extent, v_extent = u_max[best] - u_min[best], v_max[best] - v_min[best]
+    u_center, v_center = (u_min[best] + u_max[best]) / 2, (v_min[best] + v_max[best]) / 2
+    z_min = np.minimum.reduceat(vertices[:, 2], starts)
+    z_max = np.maximum.reduceat(vertices[:, 2], starts)
+
+    u_axis = np.column_stack((cos, sin, np.zeros(element_count)))
+    v_axis = np.column_stack((-sin, cos, np.zeros(element_count)))
+    centers = np.column_stack((u_center * cos - v_center * sin, u_center * sin + v_center * cos, (z_min + z_max) / 2))
+
+    # The longer horizontal side is the length of the element
+    swap = v_extent > u_extent
+    length_axis = np.where(swap[:, None], v_axis, u_axis)
+    length = np.where(swap, v_extent, u_extent)
+    width = np.where(swap, u_extent, v_extent)
+    local_x_axis = np.array([geometry.matrix[:3, 0] for geometry in geometries])
+    flip = np.einsum('ij,ij->i', length_axis, local_x_axis) < 0
+    length_axis[flip] *= -1
+    z_axis = np.tile([0.0, 0.0, 1.0], (element_count, 1))
+    width_axis = np.cross(z_axis, length_axis)
+
+    axes = np.stack((length_axis, width_axis, z_axis), axis=2)
+    half_extents = np.column_stack((length, width, z_max - z_min)) / 2
+    return centers, axes, half_extents
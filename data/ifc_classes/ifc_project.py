@@ -1,31 +1,199 @@
+import os
 import ifcopenshell
 import ifcopenshell.util.placement
 import ifcopenshell.geom
 import numpy as np
+from data.utils.ifc_input import open_ifc_file, get_model_name
+from data.utils.model_cache import ModelCache, read_schema_from_header
+from data.utils.step_reader import open_filtered_model
+from data.utils.step_index import StepIndex
+from data.utils.geometry_store import GeometryStore
+from .ifc_relationship_index import IfcRelationshipIndex, INDEXED_RELATIONSHIP_TYPES
+from .ifc_geometry_service import IfcGeometryService
+
+# Entity types read by the circulation analysis, for loading only this part of large federated models
+CIRCULATION_ENTITY_TYPES = [
+    "IfcProject",
+    "IfcSite",
+    "IfcBuilding",
+    "IfcBuildingStorey",
+    "IfcSpace",
+    "IfcDoor",
+    "IfcWall",
+    "IfcStairFlight",
+    "IfcVirtualElement",
+    "IfcOpeningElement",
+]
 
 
 class IfcProject:
-    def __init__(self, file_path):
-        self.ifc_file = ifcopenshell.open(file_path)
-        self.schema = self.ifc_file.schema
-        self.by_id = self.ifc_file.by_id
-        self.walls = self._get_elements_by_type("IfcWall")
-        self.doors = self._get_elements_by_type("IfcDoor")
-        self.spaces = self._get_elements_by_type("IfcSpace")
-        self.RelVoidsElement = self._get_elements_by_type("IfcRelVoidsElement")
+    """
+    Model session for a single IFC file. The file is parsed once and the instance is handed to the
+    extraction functions, the combiner and the voxel engine instead of the file path.
+
+    If a cache_dir is given, the relationship tables built by the pipeline are stored on disk under the
+    content hash and schema of the IFC file. The file itself is only parsed when a table is missing from the cache.
+    The tessellated shapes of the geometry service are kept in a GeometryStore under the same folder.
+
+    Typed element collections and the GlobalId/id lookup tables are built on first access and memoized, so creating
+    a project costs nothing and repeated access is a dictionary lookup. The same holds for the relationship index,
+    which answers the storey, container, opening and space boundary queries of the element classes, and for the
+    geometry service, which tessellates all elements of a type in one multi-threaded pass.
+
+    With include_types (e.g. CIRCULATION_ENTITY_TYPES), the STEP file is pre-scanned and only these entity types, the
+    entities they reference and the relationships between them are parsed. Everything else (furniture, MEP, property
+    sets, ...) is never loaded.
+
+    file_path can also be an .ifczip or gzip compressed STEP file, which is streamed into a temporary file to be read.
+
+    For point queries (one space, a pair of GlobalIds) step_index gives random access to single entities through a
+    byte offset index saved next to the IFC file, without parsing the model at all. The index and the geometry store
+    keep their files mapped until close() is called, the project can be used as a context manager for this.
+    """
+    def __init__(self, file_path, cache_dir=None, include_types=None):
+        self.file_path = file_path
+        self.model_name = get_model_name(file_path)
+        self.cache = ModelCache(cache_dir) if cache_dir else None
+        self.include_types = include_types
+        self._ifc_file = None
+        self._cache_key = None
+        self._elements_by_type = {}
+        self._guid_table = None
+        self._id_table = None
+        self._relationships = None
+        self._step_index = None
+        self._geometry = None
+
+    @property
+    def ifc_file(self):
+        # Parsing the STEP file is the expensive part, so it is deferred until an entity is really needed
+        if self._ifc_file is None:
+            if self.include_types:
+                self._ifc_file = open_filtered_model(self.file_path, self.schema, self.include_types,
+                                                     INDEXED_RELATIONSHIP_TYPES)
+            else:
+                self._ifc_file = open_ifc_file(self.file_path)
+        return self._ifc_file
+
+    @property
+    def schema(self):
+        if self._ifc_file is not None:
+            return self._ifc_file.schema
+        return read_schema_from_header(self.file_path)
+
+    @property
+    def cache_key(self):
+        if self._cache_key is None:
+            self._cache_key = ModelCache.get_key(self.file_path)
+            if self.include_types:
+                # Tables built from a partial model must not be mixed up with the ones of the full model
+                self._cache_key += "_" + ModelCache.get_types_hash(self.include_types)
+        return self._cache_key
+
+    @property
+    def relationships(self):
+        if self._relationships is None:
+            self._relationships = IfcRelationshipIndex(self.ifc_file)
+        return self._relationships
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            # Tessellated shapes are kept per model name, so a revised version of the model reuses the unchanged ones
+            store = GeometryStore(os.path.join(self.cache.cache_dir, "geometry", self.model_name)) if self.cache else None
+            self._geometry = IfcGeometryService(self.ifc_file, store=store)
+        return self._geometry
+
+    @property
+    def step_index(self):
+        if self._step_index is None:
+            self._step_index = StepIndex.open(self.file_path)
+        return self._step_index
+
+    def close(self):
+        # Releases the memory-mapped files of the step index and the geometry store (writing its pending shapes), the
+        # parsed model is left to the garbage collector
+        if self._step_index is not None:
+            self._step_index.close()
+            self._step_index = None
+        if self._geometry is not None:
+            self._geometry.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def by_id(self):
+        return self.ifc_file.by_id
+
+    def get_by_guid(self, global_id):
+        if self._guid_table is None:
+            self._build_lookup_tables()
+        return self._guid_table.get(global_id)
+
+    def get_by_id(self, element_id):
+        if self._id_table is None:
+            self._build_lookup_tables()
+        element = self._id_table.get(element_id)
+        return element if element is not None else self.ifc_file.by_id(element_id)
+
+    def _build_lookup_tables(self):
+        # Only rooted entities (products, relationships, ...) carry a GlobalId and are worth indexing
+        roots = self._get_elements_by_type("IfcRoot")
+        self._guid_table = {root.GlobalId: root for root in roots}
+        self._id_table = {root.id(): root for root in roots}
+
+    @property
+    def walls(self):
+        return self._get_elements_by_type("IfcWall")
+
+    @property
+    def doors(self):
+        return self._get_elements_by_type("IfcDoor")
+
+    @property
+    def spaces(self):
+        return self._get_elements_by_type("IfcSpace")
+
+    @property
+    def storeys(self):
+        return self._get_elements_by_type("IfcBuildingStorey")
+
+    @property
+    def RelVoidsElement(self):
+        return self._get_elements_by_type("IfcRelVoidsElement")
 
+    def get_cached_table(self, table_name, build_table):
+        """
+        Returns the table stored in the model cache under table_name. On a cache miss, build_table() is called
+        and its result is written to the cache. Without a cache_dir the table is always built.
+        """
+        if self.cache is None:
+            return build_table()
+        if self.cache.has(self.cache_key, table_name):
+            return self.cache.load(self.cache_key, table_name)
+        table = build_table()
+        self.cache.save(self.cache_key, table_name, table)
+        return table
 
     def _get_elements_by_type(self, ifc_type):
-        return self.ifc_file.by_type(ifc_type)
+        elements = self._elements_by_type.get(ifc_type)
+        if elements is None:
+            elements = self.ifc_file.by_type(ifc_type)
+            self._elements_by_type[ifc_type] = elements
+        return elements
 
     def get_connects_path_elements(self):
-        return self.ifc_file.by_type("IfcRelConnectsPathElements")
+        return self._get_elements_by_type("IfcRelConnectsPathElements")
 
     def get_fills_elements(self):
-        return self.ifc_file.by_type("IfcRelFillsElement")
+        return self._get_elements_by_type("IfcRelFillsElement")
 
     def get_voids_elements(self):
-        return self.ifc_file.by_type("IfcRelVoidsElement")
+        return self._get_elements_by_type("IfcRelVoidsElement")
 
     def get_coordinates(self, local_placement):
         if local_placement and local_placement.RelativePlacement:
@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+# Objectified relationships that are read by the index
+INDEXED_RELATIONSHIP_TYPES = [
+    "IfcRelAggregates",
+    "IfcRelContainedInSpatialStructure",
+    "IfcRelVoidsElement",
+    "IfcRelFillsElement",
+    "IfcRelSpaceBoundary",
+    "IfcRelConnectsPathElements",
+]
+
+
+class IfcRelationshipIndex:
+    """
+    Inverse lookup tables for the objectified relationships of a model.
+
+    The tables are filled in a single pass over the aggregation, containment, voids, fills, space boundary and
+    path connection relationships, after which every query is a dictionary lookup by entity id.
+    """
+    def __init__(self, ifc_file):
+        self.aggregate_of = {}                      # part id -> whole (IfcRelAggregates)
+        self.parts_of = defaultdict(list)           # whole id -> parts
+        self.container_of = {}                      # element id -> spatial structure (IfcRelContainedInSpatialStructure)
+        self.contained_elements_of = defaultdict(list)
+        self.openings_of = defaultdict(list)        # building element id -> openings (IfcRelVoidsElement)
+        self.voided_element_of = {}                 # opening id -> building element
+        self.fillings_of = defaultdict(list)        # opening id -> doors/windows (IfcRelFillsElement)
+        self.filled_opening_of = {}                 # door/window id -> opening
+        self.boundaries_of = defaultdict(list)      # space id -> IfcRelSpaceBoundary (IfcRelSpaceBoundary)
+        self.bounded_spaces_of = defaultdict(list)  # building element id -> spaces
+        self.connected_elements_of = defaultdict(list)  # element id -> elements (IfcRelConnectsPathElements)
+
+        handlers = (
+            ("IfcRelAggregates", self._add_aggregates),
+            ("IfcRelContainedInSpatialStructure", self._add_containment),
+            ("IfcRelVoidsElement", self._add_voids),
+            ("IfcRelFillsElement", self._add_fills),
+            ("IfcRelSpaceBoundary", self._add_space_boundary),
+            ("IfcRelConnectsPathElements", self._add_path_connection),
+        )
+        for ifc_type, add_relationship in handlers:
+            for rel in ifc_file.by_type(ifc_type):
+                add_relationship(rel)
+
+    def _add_aggregates(self, rel):
+        whole = rel.RelatingObject
+        for part in rel.RelatedObjects:
+            self.aggregate_of[part.id()] = whole
+            self.parts_of[whole.id()].append(part)
+
+    def _add_containment(self, rel):
+        structure = rel.RelatingStructure
+        for element in rel.RelatedElements:
+            self.container_of[element.id()] = structure
+            self.contained_elements_of[structure.id()].append(element)
+
+    def _add_voids(self, rel):
+        building_element = rel.RelatingBuildingElement
+        opening = rel.RelatedOpeningElement
+        self.openings_of[building_element.id()].append(opening)
+        self.voided_element_of[opening.id()] = building_element
+
+    def _add_fills(self, rel):
+        opening = rel.RelatingOpeningElement
+        filling = rel.RelatedBuildingElement
+        self.fillings_of[opening.id()].append(filling)
+        self.filled_opening_of[filling.id()] = opening
+
+    def _add_space_boundary(self, rel):
+        space = rel.RelatingSpace
+        if space is None:
+            return
+        self.boundaries_of[space.id()].append(rel)
+        element = rel.RelatedBuildingElement
+        if element is not None:
+            self.bounded_spaces_of[element.id()].append(space)
+
+    def _add_path_connection(self, rel):
+        relating = rel.RelatingElement
+        related = rel.RelatedElement
+        self.connected_elements_of[relating.id()].append(related)
+        self.connected_elements_of[related.id()].append(relating)
+
+    def get_aggregate(self, element):
+        return self.aggregate_of.get(element.id())
+
+    def get_parts(self, element):
+        return self.parts_of.get(element.id(), [])
+
+    def get_direct_container(self, element):
+        return self.container_of.get(element.id())
+
+    def get_container(self, element):
+        """
+        Same lookup as ifcopenshell.util.element.get_container: the direct spatial container, otherwise the container
+        of the aggregate, the voided element or the filled opening the element belongs to.
+        """
+        while element is not None:
+            container = self.container_of.get(element.id())
+            if container is not None:
+                return container
+            element = self.get_parent(element)
+        return None
+
+    def get_parent(self, element):
+        element_id = element.id()
+        for table in (self.aggregate_of, self.voided_element_of, self.filled_opening_of):
+            parent = table.get(element_id)
+            if parent is not None:
+                return parent
+        return None
+
+    def get_storey(self, element):
+        """Returns the IfcBuildingStorey an element is aggregated into or contained in, or None."""
+        aggregate = self.get_aggregate(element)
+        if aggregate is not None and aggregate.is_a("IfcBuildingStorey"):
+            return aggregate
+        container = self.get_container(element)
+        while container is not None:
+            if container.is_a("IfcBuildingStorey"):
+                return container
+            container = self.get_container(container)
+        return None
+
+    def get_openings(self, building_element):
+        return self.openings_of.get(building_element.id(), [])
+
+    def get_voided_element(self, opening):
+        return self.voided_element_of.get(opening.id())
+
+    def get_fillings(self, opening):
+        return self.fillings_of.get(opening.id(), [])
+
+    def get_filled_opening(self, filling):
+        return self.filled_opening_of.get(filling.id())
+
+    def get_host_element(self, filling):
+        """Follows door/window -> opening -> voided building element (e.g. the wall that contains a door)."""
+        opening = self.get_filled_opening(filling)
+        if opening is None:
+            return None
+        return self.get_voided_element(opening)
+
+    def get_space_boundaries(self, space):
+        return self.boundaries_of.get(space.id(), [])
+
+    def get_bounded_spaces(self, building_element):
+        return self.bounded_spaces_of.get(building_element.id(), [])
+
+    def get_connected_elements(self, element):
+        return self.connected_elements_of.get(element.id(), [])
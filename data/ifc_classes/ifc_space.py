@@ -6,8 +6,8 @@ import numpy as np
 
 
 class IfcSpace(IfcElement):
-    def __init__(self, element):
-        super().__init__(element)
+    def __init__(self, element, project=None):
+        super().__init__(element, project)
         self.LongName = element.LongName if hasattr(element,
                                                     'LongName') else None  # Long name of the space, if it exists
 
@@ -32,7 +32,7 @@ class IfcSpace(IfcElement):
     def get_adjoining_walls_in_space(self):
         boundaries = []
         if hasattr(self.ifc_element, "BoundedBy"):
-            for rel_space_boundary in self.ifc_element.BoundedBy:
+            for rel_space_boundary in self.get_space_boundaries():
                 element = rel_space_boundary.RelatedBuildingElement
                 if element and element.is_a("IfcWall"):
                     wall_info = self.get_ifc_rel_space_boundary_info(rel_space_boundary)
@@ -46,7 +46,7 @@ class IfcSpace(IfcElement):
     def get_adjoining_doors_in_space(self):
         boundaries = []
         if hasattr(self.ifc_element, "BoundedBy"):
-            for rel_space_boundary in self.ifc_element.BoundedBy:
+            for rel_space_boundary in self.get_space_boundaries():
                 element = rel_space_boundary.RelatedBuildingElement
                 if element and element.is_a("IfcDoor"):
                     door_info = self.get_ifc_rel_space_boundary_info(rel_space_boundary)
@@ -60,7 +60,7 @@ class IfcSpace(IfcElement):
     def get_adjoining_ve_in_space(self):        #ve = IfcVirtualElement
         boundaries = []
         if hasattr(self.ifc_element, "BoundedBy"):
-            for rel_space_boundary in self.ifc_element.BoundedBy:
+            for rel_space_boundary in self.get_space_boundaries():
                 element = rel_space_boundary.RelatedBuildingElement
                 if element and element.is_a("IfcVirtualElement"):
                     ve_info = self.get_ifc_rel_space_boundary_info(rel_space_boundary)
@@ -74,7 +74,7 @@ class IfcSpace(IfcElement):
     def get_adjoining_openings_in_space(self):
         boundaries = []
         if hasattr(self.ifc_element, "BoundedBy"):
-            for rel_space_boundary in self.ifc_element.BoundedBy:
+            for rel_space_boundary in self.get_space_boundaries():
                 element = rel_space_boundary.RelatedBuildingElement
                 if element and element.is_a("IfcOpeningElement"):
                     opening_info = self.get_ifc_rel_space_boundary_info(rel_space_boundary)
@@ -85,6 +85,11 @@ class IfcSpace(IfcElement):
             boundaries.append("No IfcRelSpaceBoundary relationships.")
         return boundaries
 
+    def get_space_boundaries(self):
+        if self.project is not None:
+            return self.project.relationships.get_space_boundaries(self.ifc_element)
+        return self.ifc_element.BoundedBy
+
     @staticmethod
     def get_ifc_rel_space_boundary_info(rel_space_boundary):
         info = {
@@ -97,6 +102,19 @@ class IfcSpace(IfcElement):
         """
         Retrieves the name and elevation of the IfcBuildingStorey associated with the given IfcSpace.
         """
+        if self.project is not None:
+            # The relationship index already maps every aggregated part to its whole
+            container = self.project.relationships.get_aggregate(self.ifc_element)
+            if container is not None and container.is_a('IfcBuildingStorey'):
+                return {
+                    'Storey Name': container.Name,
+                    'Storey Elevation': container.Elevation
+                }
+            return {
+                'Storey Name': 'Unknown',
+                'Storey Elevation': None
+            }
+
         # Step 1: Retrieve all `IfcRelAggregates` relationships where this `IfcSpace` is the `RelatedObjects`
         for rel in self.ifc_element.Decomposes:
             if rel.is_a('IfcRelAggregates'):
@@ -108,10 +126,9 @@ class IfcSpace(IfcElement):
                         'Storey Elevation': container.Elevation
                     }
 
-        print("No IfcBuildingStorey found.")  # Debugging: when no storey is found
         return {
-            'StoreyName': 'Unknown',
-            'StoreyElevation': None
+            'Storey Name': 'Unknown',
+            'Storey Elevation': None
         }
 
     def to_dict(self):
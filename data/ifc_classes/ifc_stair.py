@@ -7,8 +7,8 @@ from .ifc_project import IfcProject
 import numpy as np
 
 class IfcStair(IfcElement):
-    def __init__(self, element):
-        super().__init__(element)
+    def __init__(self, element, project=None):
+        super().__init__(element, project)
 
     # def get_bounding_box_data(self):
     #     global_vertices = self.get_global_vertices(self.ifc_element)
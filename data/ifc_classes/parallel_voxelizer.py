@@ -0,0 +1,64 @@
+import multiprocessing
+import numpy as np
+import trimesh
+from .scanline_voxelizer import scanline_voxelize
+
+
+def voxelize_block(vertices, faces, x_vec, y_vec, z_vec, voxel_engine, mesh=None):
+    """
+    Returns a boolean (len(x_vec), len(y_vec), len(z_vec)) block, True for the voxel centers inside the mesh. The
+    query points are generated from the three location vectors; mesh is the trimesh of the space if already built.
+    """
+    if voxel_engine == "scanline":
+        return scanline_voxelize(vertices, faces, x_vec, y_vec, z_vec)
+    if mesh is None:
+        mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
+    locations = np.stack(np.meshgrid(x_vec, y_vec, z_vec, indexing='ij'), axis=-1)
+    return mesh.contains(locations.reshape(-1, 3)).reshape(locations.shape[:3])
+
+
+def voxelize_space(task):
+    """
+    Returns the voxels of one block of a space that lie inside its mesh, bit-packed (np.packbits) to keep the
+    transfer back to the parent process small.
+    """
+    return np.packbits(voxelize_block(*task).reshape(-1))
+
+
+def get_tasks(space_meshes, space_blocks, location_vecs, voxel_engine):
+    # One task per voxel block of a space, the query points are generated by the worker
+    x_location_vec, y_location_vec, z_location_vec = location_vecs
+    for space_counter, (mesh, blocks) in enumerate(zip(space_meshes, space_blocks)):
+        vertices, faces = np.asarray(mesh.vertices), np.asarray(mesh.faces)
+        for block in blocks:
+            yield space_counter, block, (vertices, faces, x_location_vec[block[0]], y_location_vec[block[1]],
+                                         z_location_vec[block[2]], voxel_engine)
+
+
+def parallel_voxelize(space_meshes, space_indices, space_blocks, space_chunks, location_vecs, label_grid,
+                      voxel_engine, workers):
+    """
+    Voxelizes the space meshes on a pool of `workers` processes and writes their labels into label_grid.
+
+    space_blocks holds the voxel blocks tested per space, space_chunks the chunks that lie entirely inside the space
+    (see get_adaptive_blocks). The workers test the blocks, the labels are written by this process. The results are
+    written in the order of space_meshes, so where spaces overlap the one that comes later wins (as when they are
+    voxelized one after the other), no matter in which order the workers finish.
+    """
+    tasks = list(get_tasks(space_meshes, space_blocks, location_vecs, voxel_engine))
+    written_spaces = 0
+
+    # spawn, as on Windows, so the workers do not inherit the state of the parent process
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers) as pool:
+        results = pool.imap(voxelize_space, [task for _, _, task in tasks])
+        for packed_inside, (space_counter, block, task) in zip(results, tasks):
+            # The whole chunks of a space are written before its first block
+            while written_spaces <= space_counter:
+                label_grid.set_chunks(space_chunks[written_spaces], space_indices[written_spaces])
+                written_spaces += 1
+            block_shape = (len(task[2]), len(task[3]), len(task[4]))
+            inside = np.unpackbits(packed_inside, count=int(np.prod(block_shape))).astype(bool).reshape(block_shape)
+            label_grid.set_block(block, inside, space_indices[space_counter])
+    for space_counter in range(written_spaces, len(space_meshes)):
+        label_grid.set_chunks(space_chunks[space_counter], space_indices[space_counter])
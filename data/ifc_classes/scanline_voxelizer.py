@@ -0,0 +1,67 @@
+import numpy as np
+
+# Triangles with a smaller projected area (vertical walls of a space) do not cross any vertical column
+MIN_PROJECTED_AREA = 1e-12
+
+
+def get_column_crossings(vertices, faces, x_vec, y_vec):
+    """
+    Intersects the triangles of a closed mesh with the vertical lines through the (x, y) voxel columns.
+
+    Returns (column index, z) of every crossing, with column index = x index * len(y_vec) + y index. Every triangle
+    is only tested against the columns inside its XY bounding box. Columns on a shared edge of two triangles are
+    assigned to one of them by the top-left rule, so they are counted once.
+    """
+    triangles = vertices[faces]    # (T,3,3)
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+    projected = np.abs(area) > MIN_PROJECTED_AREA
+    # Orient all projected triangles counter-clockwise
+    clockwise = area < 0
+    b, c = np.where(clockwise[:, None], c, b), np.where(clockwise[:, None], b, c)
+    a, b, c, area = a[projected], b[projected], c[projected], np.abs(area[projected])
+
+    # Columns inside the XY bounding box of each triangle: (triangle, column) pairs
+    xy_min = np.minimum(np.minimum(a, b), c)[:, :2]
+    xy_max = np.maximum(np.maximum(a, b), c)[:, :2]
+    x_start, x_stop = np.searchsorted(x_vec, xy_min[:, 0], 'left'), np.searchsorted(x_vec, xy_max[:, 0], 'right')
+    y_start, y_stop = np.searchsorted(y_vec, xy_min[:, 1], 'left'), np.searchsorted(y_vec, xy_max[:, 1], 'right')
+    x_count = np.maximum(x_stop - x_start, 0)
+    y_count = np.maximum(y_stop - y_start, 0)
+    pair_counts = x_count * y_count
+    triangle_of_pair = np.repeat(np.arange(len(a)), pair_counts)
+    pair_offset = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    x_idx = x_start[triangle_of_pair] + pair_offset // y_count[triangle_of_pair]
+    y_idx = y_start[triangle_of_pair] + pair_offset % y_count[triangle_of_pair]
+    px, py = x_vec[x_idx], y_vec[y_idx]
+
+    a, b, c, area = a[triangle_of_pair], b[triangle_of_pair], c[triangle_of_pair], area[triangle_of_pair]
+    inside = np.ones(len(px), dtype=bool)
+    weights = []
+    for start, end in ((b, c), (c, a), (a, b)):
+        # Edge function of the edge opposite to the weighted vertex, positive on its inner side
+        dx, dy = end[:, 0] - start[:, 0], end[:, 1] - start[:, 1]
+        edge = dx * (py - start[:, 1]) - dy * (px - start[:, 0])
+        top_left = (dy < 0) | ((dy == 0) & (dx < 0))
+        inside &= (edge > 0) | ((edge == 0) & top_left)
+        weights.append(edge)
+    z = (weights[0] * a[:, 2] + weights[1] * b[:, 2] + weights[2] * c[:, 2]) / area
+    return (x_idx * len(y_vec) + y_idx)[inside], z[inside]
+
+
+def scanline_voxelize(vertices, faces, x_vec, y_vec, z_vec):
+    """
+    Returns a boolean (len(x_vec), len(y_vec), len(z_vec)) block, True for the voxel centers inside a closed mesh.
+
+    Every vertical column is crossed by the mesh surface an even number of times, the voxels between the 1st and 2nd,
+    3rd and 4th, ... crossing are inside (parity of the crossings below a voxel center).
+    """
+    columns, crossing_z = get_column_crossings(vertices, faces, x_vec, y_vec)
+    inside = np.zeros((len(x_vec) * len(y_vec), len(z_vec)), dtype=bool)
+    if len(columns):
+        order = np.argsort(columns, kind='stable')
+        columns, crossing_z = columns[order], crossing_z[order]
+        column_starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+        crossings_below = np.add.reduceat(crossing_z[:, None] < z_vec[None, :], column_starts, axis=0)
+        inside[columns[column_starts]] = crossings_below % 2 == 1
+    return inside.reshape(len(x_vec), len(y_vec), len(z_vec))
@@ -0,0 +1,267 @@
+import itertools
+import numpy as np
+
+# Voxels per chunk along each axis
+CHUNK_SIZE = 32
+
+
+def get_label_dtype(min_label, max_label):
+    """Returns the narrowest signed integer dtype that holds all labels from min_label to max_label."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= min_label and max_label <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def split_block(block, max_voxels):
+    """
+    Splits a block (tuple of x, y, z slices) into sub-blocks of at most max_voxels voxels, in C order. The last axes
+    are kept whole as far as the budget allows, so the sub-blocks are slabs of full columns where possible.
+    """
+    steps = []
+    remaining = max(1, max_voxels)
+    for axis_slice in reversed(block):
+        step = max(1, min(axis_slice.stop - axis_slice.start, remaining))
+        steps.insert(0, step)
+        remaining = max(1, remaining // step)
+    for starts in itertools.product(*[range(axis_slice.start, axis_slice.stop, step)
+                                      for axis_slice, step in zip(block, steps)]):
+        yield tuple(slice(start, min(start + step, axis_slice.stop))
+                    for start, step, axis_slice in zip(starts, steps, block))
+
+
+class ChunkedLabelGrid:
+    """
+    Voxel label grid of two resolutions: chunks and voxels.
+
+    The grid is divided into cubic chunks of chunk_size voxels. A chunk whose voxels all have the same label is
+    stored as that single label in chunk_labels (a coarse voxel); only the chunks holding different labels are stored
+    voxel by voxel (fine voxels). Initially every chunk is a coarse voxel of fill_value (the ambient space around and
+    between the buildings), so the memory scales with the surface of the spaces instead of the bounding box of the
+    model. The fine chunks are kept in one pool array and chunk_table maps every chunk position to its row in the
+    pool (-1 for a coarse chunk).
+    """
+    def __init__(self, shape, fill_value, dtype, chunk_size=CHUNK_SIZE):
+        self.shape = tuple(int(size) for size in shape)
+        self.fill_value = fill_value
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.chunk_table = np.full([-(-size // chunk_size) for size in self.shape], -1, dtype=np.int32)
+        self.chunk_labels = np.full(self.chunk_table.shape, fill_value, dtype=dtype)
+        self._chunks = np.empty((0, chunk_size, chunk_size, chunk_size), dtype=dtype)
+        self._row_count = 0    # rows of the pool in use, including released ones
+        self._free_rows = []   # released rows, reused before the pool grows
+
+    @property
+    def chunk_count(self):
+        """Number of chunks stored voxel by voxel."""
+        return int(np.count_nonzero(self.chunk_table >= 0))
+
+    @property
+    def nbytes(self):
+        return (self.chunk_table.nbytes + self.chunk_labels.nbytes
+                + self.chunk_count * self.chunk_size ** 3 * np.dtype(self.dtype).itemsize)
+
+    def _allocate_chunks(self, chunk_keys):
+        """Stores the coarse chunks at chunk_keys (tuple of x, y, z index arrays) voxel by voxel, returns their rows."""
+        chunk_count = len(chunk_keys[0])
+        reused_rows = [self._free_rows.pop() for _ in range(min(chunk_count, len(self._free_rows)))]
+        new_count = chunk_count - len(reused_rows)
+        if self._row_count + new_count > len(self._chunks):
+            # Grow the pool by doubling, so allocating n chunks copies O(n) chunks in total
+            chunks = np.empty((max(self._row_count + new_count, 2 * len(self._chunks)),) + self._chunks.shape[1:],
+                              dtype=self.dtype)
+            chunks[:self._row_count] = self._chunks[:self._row_count]
+            self._chunks = chunks
+        chunk_rows = np.concatenate((np.array(reused_rows, dtype=np.int64),
+                                     np.arange(self._row_count, self._row_count + new_count)))
+        self._row_count += new_count
+        # The fine voxels start with the label of the coarse voxel they refine
+        self._chunks[chunk_rows] = self.chunk_labels[chunk_keys][:, None, None, None]
+        self.chunk_table[chunk_keys] = chunk_rows
+        return chunk_rows
+
+    def _release_chunks(self, chunk_keys, labels):
+        # Stores the chunks at chunk_keys (tuple of x, y, z index arrays) as coarse voxels of labels
+        chunk_rows = self.chunk_table[chunk_keys]
+        self._free_rows.extend(chunk_rows[chunk_rows >= 0].tolist())
+        self.chunk_table[chunk_keys] = -1
+        self.chunk_labels[chunk_keys] = labels
+
+    def set_chunks(self, chunk_keys, label):
+        """Sets all voxels of the chunks at chunk_keys ((N,3) distinct chunk positions) to label."""
+        self._release_chunks(tuple(np.asarray(chunk_keys, dtype=np.int64).reshape(-1, 3).T), label)
+
+    def compact(self):
+        """
+        Stores the fine chunks whose voxels all have the same label as coarse voxels again. (Chunks cut off by the
+        grid are compared including the voxels outside of it, which keep the label they were allocated with.)
+        """
+        chunk_keys = self.get_chunk_keys()
+        batch_size = max(1, (1 << 22) // self.chunk_size ** 3)
+        for batch_start in range(0, len(chunk_keys), batch_size):
+            batch_keys = tuple(chunk_keys[batch_start:batch_start + batch_size].T)
+            chunks = self._chunks[self.chunk_table[batch_keys]].reshape(len(batch_keys[0]), -1)
+            uniform = np.all(chunks == chunks[:, :1], axis=1)
+            self._release_chunks(tuple(idx[uniform] for idx in batch_keys), chunks[uniform, 0])
+
+    def _get_chunk_parts(self, block):
+        """
+        Yields (chunk key, local slices, block slices) of every chunk overlapping block (a tuple of x, y, z slices
+        with steps of 1): the slices of the overlap within the chunk and within the block.
+        """
+        starts = [axis_slice.start for axis_slice in block]
+        stops = [axis_slice.stop for axis_slice in block]
+        if any(start >= stop for start, stop in zip(starts, stops)):
+            return
+        chunk_ranges = [range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1)
+                        for start, stop in zip(starts, stops)]
+        for chunk_key in itertools.product(*chunk_ranges):
+            local_slices, block_slices = [], []
+            for chunk_idx, start, stop in zip(chunk_key, starts, stops):
+                chunk_start = chunk_idx * self.chunk_size
+                overlap_start, overlap_stop = max(start, chunk_start), min(stop, chunk_start + self.chunk_size)
+                local_slices.append(slice(overlap_start - chunk_start, overlap_stop - chunk_start))
+                block_slices.append(slice(overlap_start - start, overlap_stop - start))
+            yield chunk_key, tuple(local_slices), tuple(block_slices)
+
+    def get_block(self, block):
+        """Returns the labels of a block (tuple of x, y, z slices) as a dense array."""
+        block = tuple(slice(*axis_slice.indices(size)[:2]) for axis_slice, size in zip(block, self.shape))
+        labels = np.full([max(axis_slice.stop - axis_slice.start, 0) for axis_slice in block], self.fill_value,
+                         dtype=self.dtype)
+        for chunk_key, local_slices, block_slices in self._get_chunk_parts(block):
+            chunk_row = self.chunk_table[chunk_key]
+            if chunk_row >= 0:
+                labels[block_slices] = self._chunks[chunk_row][local_slices]
+            elif self.chunk_labels[chunk_key] != self.fill_value:
+                labels[block_slices] = self.chunk_labels[chunk_key]
+        return labels
+
+    def set_block(self, block, mask, label):
+        """
+        Sets the voxels of a block (tuple of x, y, z slices) where mask is True to label. The chunks the mask covers
+        entirely become coarse voxels of label, the others are stored voxel by voxel.
+        """
+        block = tuple(slice(*axis_slice.indices(size)[:2]) for axis_slice, size in zip(block, self.shape))
+        if any(axis_slice.start >= axis_slice.stop for axis_slice in block) or not mask.any():
+            return
+        block_chunks = [np.arange(axis_slice.start // self.chunk_size, (axis_slice.stop - 1) // self.chunk_size + 1)
+                        for axis_slice in block]
+        chunk_offset = [chunk_idx[0] for chunk_idx in block_chunks]
+        chunk_counts = [len(chunk_idx) for chunk_idx in block_chunks]
+        # The mask on the whole chunks overlapping the block (False outside of it), one (C,C,C) mask per chunk
+        aligned_mask = np.zeros([count * self.chunk_size for count in chunk_counts], dtype=bool)
+        aligned_mask[tuple(slice(axis_slice.start - offset * self.chunk_size, axis_slice.stop - offset * self.chunk_size)
+                           for axis_slice, offset in zip(block, chunk_offset))] = mask
+        chunk_masks = aligned_mask.reshape(chunk_counts[0], self.chunk_size, chunk_counts[1], self.chunk_size,
+                                           chunk_counts[2], self.chunk_size).transpose(0, 2, 4, 1, 3, 5)
+        mask_counts = chunk_masks.sum(axis=(3, 4, 5))
+        # Number of voxels of each chunk inside the grid
+        x_sizes, y_sizes, z_sizes = [np.minimum(self.chunk_size, size - chunk_idx * self.chunk_size)
+                                     for size, chunk_idx in zip(self.shape, block_chunks)]
+        whole = mask_counts == x_sizes[:, None, None] * y_sizes[None, :, None] * z_sizes[None, None, :]
+        self.set_chunks(np.argwhere(whole) + chunk_offset, label)
+
+        partial_idx = np.nonzero((mask_counts > 0) & ~whole)
+        chunk_keys = tuple(idx + offset for idx, offset in zip(partial_idx, chunk_offset))
+        chunk_rows = self.chunk_table[chunk_keys].astype(np.int64)
+        coarse = chunk_rows < 0
+        chunk_rows[coarse] = self._allocate_chunks(tuple(idx[coarse] for idx in chunk_keys))
+        chunks = self._chunks[chunk_rows]
+        chunks[chunk_masks[partial_idx]] = label
+        self._chunks[chunk_rows] = chunks
+
+    def get_labels(self, x_idx, y_idx, z_idx):
+        """Returns the labels at the voxel indices (arrays of equal shape or scalars)."""
+        x_idx, y_idx, z_idx = np.asarray(x_idx), np.asarray(y_idx), np.asarray(z_idx)
+        chunk_idx = (x_idx // self.chunk_size, y_idx // self.chunk_size, z_idx // self.chunk_size)
+        chunk_rows = self.chunk_table[chunk_idx]
+        allocated = chunk_rows >= 0
+        labels = np.array(self.chunk_labels[chunk_idx])
+        labels[allocated] = self._chunks[chunk_rows[allocated], x_idx[allocated] % self.chunk_size,
+                                         y_idx[allocated] % self.chunk_size, z_idx[allocated] % self.chunk_size]
+        return labels[()] if labels.ndim == 0 else labels
+
+    def get_chunk_keys(self):
+        """Returns the (x, y, z) positions of the chunks stored voxel by voxel, (N,3)."""
+        return np.argwhere(self.chunk_table >= 0)
+
+    def _get_slabs(self, chunk_keys, axis, local_idx):
+        """Returns the voxel layer local_idx along axis of the chunks at chunk_keys, (N, chunk_size, chunk_size)."""
+        chunk_rows = self.chunk_table[tuple(chunk_keys.T)]
+        slabs = np.repeat(self.chunk_labels[tuple(chunk_keys.T)][:, None, None], self.chunk_size, axis=1)
+        slabs = np.repeat(slabs, self.chunk_size, axis=2)
+        fine = chunk_rows >= 0
+        slabs[fine] = np.take(self._chunks[chunk_rows[fine]], local_idx, axis=axis + 1)
+        return slabs
+
+    def get_boundaries(self, axis):
+        """
+        Returns the (x, y, z) index arrays of the voxels whose label differs from the next voxel along axis, in the
+        order of np.where on the dense grid. Only the fine chunks are compared voxel by voxel, and the faces between
+        two chunks where one of them is fine or the coarse labels differ: within and between coarse voxels of the
+        same label there are no boundaries.
+        """
+        boundary_idx = [np.empty((0, 3), dtype=np.int64)]
+        shape = np.array(self.shape)
+        # Chunks per batch, so the copied chunks stay within a few MB
+        batch_size = max(1, (1 << 22) // self.chunk_size ** 3)
+
+        # Boundaries within the fine chunks (the voxels of chunks cut off by the grid are skipped)
+        chunk_keys = self.get_chunk_keys()
+        lower = tuple(slice(0, -1) if chunk_axis == axis + 1 else slice(None) for chunk_axis in range(4))
+        upper = tuple(slice(1, None) if chunk_axis == axis + 1 else slice(None) for chunk_axis in range(4))
+        for batch_start in range(0, len(chunk_keys), batch_size):
+            batch_keys = chunk_keys[batch_start:batch_start + batch_size]
+            chunks = self._chunks[self.chunk_table[tuple(batch_keys.T)]]
+            chunk_idx, *local_idx = np.nonzero(chunks[lower] != chunks[upper])
+            voxel_idx = np.column_stack(local_idx) + batch_keys[chunk_idx] * self.chunk_size
+            voxel_idx = voxel_idx[np.all(voxel_idx < shape, axis=1) & (voxel_idx[:, axis] + 1 < shape[axis])]
+            boundary_idx.append(voxel_idx)
+
+        # Boundaries on the faces between a chunk and the next one along the axis
+        fine = self.chunk_table >= 0
+        lower = tuple(slice(0, -1) if chunk_axis == axis else slice(None) for chunk_axis in range(3))
+        upper = tuple(slice(1, None) if chunk_axis == axis else slice(None) for chunk_axis in range(3))
+        face_keys = np.argwhere(fine[lower] | fine[upper] | (self.chunk_labels[lower] != self.chunk_labels[upper]))
+        face_axes = [chunk_axis for chunk_axis in range(3) if chunk_axis != axis]
+        for batch_start in range(0, len(face_keys), batch_size):
+            batch_keys = face_keys[batch_start:batch_start + batch_size]
+            next_keys = batch_keys.copy()
+            next_keys[:, axis] += 1
+            face_boundary = (self._get_slabs(batch_keys, axis, self.chunk_size - 1)
+                             != self._get_slabs(next_keys, axis, 0))
+            chunk_idx, *local_idx = np.nonzero(face_boundary)
+            voxel_idx = batch_keys[chunk_idx] * self.chunk_size
+            voxel_idx[:, axis] += self.chunk_size - 1
+            voxel_idx[:, face_axes] += np.column_stack(local_idx)
+            voxel_idx = voxel_idx[np.all(voxel_idx < shape, axis=1)]
+            boundary_idx.append(voxel_idx)
+
+        boundary_idx = np.vstack(boundary_idx)
+        order = np.argsort(np.ravel_multi_index(boundary_idx.T, self.shape))
+        return tuple(boundary_idx[order].T)
+
+    def to_dense(self):
+        """Returns the whole grid as a dense array (for visualization of small models)."""
+        return self.get_block(tuple(slice(0, size) for size in self.shape))
+
+    def get_arrays(self):
+        """Returns the arrays the grid is restored from by from_arrays."""
+        return {"chunk_keys": self.get_chunk_keys(),
+                "chunks": self._chunks[self.chunk_table[self.chunk_table >= 0]],
+                "chunk_labels": self.chunk_labels,
+                "shape": np.array(self.shape),
+                "fill_value": np.array(self.fill_value),
+                "chunk_size": np.array(self.chunk_size)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        grid = cls(arrays["shape"], int(arrays["fill_value"]), arrays["chunks"].dtype.type, int(arrays["chunk_size"]))
+        grid._chunks = np.array(arrays["chunks"])
+        grid._row_count = len(grid._chunks)
+        grid.chunk_labels = np.array(arrays["chunk_labels"])
+        chunk_keys = np.asarray(arrays["chunk_keys"]).reshape(-1, 3)
+        grid.chunk_table[tuple(chunk_keys.T)] = np.arange(grid._row_count)
+        return grid
@@ -1,9 +1,10 @@
 import csv
+import hashlib
 import os
 import json
 import numpy as np
 import pandas as pd
-from ifc_classes.ifc_project import IfcProject
+from ifc_classes.ifc_project import IfcProject, CIRCULATION_ENTITY_TYPES
 from ifc_classes.ifc_element import IfcElement
 from ifc_classes.ifc_wall import IfcWall
 from ifc_classes.ifc_opening import IfcOpeningElement
@@ -11,7 +12,9 @@ from ifc_classes.ifc_space import IfcSpace
 from ifc_classes.ifc_stair import IfcStair
 from ifc_classes.adj_space import IfcGeometry
 from utils.combine_dict import create_combined_dictionary
-from config import ifc_file_path, output_dir
+from utils.ifc_input import get_model_name
+from config import ifc_file_path, output_dir, cache_dir, partial_loading, voxel_distance, voxel_engine, \
+    voxel_workers, voxel_block_budget, adaptive_grid, voxel_height, per_storey, vertical_relations
 
 # Global variables to store dictionaries
 space_door_mapping = {}
@@ -23,18 +26,19 @@ space_to_space_mapping = {}
 space_info_dict = {}
 
 
-def wall_prop_to_csv(file_path, output_csv_path):
+def wall_prop_to_csv(file_path, output_csv_path, model=None):
     """
         Extracts wall properties from an IFC file and writes them to a CSV file.
 
         Args:
             ifc_file_path (str): Path to the IFC file.
             output_csv_path (str): Path to the output CSV file.
+            model (IfcProject): Already opened model session. If None, the IFC file is opened here.
     """
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
 
     # Extract model name from the file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
 
     # Construct output CSV path with model name
     output_csv_path = os.path.join(output_dir, f"{model_name}_wall_info.csv")
@@ -43,9 +47,10 @@ def wall_prop_to_csv(file_path, output_csv_path):
     walls = model.walls
     wall_data = []
 
-    for w in walls:
-        ifc_wall = IfcWall(w)
-        wall_prop = ifc_wall.get_bounding_box_data()
+    # Oriented boxes of all walls in one vectorized pass
+    ifc_walls = [IfcWall(w, model) for w in walls]
+    for ifc_wall, centerline_data in zip(ifc_walls, IfcElement.get_centerline_data(ifc_walls)):
+        wall_prop = ifc_wall.get_bounding_box_data(centerline_data)
         wall_data.append(wall_prop)
 
     # Check if wall data is not empty to avoid creating an empty DataFrame
@@ -61,12 +66,12 @@ def wall_prop_to_csv(file_path, output_csv_path):
         print("No walls found in the IFC file. Skipping CSV generation.")
 
 
-def opening_prop_to_csv(file_path, output_csv_path):
-    # Initialize the project with the IFC file path
-    project = IfcProject(file_path)
+def opening_prop_to_csv(file_path, output_csv_path, model=None):
+    # Reuse the model session if one is passed, otherwise initialize the project with the IFC file path
+    project = model if model is not None else IfcProject(file_path)
 
     # Extract model name from the file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
 
     # Construct output CSV path with model name
     output_csv_path = os.path.join(output_dir, f"{model_name}_opening_info.csv")
@@ -74,23 +79,25 @@ def opening_prop_to_csv(file_path, output_csv_path):
     # Collect data for all openings
     openings_data_list = []
 
-    for wall in project.walls:
-        wall_element = IfcWall(wall)
-        wall_data = wall_element.get_bounding_box_data()
+    # Oriented boxes of all openings in one vectorized pass
+    opening_processors = {opening.id(): IfcOpeningElement(opening, project)
+                          for wall in project.walls for opening in project.relationships.get_openings(wall)}
+    centerline_data = dict(zip(opening_processors,
+                               IfcElement.get_centerline_data(list(opening_processors.values()))))
 
+    for wall in project.walls:
         print(f"Checking wall: {wall.Name} (GlobalId: {wall.GlobalId})")
 
-        # Find related openings using IfcRelVoidsElement relationships
-        voids_elements = project._get_elements_by_type("IfcRelVoidsElement")
-        openings_in_wall = [rel.RelatedOpeningElement for rel in voids_elements if rel.RelatingBuildingElement == wall]
+        # Find related openings using IfcRelVoidsElement relationships (looked up in the relationship index)
+        openings_in_wall = project.relationships.get_openings(wall)
 
         # Check if any openings are found
         if openings_in_wall:
             print(f" - Found openings: ")
             for opening in openings_in_wall:
                 print(f"  - Opening Element: {opening.Name} {opening.GlobalId}")
-                opening_processor = IfcOpeningElement(opening)
-                opening_bounding_box_data = opening_processor.get_bounding_box_data()
+                opening_processor = opening_processors[opening.id()]
+                opening_bounding_box_data = opening_processor.get_bounding_box_data(centerline_data[opening.id()])
                 print(opening_bounding_box_data)
                 # Combine wall data and opening data
                 opening_data = {
@@ -116,21 +123,25 @@ def opening_prop_to_csv(file_path, output_csv_path):
         print("No openings found in the IFC file. Skipping CSV generation.")
 
 
-def get_space_wall_relations(file_path, output_dir):
+def get_space_wall_relations(file_path, output_dir, model=None):
     global space_wall_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_wall_relation.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    individual_instances_of_space_list = [IfcSpace(s) for s in spaces]
-
-    for s in individual_instances_of_space_list:
-        walls_in_space = s.get_adjoining_walls_in_space()
-        if walls_in_space:
-            space_wall_mapping[s.GlobalId] = [wall for wall in walls_in_space if
-                                              wall not in space_wall_mapping.get(s.Name, [])]
+
+    def build_table():
+        table = {}
+        spaces = model.spaces
+        individual_instances_of_space_list = [IfcSpace(s, model) for s in spaces]
+        for s in individual_instances_of_space_list:
+            walls_in_space = s.get_adjoining_walls_in_space()
+            if walls_in_space:
+                table[s.GlobalId] = [wall for wall in walls_in_space if wall not in table.get(s.Name, [])]
+        return table
+
+    space_wall_mapping.update(model.get_cached_table("space_wall_relation", build_table))
     # Write the space_wall_mapping dictionary to a JSON file
     with open(output_json_path, 'w') as json_file:
         json.dump(space_wall_mapping, json_file, indent=4)
@@ -138,20 +149,25 @@ def get_space_wall_relations(file_path, output_dir):
     print(f"Successfully exported space-wall relations to {output_json_path}")
 
 
-def get_space_door_relations(file_path, output_dir):
+def get_space_door_relations(file_path, output_dir, model=None):
     global space_door_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_door_relation.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    individual_instances_of_space_list = [IfcSpace(s) for s in spaces]
-    for s in individual_instances_of_space_list:
-        doors_in_space = s.get_adjoining_doors_in_space()
-        if doors_in_space:
-            space_door_mapping[s.GlobalId] = [door for door in doors_in_space if
-                                              door not in space_door_mapping.get(s.Name, [])]
+
+    def build_table():
+        table = {}
+        spaces = model.spaces
+        individual_instances_of_space_list = [IfcSpace(s, model) for s in spaces]
+        for s in individual_instances_of_space_list:
+            doors_in_space = s.get_adjoining_doors_in_space()
+            if doors_in_space:
+                table[s.GlobalId] = [door for door in doors_in_space if door not in table.get(s.Name, [])]
+        return table
+
+    space_door_mapping.update(model.get_cached_table("space_door_relation", build_table))
     # Write the space_door_mapping dictionary to a JSON file
     with open(output_json_path, 'w') as json_file:
         json.dump(space_door_mapping, json_file, indent=4)
@@ -159,20 +175,25 @@ def get_space_door_relations(file_path, output_dir):
     print(f"Successfully exported space-door relations to {output_json_path}")
 
 
-def get_space_ve_relations(file_path, output_dir):
+def get_space_ve_relations(file_path, output_dir, model=None):
     global space_ve_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_ve_relation.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    individual_instances_of_space_list = [IfcSpace(s) for s in spaces]
-    # space_ve_mapping = {}
-    for s in individual_instances_of_space_list:
-        ve_in_space = s.get_adjoining_ve_in_space()
-        if ve_in_space:
-            space_ve_mapping[s.GlobalId] = [ve for ve in ve_in_space if ve not in space_ve_mapping.get(s.Name, [])]
+
+    def build_table():
+        table = {}
+        spaces = model.spaces
+        individual_instances_of_space_list = [IfcSpace(s, model) for s in spaces]
+        for s in individual_instances_of_space_list:
+            ve_in_space = s.get_adjoining_ve_in_space()
+            if ve_in_space:
+                table[s.GlobalId] = [ve for ve in ve_in_space if ve not in table.get(s.Name, [])]
+        return table
+
+    space_ve_mapping.update(model.get_cached_table("space_ve_relation", build_table))
     # Write the space_ve_mapping dictionary to a JSON file
     with open(output_json_path, 'w') as json_file:
         json.dump(space_ve_mapping, json_file, indent=4)
@@ -180,21 +201,26 @@ def get_space_ve_relations(file_path, output_dir):
     print(f"Successfully exported space-ve relations to {output_json_path}")
 
 
-def get_space_opening_relations(file_path, output_dir):
+def get_space_opening_relations(file_path, output_dir, model=None):
     global space_opening_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_opening_relation.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    individual_instances_of_space_list = [IfcSpace(s) for s in spaces]
-    # space_opening_mapping = {}
-    for s in individual_instances_of_space_list:
-        openings_in_space = s.get_adjoining_openings_in_space()
-        if openings_in_space:
-            space_opening_mapping[s.GlobalId] = [opening for opening in openings_in_space if
-                                                 opening not in space_opening_mapping.get(s.Name, [])]
+
+    def build_table():
+        table = {}
+        spaces = model.spaces
+        individual_instances_of_space_list = [IfcSpace(s, model) for s in spaces]
+        for s in individual_instances_of_space_list:
+            openings_in_space = s.get_adjoining_openings_in_space()
+            if openings_in_space:
+                table[s.GlobalId] = [opening for opening in openings_in_space if
+                                     opening not in table.get(s.Name, [])]
+        return table
+
+    space_opening_mapping.update(model.get_cached_table("space_opening_relation", build_table))
     # Write the space_opening_mapping dictionary to a JSON file
     with open(output_json_path, 'w') as json_file:
         json.dump(space_opening_mapping, json_file, indent=4)
@@ -206,27 +232,38 @@ def bounding_boxes_overlap(bb1, bb2):
             bb1['MinY'] <= bb2['MaxY'] and bb1['MaxY'] >= bb2['MinY'] and
             bb1['MinZ'] <= bb2['MaxZ'] and bb1['MaxZ'] >= bb2['MinZ'])
 
-def get_space_to_stair_relations(file_path, output_dir):
+def get_space_to_stair_relations(file_path, output_dir, model=None):
     global space_to_stair_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_stair_relation.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    stairs = model.ifc_file.by_type("IfcStairFlight")    #"IfcStairFlight" or "IfcStair"
+    space_to_stair_mapping = model.get_cached_table("space_stair_relation",
+                                                    lambda: calculate_space_to_stair_overlaps(model))
+
+    # Write the space_to_stair_mapping dictionary to a JSON file
+    with open(output_json_path, 'w') as json_file:
+        json.dump(space_to_stair_mapping, json_file, indent=4)
+
+    print(f"Successfully exported space-stair relations to {output_json_path}")
+
+
+def calculate_space_to_stair_overlaps(model):
+    spaces = model.spaces
+    stairs = model._get_elements_by_type("IfcStairFlight")    #"IfcStairFlight" or "IfcStair"
 
     # Calculate bounding box data for all stairs and spaces
     stair_bounding_boxes = []
     for st in stairs:
-        stair_bb = IfcStair(st).get_bounding_box_data()
+        stair_bb = IfcStair(st, model).get_bounding_box_data()
         stair_bb['Element Name'] = st.Name
         stair_bb['Element GlobalID'] = st.GlobalId
         stair_bounding_boxes.append(stair_bb)
 
     space_bounding_boxes = []
     for sp in spaces:
-        space_bb = IfcSpace(sp).get_bounding_box_data()
+        space_bb = IfcSpace(sp, model).get_bounding_box_data()
         space_bb['Element Name'] = sp.Name
         space_bb['Element GlobalID'] = sp.GlobalId
         space_bounding_boxes.append(space_bb)
@@ -246,13 +283,7 @@ def get_space_to_stair_relations(file_path, output_dir):
         if overlapping_stairs:
             overlap_dict[space_bb['GlobalId']] = overlapping_stairs
 
-    space_to_stair_mapping = overlap_dict
-
-    # Write the space_to_stair_mapping dictionary to a JSON file
-    with open(output_json_path, 'w') as json_file:
-        json.dump(space_to_stair_mapping, json_file, indent=4)
-
-    print(f"Successfully exported space-stair relations to {output_json_path}")
+    return overlap_dict
 
 def filter_by_storey(dict1, dict2):
     dict3 = {}
@@ -263,54 +294,108 @@ def filter_by_storey(dict1, dict2):
             dict3[key] = filtered_adjacents
     return dict3
 
-def get_space_to_space_relations(file_path, output_dir):
+def get_space_to_space_relations(file_path, output_dir, model=None):
     global space_to_space_mapping
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_adjacent_space_relation.json")
-    project_name = "test"
-    ifc_geometry = IfcGeometry(file_path, project_name, force_init=False)
-    adjacent_spaces_dict = ifc_geometry.get_adjacent_spaces_dict()
-    space_storey_dict = ifc_geometry.get_space_storey_dict()
-    space_adj_dict_wrt_name = filter_by_storey(adjacent_spaces_dict, space_storey_dict)
+    space_to_space_mapping = model.get_cached_table(get_adjacency_table_name(),
+                                                    lambda: calculate_space_to_space_adjacency(file_path, model))
+    # Write the space_mapping dictionary to a JSON file
+    with open(output_json_path, 'w') as json_file:
+        json.dump(space_to_space_mapping, json_file, indent=4)
+
+    print(f"Successfully exported space-space relations to {output_json_path}")
+
+
+def get_voxel_settings():
+    # The IfcGeometry parameters that decide the space adjacency, not only how fast it is computed
+    return {"voxel_distance": voxel_distance, "voxel_engine": voxel_engine, "adaptive_grid": adaptive_grid,
+            "voxel_height": voxel_height, "per_storey": per_storey}
 
-    spaces = model.ifc_file.by_type("IfcSpace")
+
+def get_adjacency_table_name(table_name="adjacent_space_relation"):
+    # The cached table is keyed by the voxel settings as well, as the space map in IfcGeometry.get_space_map_path
+    settings_key = hashlib.sha256(json.dumps(get_voxel_settings(), sort_keys=True).encode()).hexdigest()[:12]
+    return f"{table_name}_{settings_key}"
+
+
+def get_space_name_to_globalid(model):
     all_space_info = {}
-    for s in spaces:
-        space_info = IfcSpace(s).to_dict()
+    for s in model.spaces:
+        space_info = IfcSpace(s, model).to_dict()
         all_space_info.update(space_info)
 
     # Reverse mapping to convert space.Name to space.GlobalId
-    name_to_globalid = {info['Space Name']: global_id for global_id, info in all_space_info.items()}
+    return {info['Space Name']: global_id for global_id, info in all_space_info.items()}
+
+
+def calculate_space_to_space_adjacency(file_path, model):
+    ifc_geometry = IfcGeometry(file_path, model.model_name, force_init=False, model=model, voxel_workers=voxel_workers,
+                               voxel_block_budget=voxel_block_budget, **get_voxel_settings())
+    adjacent_spaces_dict = ifc_geometry.get_adjacent_spaces_dict()
+    space_storey_dict = ifc_geometry.get_space_storey_dict()
+    space_adj_dict_wrt_name = filter_by_storey(adjacent_spaces_dict, space_storey_dict)
 
+    name_to_globalid = get_space_name_to_globalid(model)
     space_to_space_mapping_calc = {
         name_to_globalid.get(k, 'Unknown'): [name_to_globalid.get(val, 'Unknown') for val in v]
         for k, v in space_adj_dict_wrt_name.items()
     }
-    space_to_space_mapping = space_to_space_mapping_calc
-    # Write the space_mapping dictionary to a JSON file
+    return space_to_space_mapping_calc
+
+
+def get_vertical_space_relations(file_path, output_dir, model=None):
+    """
+    Exports the adjacent spaces on the storeys below and above every space (see
+    IfcGeometry.get_vertical_adjacent_spaces_dict) to <model_name>_vertical_space_relation.json. These relations are
+    not part of the combined dictionary, which only relates spaces within a storey.
+    """
+    model = model if model is not None else IfcProject(file_path)
+    model_name = get_model_name(file_path)
+    output_json_path = os.path.join(output_dir, f"{model_name}_vertical_space_relation.json")
+    vertical_mapping = model.get_cached_table(get_adjacency_table_name("vertical_space_relation"),
+                                              lambda: calculate_vertical_space_adjacency(file_path, model))
     with open(output_json_path, 'w') as json_file:
-        json.dump(space_to_space_mapping, json_file, indent=4)
+        json.dump(vertical_mapping, json_file, indent=4)
 
-    print(f"Successfully exported space-space relations to {output_json_path}")
+    print(f"Successfully exported vertical space-space relations to {output_json_path}")
+
+
+def calculate_vertical_space_adjacency(file_path, model):
+    # per_storey, so the space meshes are extracted (they are not in the space map cache) and the grid of the whole
+    # building is not voxelized; the vertical pass voxelizes only the spaces between the storeys
+    settings = dict(get_voxel_settings(), per_storey=True)
+    ifc_geometry = IfcGeometry(file_path, model.model_name, force_init=False, model=model, voxel_workers=voxel_workers,
+                               voxel_block_budget=voxel_block_budget, **settings)
+    vertical_spaces_dict = ifc_geometry.get_vertical_adjacent_spaces_dict()
+
+    name_to_globalid = get_space_name_to_globalid(model)
+    return {
+        name_to_globalid.get(k, 'Unknown'): [name_to_globalid.get(val, 'Unknown') for val in v]
+        for k, v in vertical_spaces_dict.items() if v
+    }
 
 
-def get_space_info_dict(file_path, output_dir):
+def get_space_info_dict(file_path, output_dir, model=None):
     global space_info_dict
-    model = IfcProject(file_path)
+    model = model if model is not None else IfcProject(file_path)
     # Extract model name from the IFC file path
-    model_name, _ = os.path.splitext(os.path.basename(file_path))
+    model_name = get_model_name(file_path)
     # Construct the output JSON file path
     output_json_path = os.path.join(output_dir, f"{model_name}_space_info_dict.json")
-    spaces = model.ifc_file.by_type("IfcSpace")
-    all_space_info = {}
-    for s in spaces:
-        space_info = IfcSpace(s).to_dict()
-        all_space_info.update(space_info)
 
-    space_info_dict = all_space_info
+    def build_table():
+        spaces = model.spaces
+        all_space_info = {}
+        for s in spaces:
+            space_info = IfcSpace(s, model).to_dict()
+            all_space_info.update(space_info)
+        return all_space_info
+
+    space_info_dict = model.get_cached_table("space_info_dict", build_table)
 
     # Write the space_mapping dictionary to a JSON file
     with open(output_json_path, 'w') as json_file:
@@ -319,30 +404,37 @@ def get_space_info_dict(file_path, output_dir):
     print(f"Successfully exported space-info dictionary to {output_json_path}")
 
 
-if __name__ == "__main__":
-    # Replace these paths with your actual file paths
-    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\Residential House.ifc'
-    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC20-Office-Building.ifc'
-    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\TUM_Gebaude N6_IFC4.ifc'
-    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\Duplex_A_20110907_optimized.ifc'
-    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC20-FZK-Haus_L_shape_space.ifc'
-    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\NBU_MedicalClinic_Arch.ifc'
-    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC9R1-Haus-G-H-Ver2-2x3.ifc'
-    # output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\NBU_MedicalClinic_Arch_Output'
-    # output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\AC9R1-Haus-G-H-Ver2-2x3_Output'
+def run_pipeline(file_path, output_dir, model=None):
+    """
+    Runs all relation extractions for one IFC file and combines them to the space-entity-based dictionary.
 
-    # Call functions
-    get_space_door_relations(ifc_file_path, output_dir)
-    get_space_ve_relations(ifc_file_path, output_dir)
-    get_space_wall_relations(ifc_file_path, output_dir)
-    get_space_opening_relations(ifc_file_path, output_dir)
-    get_space_to_space_relations(ifc_file_path, output_dir)
-    get_space_info_dict(ifc_file_path, output_dir)
-    get_space_to_stair_relations(ifc_file_path, output_dir)
+    Args:
+        file_path (str): Path to the IFC file.
+        output_dir (str): Directory for the JSON outputs.
+        model (IfcProject): Already opened model session. If None, the IFC file is opened here.
 
+    Returns:
+        dict: The combined dictionary, as written to <model_name>_space_combined_dict.json.
+    """
+    model = model if model is not None else IfcProject(file_path)
+
+    # The extraction functions fill the module level dictionaries, start from empty ones for every model
+    for mapping in (space_door_mapping, space_ve_mapping, space_wall_mapping, space_opening_mapping,
+                    space_to_stair_mapping, space_to_space_mapping, space_info_dict):
+        mapping.clear()
+
+    get_space_door_relations(file_path, output_dir, model=model)
+    get_space_ve_relations(file_path, output_dir, model=model)
+    get_space_wall_relations(file_path, output_dir, model=model)
+    get_space_opening_relations(file_path, output_dir, model=model)
+    get_space_to_space_relations(file_path, output_dir, model=model)
+    get_space_info_dict(file_path, output_dir, model=model)
+    get_space_to_stair_relations(file_path, output_dir, model=model)
+    if vertical_relations:
+        get_vertical_space_relations(file_path, output_dir, model=model)
 
     # Combine to a space-entity-based dictionary
-    create_combined_dictionary(
+    return create_combined_dictionary(
         space_info_dict,
         space_door_mapping,
         space_ve_mapping,
@@ -350,7 +442,27 @@ if __name__ == "__main__":
         space_opening_mapping,
         space_to_stair_mapping,
         space_to_space_mapping,
-        ifc_file_path,
-        output_dir
+        file_path,
+        output_dir,
+        model=model
     )
 
+
+if __name__ == "__main__":
+    # Replace these paths with your actual file paths
+    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\Residential House.ifc'
+    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC20-Office-Building.ifc'
+    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\TUM_Gebaude N6_IFC4.ifc'
+    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\Duplex_A_20110907_optimized.ifc'
+    # # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC20-FZK-Haus_L_shape_space.ifc'
+    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\NBU_MedicalClinic_Arch.ifc'
+    # ifc_file_path = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\models\AC9R1-Haus-G-H-Ver2-2x3.ifc'
+    # output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\NBU_MedicalClinic_Arch_Output'
+    # output_dir = r'C:\Users\harsh\Documents\Master Thesis\ifc_processing\Circul.IFC\output\AC9R1-Haus-G-H-Ver2-2x3_Output'
+
+    # Share one model session between all functions. The IFC file is parsed at most once,
+    # and not at all if every relationship table is already in the cache
+    with IfcProject(ifc_file_path, cache_dir=cache_dir,
+                    include_types=CIRCULATION_ENTITY_TYPES if partial_loading else None) as model:
+        run_pipeline(ifc_file_path, output_dir, model=model)
+
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import trimesh
+
+from data.ifc_classes.adaptive_grid import get_adaptive_blocks, get_chunk_boxes
+from data.ifc_classes.parallel_voxelizer import voxelize_block
+from data.ifc_classes.voxel_label_grid import ChunkedLabelGrid
+
+AMBIENT_IDX = -100
+CHUNK_SIZE = 4
+
+
+def get_test_meshes():
+    box = trimesh.creation.box(extents=(6.0, 4.0, 3.0))
+    rotated_box = box.copy()
+    rotated_box.apply_transform(trimesh.transformations.rotation_matrix(0.4, (0, 0, 1)))
+    two_rooms = trimesh.util.concatenate([box, box.copy().apply_translation((0.0, 0.0, 3.5))])
+    return {"box": box, "rotated_box": rotated_box, "two_rooms": two_rooms,
+            "sphere": trimesh.creation.icosphere(subdivisions=2, radius=3.0)}
+
+
+def get_location_vecs(mesh, voxel_distance, voxel_height):
+    # Voxel centers beyond the bounds of the mesh, off its faces; z may have another (uneven) spacing
+    bounds_min, bounds_max = mesh.bounds
+    location_vecs = [np.arange(axis_min - 2.3 * voxel_distance, axis_max + 2 * voxel_distance, voxel_distance)
+                     for axis_min, axis_max in zip(bounds_min, bounds_max)]
+    if voxel_height is not None:
+        z_vec = np.arange(bounds_min[2] - 1.1 * voxel_height, bounds_max[2] + voxel_height, voxel_height)
+        location_vecs[2] = z_vec + np.linspace(0, 0.3 * voxel_height, len(z_vec))
+    return location_vecs
+
+
+def get_mesh_block(mesh, location_vecs):
+    # The voxels within the bounding box of the mesh, as IfcGeometry.get_voxel_block
+    return tuple(slice(np.searchsorted(location_vec, axis_min, side='left'),
+                       np.searchsorted(location_vec, axis_max, side='right'))
+                 for location_vec, axis_min, axis_max in zip(location_vecs, *mesh.bounds))
+
+
+@pytest.mark.parametrize("mesh_name", sorted(get_test_meshes()))
+@pytest.mark.parametrize("voxel_distance, voxel_height", [(0.5, None), (0.2, None), (0.2, 0.45)])
+@pytest.mark.parametrize("voxel_engine", ["contains", "scanline"])
+def test_adaptive_matches_uniform(mesh_name, voxel_distance, voxel_height, voxel_engine):
+    mesh = get_test_meshes()[mesh_name]
+    vertices, faces = np.asarray(mesh.vertices), np.asarray(mesh.faces)
+    location_vecs = get_location_vecs(mesh, voxel_distance, voxel_height)
+    shape = tuple(len(location_vec) for location_vec in location_vecs)
+    block = get_mesh_block(mesh, location_vecs)
+
+    def voxelize(voxel_block):
+        return voxelize_block(vertices, faces, *[location_vec[axis_slice]
+                                                 for location_vec, axis_slice in zip(location_vecs, voxel_block)],
+                              voxel_engine, mesh)
+
+    uniform = ChunkedLabelGrid(shape, AMBIENT_IDX, np.int8, CHUNK_SIZE)
+    uniform.set_block(block, voxelize(block), 1)
+
+    adaptive = ChunkedLabelGrid(shape, AMBIENT_IDX, np.int8, CHUNK_SIZE)
+    inside_chunks, fine_blocks = get_adaptive_blocks(
+        vertices, faces, block, location_vecs, CHUNK_SIZE,
+        lambda x_vec, y_vec, z_vec: voxelize_block(vertices, faces, x_vec, y_vec, z_vec, voxel_engine, mesh))
+    adaptive.set_chunks(inside_chunks, 1)
+    for fine_block in fine_blocks:
+        adaptive.set_block(fine_block, voxelize(fine_block), 1)
+
+    assert np.array_equal(adaptive.to_dense(), uniform.to_dense())
+    # The fine blocks stay within the block of the mesh
+    assert all(block[axis].start <= fine_block[axis].start < fine_block[axis].stop <= block[axis].stop
+               for fine_block in fine_blocks for axis in range(3))
+    if voxel_distance == 0.2 and voxel_height is None:
+        # Only the voxels near the surface are tested one by one
+        assert len(inside_chunks) > 0
+        tested = sum(np.prod([axis_slice.stop - axis_slice.start for axis_slice in fine_block])
+                     for fine_block in fine_blocks)
+        assert tested < np.prod([axis_slice.stop - axis_slice.start for axis_slice in block])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunk_boxes_cover_mask(seed):
+    rng = np.random.default_rng(seed)
+    chunk_mask = rng.random(tuple(rng.integers(1, 8, 3))) < rng.choice([0.2, 0.6, 0.95])
+    covered = np.zeros(chunk_mask.shape, dtype=np.int64)
+    for box in get_chunk_boxes(chunk_mask):
+        covered[box[0]:box[3], box[1]:box[4], box[2]:box[5]] += 1
+    assert np.array_equal(covered, chunk_mask.astype(np.int64))
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from data.ifc_classes.adj_space import IfcGeometry
+from data.ifc_classes.voxel_label_grid import ChunkedLabelGrid
+
+AMBIENT_IDX = -100
+NEUTRAL_IDX = -50
+N_SEARCH_BLOCKS = 2
+
+
+def get_reference_adjacent_spaces(dense, space_name_list):
+    """
+    The adjacency as computed before the pairs were deduplicated with np.unique: boundary pairs along x, y and z
+    (looking past up to N_SEARCH_BLOCKS neutral or ambient voxels), the distinct pairs of every axis in the order they
+    are found, then the distinct unordered pairs; every space lists its partners as first and then as second space.
+    """
+    pairs = []
+    for axis in range(3):
+        axis_pairs = []
+        for index in zip(*np.nonzero(np.diff(dense, axis=axis) != 0)):
+            next_index = list(index)
+            next_index[axis] += 1
+            label_1, label_2 = dense[index], dense[tuple(next_index)]
+            for step in range(1, N_SEARCH_BLOCKS + 1):
+                if label_2 not in (NEUTRAL_IDX, AMBIENT_IDX):
+                    break
+                # Past the end of the grid the search stays on the next voxel
+                search_index = list(next_index)
+                if next_index[axis] + step < dense.shape[axis]:
+                    search_index[axis] = next_index[axis] + step
+                label_2 = dense[tuple(search_index)]
+            if (label_1, label_2) not in axis_pairs:
+                axis_pairs.append((label_1, label_2))
+        pairs.extend(axis_pairs)
+
+    unique_pairs = []
+    for label_1, label_2 in pairs:
+        if label_1 != label_2 and (label_1, label_2) not in unique_pairs and (label_2, label_1) not in unique_pairs:
+            unique_pairs.append((label_1, label_2))
+    adjacent_spaces_dict = {}
+    for space_counter, space_name in enumerate(space_name_list):
+        partners = [label_2 for label_1, label_2 in unique_pairs if label_1 == space_counter]
+        partners += [label_1 for label_1, label_2 in unique_pairs if label_2 == space_counter]
+        adjacent_spaces_dict[space_name] = [space_name_list[partner] for partner in partners if partner >= 0]
+    return adjacent_spaces_dict
+
+
+def get_geometry(dense, space_name_list, chunk_size):
+    # An IfcGeometry with a given label grid, without a model
+    geometry = IfcGeometry.__new__(IfcGeometry)
+    geometry.ambient_idx = AMBIENT_IDX
+    geometry.neutral_idx = NEUTRAL_IDX
+    geometry.per_storey = False
+    geometry.space_name_list = space_name_list
+    geometry.grid_shape = dense.shape
+    geometry.space_idx_grid = ChunkedLabelGrid(dense.shape, AMBIENT_IDX, np.int8, chunk_size)
+    whole_grid = tuple(slice(0, size) for size in dense.shape)
+    for label in np.unique(dense):
+        geometry.space_idx_grid.set_block(whole_grid, dense == label, label)
+    return geometry
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_adjacent_spaces_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    space_count = int(rng.integers(2, 12))
+    space_name_list = [f"Space {space_counter}" for space_counter in range(space_count)]
+    # Rooms of a few voxels with ambient and neutral voxels between them
+    labels = np.concatenate((np.arange(space_count), [AMBIENT_IDX] * 4, [NEUTRAL_IDX] * 2))
+    coarse = rng.choice(labels, size=tuple(rng.integers(2, 7, 3)))
+    dense = np.kron(coarse, np.ones(tuple(rng.integers(1, 4, 3)), dtype=np.int64))
+
+    geometry = get_geometry(dense, space_name_list, chunk_size=int(rng.integers(1, 6)))
+    assert np.array_equal(geometry.space_idx_grid.to_dense(), dense)
+    # Same partners in the same order
+    assert list(geometry.get_adjacent_spaces_dict().items()) == \
+        list(get_reference_adjacent_spaces(dense, space_name_list).items())
+
+
+def test_adjacent_spaces_through_wall():
+    # Two rooms separated by a wall of two ambient voxels are adjacent, with three voxels they are not
+    dense = np.full((9, 3, 3), AMBIENT_IDX)
+    dense[:3] = 0
+    dense[5:] = 1
+    geometry = get_geometry(dense, ["A", "B"], chunk_size=4)
+    assert geometry.get_adjacent_spaces_dict() == {"A": ["B"], "B": ["A"]}
+
+    dense[5] = AMBIENT_IDX
+    geometry = get_geometry(dense, ["A", "B"], chunk_size=4)
+    assert geometry.get_adjacent_spaces_dict() == {"A": [], "B": []}
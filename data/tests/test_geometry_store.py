@@ -0,0 +1,26 @@
+import ifcopenshell
+
+from data.utils.geometry_store import get_entity_hash
+
+
+def create_polyline(ifc_file, name):
+    points = [ifc_file.createIfcCartesianPoint((0.0, 0.0)), ifc_file.createIfcCartesianPoint((4.0, 0.0))]
+    polyline = ifc_file.createIfcPolyline(points)
+    return ifc_file.createIfcArbitraryOpenProfileDef("CURVE", name, polyline)
+
+
+def test_entity_hash_ignores_reference_text_in_strings():
+    ifc_file = ifcopenshell.file(schema="IFC4")
+    profile = create_polyline(ifc_file, "Profile")
+    # The id of an existing entity and an id no entity has, both must be hashed as plain text
+    for name in (f"Profile #{profile.id()}", "Profile #999"):
+        named_profile = create_polyline(ifc_file, name)
+        assert get_entity_hash(named_profile, {}) != get_entity_hash(profile, {})
+
+
+def test_entity_hash_does_not_depend_on_entity_ids():
+    ifc_file = ifcopenshell.file(schema="IFC4")
+    profile = create_polyline(ifc_file, "Profile")
+    other_profile = create_polyline(ifc_file, "Profile")
+    assert profile.id() != other_profile.id()
+    assert get_entity_hash(profile, {}) == get_entity_hash(other_profile, {})
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import trimesh
+
+from data.ifc_classes.parallel_voxelizer import voxelize_block
+
+
+def get_location_vecs(mesh, voxel_distance, offset):
+    # Voxel centers a little beyond the bounds of the mesh, shifted by offset
+    bounds_min, bounds_max = mesh.bounds
+    return [np.arange(axis_min - voxel_distance, axis_max + voxel_distance, voxel_distance) + offset
+            for axis_min, axis_max in zip(bounds_min, bounds_max)]
+
+
+def get_test_meshes():
+    box = trimesh.creation.box(extents=(4.0, 3.0, 2.5))
+    rotated_box = box.copy()
+    rotated_box.apply_transform(trimesh.transformations.rotation_matrix(0.4, (0, 0, 1)))
+    tilted_box = box.copy()
+    tilted_box.apply_transform(trimesh.transformations.rotation_matrix(0.3, (1, 1, 0)))
+    # Two rooms in one mesh, so most columns cross the surface four times
+    two_rooms = trimesh.util.concatenate([box, box.copy().apply_translation((0.0, 0.0, 3.0))])
+    return {"box": box, "rotated_box": rotated_box, "tilted_box": tilted_box, "two_rooms": two_rooms,
+            "sphere": trimesh.creation.icosphere(subdivisions=2, radius=2.0)}
+
+
+@pytest.mark.parametrize("mesh_name", sorted(get_test_meshes()))
+@pytest.mark.parametrize("voxel_distance", [0.5, 0.2])
+def test_scanline_matches_contains(mesh_name, voxel_distance):
+    mesh = get_test_meshes()[mesh_name]
+    # Offsets that keep the voxel centers off the faces, where the two engines may decide differently
+    offset = voxel_distance * 0.37
+    x_vec, y_vec, z_vec = get_location_vecs(mesh, voxel_distance, offset)
+    vertices, faces = np.asarray(mesh.vertices), np.asarray(mesh.faces)
+
+    contains = voxelize_block(vertices, faces, x_vec, y_vec, z_vec, "contains", mesh)
+    scanline = voxelize_block(vertices, faces, x_vec, y_vec, z_vec, "scanline")
+    assert contains.any()
+    assert np.array_equal(scanline, contains)
+
+
+def test_scanline_counts_shared_edges_once():
+    # Columns exactly on the diagonal of the top and bottom face, where two triangles meet
+    mesh = trimesh.creation.box(extents=(2.0, 2.0, 2.0))
+    location_vec = np.linspace(-1.5, 1.5, 7)
+    inside = voxelize_block(np.asarray(mesh.vertices), np.asarray(mesh.faces), location_vec, location_vec,
+                            location_vec + 0.25, "scanline")
+    # Every column through the box is inside between its bottom and top face, whatever triangle it hits
+    assert np.array_equal(inside[2:5, 2:5].sum(axis=2), np.full((3, 3), 4))
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from data.ifc_classes.voxel_label_grid import ChunkedLabelGrid, get_label_dtype, split_block
+
+AMBIENT_IDX = -100
+
+
+def get_random_block(rng, shape):
+    starts = [int(rng.integers(0, size)) for size in shape]
+    stops = [int(rng.integers(start + 1, size + 1)) for start, size in zip(starts, shape)]
+    return tuple(slice(start, stop) for start, stop in zip(starts, stops))
+
+
+def get_random_grid(seed):
+    """Returns a ChunkedLabelGrid after random block and chunk writes (with compactions) and the same dense grid."""
+    rng = np.random.default_rng(seed)
+    shape = tuple(int(size) for size in rng.integers(1, 20, 3))
+    chunk_size = int(rng.integers(1, 6))
+    grid = ChunkedLabelGrid(shape, AMBIENT_IDX, np.int8, chunk_size)
+    dense = np.full(shape, AMBIENT_IDX)
+    for _ in range(8):
+        block = get_random_block(rng, shape)
+        # Sparse masks and whole blocks, which turn chunks into coarse voxels
+        mask = rng.random([axis_slice.stop - axis_slice.start for axis_slice in block]) < rng.choice([0.3, 1.0])
+        label = int(rng.integers(-1, 10))
+        grid.set_block(block, mask, label)
+        dense[block][mask] = label
+        if rng.random() < 0.3:
+            chunk_keys = np.argwhere(rng.random(grid.chunk_table.shape) < 0.2)
+            label = int(rng.integers(0, 10))
+            grid.set_chunks(chunk_keys, label)
+            for chunk_key in chunk_keys:
+                dense[tuple(slice(idx * chunk_size, (idx + 1) * chunk_size) for idx in chunk_key)] = label
+        if rng.random() < 0.3:
+            grid.compact()
+    return grid, dense
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_grid_matches_dense(seed):
+    grid, dense = get_random_grid(seed)
+    assert np.array_equal(grid.to_dense(), dense)
+
+    rng = np.random.default_rng(seed)
+    x_idx, y_idx, z_idx = [rng.integers(0, size, 50) for size in dense.shape]
+    assert np.array_equal(grid.get_labels(x_idx, y_idx, z_idx), dense[x_idx, y_idx, z_idx])
+    block = get_random_block(rng, dense.shape)
+    assert np.array_equal(grid.get_block(block), dense[block])
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_boundaries_match_dense(seed):
+    grid, dense = get_random_grid(seed)
+    for axis in range(3):
+        expected = np.nonzero(np.diff(dense, axis=axis) != 0)
+        boundaries = grid.get_boundaries(axis)
+        assert all(np.array_equal(idx, expected_idx) for idx, expected_idx in zip(boundaries, expected))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_round_trip(seed, tmp_path):
+    # As in the space map cache: get_arrays, saved with np.savez and restored with from_arrays
+    grid, dense = get_random_grid(seed)
+    np.savez(tmp_path / "grid.npz", **grid.get_arrays())
+    with np.load(tmp_path / "grid.npz") as arrays:
+        restored = ChunkedLabelGrid.from_arrays(arrays)
+    assert restored.shape == grid.shape and restored.chunk_size == grid.chunk_size
+    assert restored.dtype == grid.dtype
+    assert np.array_equal(restored.to_dense(), dense)
+    assert np.array_equal(restored.get_labels(*np.nonzero(dense != AMBIENT_IDX)), dense[dense != AMBIENT_IDX])
+
+    # The restored grid can be written to like the original
+    block = tuple(slice(0, size) for size in dense.shape)
+    restored.set_block(block, dense == AMBIENT_IDX, 7)
+    dense[dense == AMBIENT_IDX] = 7
+    assert np.array_equal(restored.to_dense(), dense)
+
+
+def test_uniform_chunks_stay_coarse():
+    grid = ChunkedLabelGrid((10, 10, 10), AMBIENT_IDX, np.int8, chunk_size=4)
+    grid.set_block((slice(0, 8), slice(0, 8), slice(0, 8)), np.ones((8, 8, 8), dtype=bool), 3)
+    assert grid.chunk_count == 0
+    # A single voxel makes its chunk fine, restoring it and compacting makes it coarse again
+    grid.set_block((slice(1, 2), slice(1, 2), slice(1, 2)), np.ones((1, 1, 1), dtype=bool), 5)
+    assert grid.chunk_count == 1
+    grid.set_block((slice(1, 2), slice(1, 2), slice(1, 2)), np.ones((1, 1, 1), dtype=bool), 3)
+    grid.compact()
+    assert grid.chunk_count == 0
+    assert np.array_equal(grid.to_dense()[:8, :8, :8], np.full((8, 8, 8), 3))
+
+
+def test_label_dtype():
+    assert get_label_dtype(-100, 120) == np.int8
+    assert get_label_dtype(-100, 128) == np.int16
+    assert get_label_dtype(-100, 40000) == np.int32
+
+
+@pytest.mark.parametrize("max_voxels", [0, 1, 7, 50, 100, 1000, 10 ** 6])
+def test_split_block_covers_block(max_voxels):
+    block = (slice(3, 14), slice(0, 9), slice(5, 12))
+    covered = np.zeros((14, 9, 12), dtype=np.int64)
+    sub_blocks = list(split_block(block, max_voxels))
+    for sub_block in sub_blocks:
+        assert np.prod([axis_slice.stop - axis_slice.start for axis_slice in sub_block]) <= max(1, max_voxels)
+        covered[sub_block] += 1
+    # Every voxel of the block in exactly one sub-block, none outside of it
+    expected = np.zeros_like(covered)
+    expected[block] = 1
+    assert np.array_equal(covered, expected)
+    # In C order, as the voxels of the whole block
+    starts = [tuple(axis_slice.start for axis_slice in sub_block) for sub_block in sub_blocks]
+    assert starts == sorted(starts)
+    if max_voxels >= 11 * 9 * 7:
+        assert sub_blocks == [block]
+
+
+def test_split_block_keeps_columns_whole():
+    # A budget of two columns gives slabs of full z columns, not pieces of columns
+    sub_blocks = list(split_block((slice(0, 4), slice(0, 4), slice(0, 10)), 20))
+    assert all(sub_block[2] == slice(0, 10) for sub_block in sub_blocks)
+    assert all(sub_block[1].stop - sub_block[1].start == 2 for sub_block in sub_blocks)
@@ -3,7 +3,8 @@ import os
 import ifcopenshell
 from collections import defaultdict
 from data.ifc_classes.ifc_project import IfcProject
-from data.config import ifc_file_path
+from data.utils.ifc_input import get_model_name
+from data.config import ifc_file_path, virtual_boundary_access
 def find_exit_doors(space_door_mapping):
     door_connections = defaultdict(list)
     door_names = {}
@@ -43,6 +44,8 @@ def get_boundary_properties(space1_id, space2_id, ifc_file):
     """
     Check if two spaces share a virtual internal boundary.
     Returns True if they share a boundary that is both VIRTUAL and INTERNAL.
+    ifc_file is the parsed model or the StepIndex of a model session (IfcProject.step_index), which only decodes
+    the two spaces and their boundaries instead of parsing the whole file.
     """
     space1 = ifc_file.by_guid(space1_id)
     space2 = ifc_file.by_guid(space2_id)
@@ -79,17 +82,20 @@ def create_combined_dictionary(
         space_to_stair_mapping,
         space_to_space_mapping,
         ifc_file_path,
-        output_dir
+        output_dir,
+        model=None
 ):
     """
     Creates a combined dictionary from individual dictionaries and saves it to a JSON file.
-    Now includes checks for virtual internal boundaries between spaces.
+    Now includes checks for virtual internal boundaries between spaces (if virtual_boundary_access is set in config),
+    read through the step index of the model session.
+    If a model session (IfcProject) is passed, its parsed IFC file is reused instead of opening the file again.
     """
     # Initialize combined dictionary
     combined_dict = {}
 
-    # Load IFC file
-    ifc_file = ifcopenshell.open(ifc_file_path)
+    # Load IFC file lazily through the model session, so a run served from the model cache does not parse it
+    model = model if model is not None else IfcProject(ifc_file_path)
 
     # Find exit doors
     exit_doors = find_exit_doors(space_door_mapping)
@@ -136,10 +142,10 @@ def create_combined_dictionary(
                     if any(ve in adjacent_ves for ve in space_ves):
                         is_directly_accessible = True
 
-                # # Check for virtual internal boundary
-                # if not is_directly_accessible:
-                #     if get_boundary_properties(space_id, adjacent_space_id, ifc_file):
-                #         is_directly_accessible = True
+                # Check for virtual internal boundary
+                if not is_directly_accessible and virtual_boundary_access:
+                    if get_boundary_properties(space_id, adjacent_space_id, model.step_index):
+                        is_directly_accessible = True
 
                 # Move to directly accessible if conditions are met
                 if is_directly_accessible:
@@ -182,13 +188,14 @@ def create_combined_dictionary(
         })
 
     # Save to file
-    model_name = os.path.splitext(os.path.basename(ifc_file_path))[0]
+    model_name = get_model_name(ifc_file_path)
     output_json_path = os.path.join(output_dir, f"{model_name}_space_combined_dict.json")
 
     with open(output_json_path, 'w') as json_file:
         json.dump(combined_dict, json_file, indent=4)
 
     print(f"Successfully exported combined dictionary to {output_json_path}")
+    return combined_dict
 # Example usage
 if __name__ == "__main__":
     # Define file paths for your output
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+import ifcopenshell
+
+# References to other entities in the STEP representation of an entity, e.g. #123; quoted strings are matched as a
+# whole (group 1 unset), so a '#12' inside a Name or Description is kept as text and not taken for a reference
+ENTITY_REFERENCE_PATTERN = re.compile(r"'[^']*'|#(\d+)")
+# Columns of the store, one raw binary file each (dtype, shape of a row); the rows of all elements are concatenated
+STORE_COLUMNS = {"vertices": (np.float64, (3,)), "faces": (np.int32, (3,)), "edges": (np.int32, (2,)),
+                 "matrices": (np.float64, (4, 4))}
+STORE_VERSION = 2
+# The columns are rewritten without the replaced rows once these make up more than this share of the store
+COMPACT_RATIO = 0.5
+
+
+def get_entity_hash(entity, memo):
+    """
+    Returns a hash of the STEP content of an entity and everything it references. References are replaced by the
+    hashes of the referenced entities, so the hash does not depend on the entity ids of the file (which change
+    whenever a model is exported again). memo maps entity ids to their hash and is shared between calls.
+    """
+    entity_id = entity.id()
+    if entity_id in memo:
+        return memo[entity_id]
+    text = str(entity)
+    # Strip the '#id=' prefix and substitute the references
+    content = text[text.index("=") + 1:] if text.startswith("#") else text
+    ifc_file = entity.file
+    content = ENTITY_REFERENCE_PATTERN.sub(
+        lambda match: get_entity_hash(ifc_file.by_id(int(match.group(1))), memo) if match.group(1) else match.group(0),
+        content)
+    entity_hash = hashlib.sha256(content.encode()).hexdigest()
+    memo[entity_id] = entity_hash
+    return entity_hash
+
+
+def get_representation_hash(element, memo):
+    """
+    Returns a hash of everything the tessellated shape of an element depends on: its type, body representation and
+    placement, and the representations and placements of its openings.
+    """
+    parts = [element.is_a()]
+    for attribute in (element.Representation, element.ObjectPlacement):
+        parts.append(get_entity_hash(attribute, memo) if attribute is not None else "$")
+    openings = [rel.RelatedOpeningElement for rel in getattr(element, "HasOpenings", ())]
+    parts.extend(sorted(get_representation_hash(opening, memo) for opening in openings))
+    return hashlib.sha256(",".join(parts).encode()).hexdigest()
+
+
+def get_row_bytes(column):
+    dtype, row_shape = STORE_COLUMNS[column]
+    return np.dtype(dtype).itemsize * int(np.prod(row_shape))
+
+
+def get_settings_key(world_coords):
+    # Another ifcopenshell version may tessellate differently, its shapes are stored separately
+    return f"{'world' if world_coords else 'local'}_{ifcopenshell.version}"
+
+
+class GeometryStore:
+    """
+    On-disk store of tessellated shapes, one entry per GlobalId.
+
+    Every entry is keyed by the representation hash of the element (see get_representation_hash) and the geometry
+    settings, so re-running a model, or a revised version of it, only tessellates the elements whose geometry
+    changed. The shapes of one settings key are stored as columns: vertices_<n>.bin, faces_<n>.bin, edges_<n>.bin
+    and matrices_<n>.bin hold the arrays of all elements concatenated, index.json the GlobalId -> (hash, row ranges)
+    table, the number of rows of every column and the generation n of the column files. The columns are
+    memory-mapped, so loading the store reads only the entries that are used.
+
+    New and changed shapes are appended to the columns, so saving costs the size of the pending shapes and not of
+    the store. The rows of a replaced entry stay in the columns until they make up more than COMPACT_RATIO of them,
+    then the entries in use are written to the column files of the next generation.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._index = {}     # settings key -> {GlobalId: entry}
+        self._sizes = {}     # settings key -> {column: rows in the column files}
+        self._generations = {}    # settings key -> generation of the column files
+        self._arrays = {}    # settings key -> {column: memory-mapped array}
+        self._pending = {}   # settings key -> {GlobalId: (hash, arrays)} not written yet
+
+    def _get_dir(self, settings_key):
+        return os.path.join(self.store_dir, settings_key)
+
+    def _get_column_path(self, settings_key, column, generation=None):
+        if generation is None:
+            generation = self._generations[settings_key]
+        return os.path.join(self._get_dir(settings_key), f"{column}_{generation}.bin")
+
+    def _load(self, settings_key):
+        if settings_key in self._index:
+            return
+        index_path = os.path.join(self._get_dir(settings_key), "index.json")
+        self._index[settings_key] = {}
+        self._sizes[settings_key] = dict.fromkeys(STORE_COLUMNS, 0)
+        self._generations[settings_key] = 0
+        self._arrays[settings_key] = {}
+        self._pending[settings_key] = {}
+        if not os.path.isfile(index_path):
+            return
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+        if index.get("version") != STORE_VERSION:
+            return
+        self._index[settings_key] = index["entries"]
+        self._sizes[settings_key] = index["sizes"]
+        self._generations[settings_key] = index["generation"]
+        self._arrays[settings_key] = self._open_columns(settings_key)
+
+    def _open_columns(self, settings_key):
+        arrays = {}
+        for column, (dtype, row_shape) in STORE_COLUMNS.items():
+            rows = self._sizes[settings_key][column]
+            if rows == 0:
+                # An empty file cannot be memory-mapped (e.g. no element has edges)
+                arrays[column] = np.empty((0,) + row_shape, dtype=dtype)
+            else:
+                # Only the rows listed in the index, a run interrupted before writing it may have left more
+                arrays[column] = np.memmap(self._get_column_path(settings_key, column), dtype=dtype, mode='r',
+                                           shape=(rows,) + row_shape)
+        return arrays
+
+    def get(self, global_id, representation_hash, world_coords=False):
+        """Returns the stored arrays (vertices, faces, edges, matrix) of an element, or None if it changed."""
+        settings_key = get_settings_key(world_coords)
+        self._load(settings_key)
+        pending = self._pending[settings_key].get(global_id)
+        if pending is not None:
+            return pending[1] if pending[0] == representation_hash else None
+        entry = self._index[settings_key].get(global_id)
+        if entry is None or entry["hash"] != representation_hash:
+            return None
+        arrays = self._arrays[settings_key]
+        # Copies, so no view keeps the memory-mapped files open when the store is saved
+        geometry = {column: np.array(arrays[column][slice(*entry[column])])
+                    for column in ("vertices", "faces", "edges")}
+        geometry["matrix"] = np.array(arrays["matrices"][entry["matrix"]])
+        return geometry
+
+    def put(self, global_id, representation_hash, geometry, world_coords=False):
+        """Adds the arrays of an element (dict with vertices, faces, edges, matrix), written by the next save()."""
+        settings_key = get_settings_key(world_coords)
+        self._load(settings_key)
+        self._pending[settings_key][global_id] = (representation_hash, geometry)
+
+    def save(self):
+        """Writes the pending entries. Entries of the same GlobalId are replaced, all others are kept."""
+        for settings_key, pending in self._pending.items():
+            if pending:
+                self._append(settings_key, pending)
+                self._pending[settings_key] = {}
+                if self._get_unused_ratio(settings_key) > COMPACT_RATIO:
+                    self._compact(settings_key)
+
+    def close(self):
+        """Writes the pending entries and releases the memory-mapped columns."""
+        self.save()
+        self._arrays = {}
+        self._index = {}
+        self._sizes = {}
+        self._generations = {}
+        self._pending = {}
+
+    def _get_unused_ratio(self, settings_key):
+        # Share of the vertex rows that belong to no entry (replaced shapes), the largest column
+        used = sum(entry["vertices"][1] - entry["vertices"][0] for entry in self._index[settings_key].values())
+        size = self._sizes[settings_key]["vertices"]
+        return 1 - used / size if size else 0
+
+    def _release_columns(self, settings_key):
+        # Release the memory maps before their files are written (which fails on Windows while they are open)
+        self._arrays[settings_key] = {}
+
+    def _append(self, settings_key, pending):
+        entries = dict(self._index[settings_key])
+        sizes = dict(self._sizes[settings_key])
+        columns = {column: [] for column in STORE_COLUMNS}
+        for global_id, (representation_hash, geometry) in pending.items():
+            entry = {"hash": representation_hash, "matrix": sizes["matrices"]}
+            for column in ("vertices", "faces", "edges"):
+                rows = np.asarray(geometry[column]).reshape((-1,) + STORE_COLUMNS[column][1])
+                entry[column] = [sizes[column], sizes[column] + len(rows)]
+                sizes[column] += len(rows)
+                columns[column].append(rows)
+            columns["matrices"].append(np.asarray(geometry["matrix"]).reshape(1, 4, 4))
+            sizes["matrices"] += 1
+            entries[global_id] = entry
+
+        self._release_columns(settings_key)
+        store_dir = self._get_dir(settings_key)
+        os.makedirs(store_dir, exist_ok=True)
+        for column, (dtype, _) in STORE_COLUMNS.items():
+            column_path = self._get_column_path(settings_key, column)
+            with open(column_path, 'r+b' if os.path.isfile(column_path) else 'wb') as file:
+                # Rows past the indexed size were left by an interrupted run, they are overwritten
+                file.truncate(self._sizes[settings_key][column] * get_row_bytes(column))
+                file.seek(0, os.SEEK_END)
+                for rows in columns[column]:
+                    file.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+        # The index is written last, an interrupted run leaves the previous index (and rows it ignores) behind
+        self._write_index(settings_key, entries, sizes, self._generations[settings_key])
+
+    def _compact(self, settings_key):
+        generation = self._generations[settings_key]
+        entries, sizes = self._write_columns(settings_key, generation + 1)
+        self._release_columns(settings_key)
+        self._write_index(settings_key, entries, sizes, generation + 1)
+        # The old files are only removed once the index points to the new ones
+        for column in STORE_COLUMNS:
+            column_path = self._get_column_path(settings_key, column, generation)
+            if os.path.isfile(column_path):
+                os.remove(column_path)
+
+    def _write_columns(self, settings_key, generation):
+        # Copies the rows of the entries in use to the column files of generation, returns the new index
+        entries = {}
+        sizes = dict.fromkeys(STORE_COLUMNS, 0)
+        arrays = self._arrays[settings_key]
+        files = {column: open(self._get_column_path(settings_key, column, generation), 'wb')
+                 for column in STORE_COLUMNS}
+        try:
+            for global_id, old_entry in self._index[settings_key].items():
+                entry = {"hash": old_entry["hash"], "matrix": sizes["matrices"]}
+                for column in ("vertices", "faces", "edges"):
+                    rows = arrays[column][slice(*old_entry[column])]
+                    entry[column] = [sizes[column], sizes[column] + len(rows)]
+                    sizes[column] += len(rows)
+                    files[column].write(np.ascontiguousarray(rows).tobytes())
+                files["matrices"].write(np.ascontiguousarray(arrays["matrices"][old_entry["matrix"]]).tobytes())
+                sizes["matrices"] += 1
+                entries[global_id] = entry
+        finally:
+            for file in files.values():
+                file.close()
+        return entries, sizes
+
+    def _write_index(self, settings_key, entries, sizes, generation):
+        index_path = os.path.join(self._get_dir(settings_key), "index.json")
+        # Write to a temporary file first so an interrupted run does not leave a truncated index behind
+        with open(index_path + ".tmp", 'w') as index_file:
+            json.dump({"version": STORE_VERSION, "generation": generation, "sizes": sizes, "entries": entries},
+                      index_file)
+        os.replace(index_path + ".tmp", index_path)
+        self._index[settings_key] = entries
+        self._sizes[settings_key] = sizes
+        self._generations[settings_key] = generation
+        self._arrays[settings_key] = self._open_columns(settings_key)
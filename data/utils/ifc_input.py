@@ -0,0 +1,90 @@
+import contextlib
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+import ifcopenshell
+
+# Leading bytes of the supported containers, the file extension is not trusted
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+# Extensions stripped from the file name to get the model name, longest first
+IFC_FILE_EXTENSIONS = (".ifc.gz", ".ifczip", ".ifcgz", ".ifc")
+IFC_FILE_PATTERNS = ("*.ifc", "*.ifczip", "*.ifc.gz", "*.ifcgz")
+
+
+def get_compression(file_path):
+    """Returns 'zip' or 'gzip' for compressed IFC files (.ifczip, gzip compressed STEP) and None for plain STEP."""
+    with open(file_path, 'rb') as file:
+        magic = file.read(4)
+    if magic.startswith(ZIP_MAGIC):
+        return "zip"
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    return None
+
+
+def get_model_name(file_path):
+    """Returns the file name without its IFC extension, e.g. 'AC20-FZK-Haus' for 'AC20-FZK-Haus.ifc.gz'."""
+    file_name = os.path.basename(file_path)
+    for extension in IFC_FILE_EXTENSIONS:
+        if file_name.lower().endswith(extension):
+            return file_name[:-len(extension)]
+    return os.path.splitext(file_name)[0]
+
+
+def open_step_stream(file_path):
+    """
+    Opens the STEP content of an IFC file as a binary stream. Compressed files are decompressed while they are
+    read, nothing is extracted to disk.
+    """
+    compression = get_compression(file_path)
+    if compression == "gzip":
+        return gzip.open(file_path, 'rb')
+    if compression == "zip":
+        archive = zipfile.ZipFile(file_path)
+        for name in archive.namelist():
+            if name.lower().endswith(".ifc"):
+                return archive.open(name)
+        archive.close()
+        raise LookupError(f"No .ifc file found in {file_path}")
+    return open(file_path, 'rb')
+
+
+def extract_step_file(file_path, chunk_size=1 << 24):
+    """
+    Decompresses the STEP content of a compressed IFC file into a temporary .ifc file and returns its path. The
+    content is streamed chunk by chunk, so the decompressed model is never held in memory as a whole. The caller
+    removes the file.
+    """
+    handle, temp_path = tempfile.mkstemp(suffix=".ifc")
+    try:
+        with os.fdopen(handle, 'wb') as temp_file, open_step_stream(file_path) as stream:
+            shutil.copyfileobj(stream, temp_file, chunk_size)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+@contextlib.contextmanager
+def step_file_path(file_path):
+    """Yields the path of a plain STEP file with the content of file_path, extracted while the context is open."""
+    if get_compression(file_path) is None:
+        yield file_path
+        return
+    temp_path = extract_step_file(file_path)
+    try:
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+def open_ifc_file(file_path):
+    """
+    Opens an IFC file with ifcopenshell. Plain STEP files are parsed from disk, .ifczip and gzip compressed files
+    are streamed into a temporary file first, which is removed once it is parsed.
+    """
+    with step_file_path(file_path) as path:
+        return ifcopenshell.open(path)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import pickle
+import re
+from data.utils.ifc_input import open_step_stream
+
+# Matches the schema identifier in the STEP header, e.g. FILE_SCHEMA(('IFC4'));
+FILE_SCHEMA_PATTERN = re.compile(rb"FILE_SCHEMA\s*\(\s*\(\s*'([^']+)'", re.IGNORECASE)
+
+
+def get_file_content_hash(file_path, chunk_size=1 << 20):
+    """Returns the SHA-256 hash of the file content, read in chunks so large models are not loaded into memory."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_schema_from_header(file_path, header_size=1 << 16):
+    """Reads the IFC schema name from the STEP header without parsing (or fully decompressing) the model."""
+    with open_step_stream(file_path) as stream:
+        header = stream.read(header_size)
+    match = FILE_SCHEMA_PATTERN.search(header)
+    return match.group(1).decode().upper() if match else 'UNKNOWN'
+
+
+class ModelCache:
+    """
+    On-disk cache for the relationship tables extracted from an IFC model.
+
+    Entries are stored in a sub folder named after the content hash and the schema of the IFC file, so a changed
+    model never reads the tables of an older version.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_key(file_path):
+        # Compressed models are keyed on the hash of the compressed file, so they are never decompressed for it
+        return f"{get_file_content_hash(file_path)}_{read_schema_from_header(file_path)}"
+
+    @staticmethod
+    def get_types_hash(ifc_types):
+        return hashlib.sha256(",".join(sorted(ifc_types)).encode()).hexdigest()[:12]
+
+    def _get_table_path(self, key, table_name):
+        return os.path.join(self.cache_dir, key, f"{table_name}.pickle")
+
+    def has(self, key, table_name):
+        return os.path.isfile(self._get_table_path(key, table_name))
+
+    def load(self, key, table_name):
+        with open(self._get_table_path(key, table_name), 'rb') as file:
+            return pickle.load(file)
+
+    def save(self, key, table_name, table):
+        table_path = self._get_table_path(key, table_name)
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        # Write to a temporary file first so an interrupted run does not leave a truncated entry behind
+        temp_path = table_path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(table, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, table_path)
@@ -0,0 +1,343 @@
+import json
+import os
+import re
+import shutil
+import numpy as np
+import ifcopenshell.ifcopenshell_wrapper
+
+from data.utils.step_reader import StepRecords, open_step_buffer, get_schema_types
+from data.utils.ifc_input import get_compression, extract_step_file
+from data.utils.model_cache import read_schema_from_header
+
+# Version of the on-disk layout, bump it when the stored arrays change
+STEP_INDEX_VERSION = 1
+STEP_INDEX_SUFFIX = ".stepindex"
+STEP_INDEX_ARRAYS = ("ids", "starts", "ends", "type_codes", "sorted_order", "sorted_ids", "guids", "guid_indices")
+
+# GlobalId is the first attribute of every IfcRoot instance, e.g. #123=IFCWALL('2O2Fr$t4X7Zf8NOew3FLOH',...
+GLOBAL_ID_PATTERN = re.compile(rb"\(\s*'([^']*)'")
+VALUE_TOKEN_PATTERN = re.compile(rb"""\s*(?:
+    (?P<string>'(?:[^']|'')*')
+    |(?P<reference>\#\d+)
+    |(?P<enumeration>\.[A-Za-z0-9_]+\.)
+    |(?P<binary>"[0-9A-Fa-f]*")
+    |(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    |(?P<keyword>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<punctuation>[(),$*])
+)""", re.VERBOSE)
+STRING_ESCAPE_PATTERN = re.compile(r"\\X2\\((?:[0-9A-Fa-f]{4})*)\\X0\\|\\X4\\((?:[0-9A-Fa-f]{8})*)\\X0\\"
+                                   r"|\\X\\([0-9A-Fa-f]{2})|\\S\\(.)|\\\\")
+
+
+def decode_step_string(token):
+    """Decodes a quoted STEP string token (with '' quotes and \\X2\\ / \\X\\ / \\S\\ escapes) into a str."""
+    text = token[1:-1].decode('latin-1').replace("''", "'")
+
+    def decode_escape(match):
+        if match.group(1) is not None:
+            return bytes.fromhex(match.group(1)).decode('utf-16-be')
+        if match.group(2) is not None:
+            return bytes.fromhex(match.group(2)).decode('utf-32-be')
+        if match.group(3) is not None:
+            return bytes.fromhex(match.group(3)).decode('latin-1')
+        if match.group(4) is not None:
+            return chr(ord(match.group(4)) + 128)
+        return "\\"
+    return STRING_ESCAPE_PATTERN.sub(decode_escape, text)
+
+
+def tokenize_arguments(arguments):
+    tokens = []
+    arguments = arguments.strip()
+    position = 0
+    while position < len(arguments):
+        match = VALUE_TOKEN_PATTERN.match(arguments, position)
+        if match is None:
+            raise ValueError(f"Unexpected STEP argument near {arguments[position:position + 20]!r}")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+def _parse_value(tokens, position, resolve_reference):
+    kind, token = tokens[position]
+    if kind == "punctuation":
+        if token == b"(":
+            values = []
+            position += 1
+            if tokens[position][1] == b")":
+                return tuple(values), position + 1
+            while True:
+                value, position = _parse_value(tokens, position, resolve_reference)
+                values.append(value)
+                token = tokens[position][1]
+                position += 1
+                if token == b")":
+                    return tuple(values), position
+        return None, position + 1  # '$' (unset) and '*' (derived)
+    if kind == "keyword":
+        # Typed value in a select, e.g. IFCLABEL('Name'); only the wrapped value is returned
+        value, position = _parse_value(tokens, position + 2, resolve_reference)
+        return value, position + 1
+    if kind == "string":
+        return decode_step_string(token), position + 1
+    if kind == "reference":
+        return resolve_reference(int(token[1:])), position + 1
+    if kind == "enumeration":
+        name = token[1:-1].decode().upper()
+        return {"T": True, "F": False, "U": "UNKNOWN"}.get(name, name), position + 1
+    if kind == "number":
+        is_real = b"." in token or b"e" in token or b"E" in token
+        return (float(token) if is_real else int(token)), position + 1
+    return token[1:-1].decode(), position + 1  # binary
+
+
+def parse_arguments(arguments, resolve_reference=lambda entity_id: entity_id):
+    """
+    Decodes a raw STEP argument list into Python values: strings, numbers, enumerations as upper case str (logicals
+    as True/False/"UNKNOWN"), unset values as None, lists as tuples and '#id' references through resolve_reference.
+    """
+    tokens = tokenize_arguments(b"(" + arguments + b")")
+    values, _ = _parse_value(tokens, 0, resolve_reference)
+    return values
+
+
+def get_index_dir(file_path):
+    return file_path + STEP_INDEX_SUFFIX
+
+
+class StepEntity:
+    """
+    An entity instance of a StepIndex, decoded from the memory-mapped file when one of its attributes is read.
+
+    Attributes and inverse attributes are looked up by their schema names, so the instance can stand in for an
+    ifcopenshell entity_instance in read-only code such as `space.BoundedBy` or `boundary.RelatedBuildingElement`.
+    """
+    __slots__ = ("_index", "_record_index", "_arguments")
+
+    def __init__(self, index, record_index):
+        self._index = index
+        self._record_index = record_index
+        self._arguments = None
+
+    @property
+    def _declaration(self):
+        return self._index.get_declaration(self._index.records.get_type(self._record_index))
+
+    def id(self):
+        return int(self._index.records.ids[self._record_index])
+
+    def is_a(self, ifc_type=None):
+        declaration = self._declaration
+        if ifc_type is None:
+            return declaration.name()
+        ifc_type = ifc_type.upper()
+        while declaration is not None:
+            if declaration.name().upper() == ifc_type:
+                return True
+            declaration = declaration.supertype()
+        return False
+
+    def get_arguments(self):
+        if self._arguments is None:
+            raw_arguments = self._index.records.get_arguments(self._record_index)
+            self._arguments = parse_arguments(raw_arguments, self._index.get_entity_by_id)
+        return self._arguments
+
+    def __getitem__(self, attribute_index):
+        return self.get_arguments()[attribute_index]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        declaration = self._declaration
+        for attribute_index, attribute in enumerate(declaration.all_attributes()):
+            if attribute.name() == name:
+                return self.get_arguments()[attribute_index]
+        for inverse in declaration.all_inverse_attributes():
+            if inverse.name() == name:
+                return self._index.get_referencing(
+                    self, inverse.entity_reference().name(), inverse.attribute_reference().name())
+        raise AttributeError(f"entity instance of type '{declaration.name()}' has no attribute '{name}'")
+
+    def __eq__(self, other):
+        return (isinstance(other, StepEntity) and other._index is self._index
+                and other._record_index == self._record_index)
+
+    def __hash__(self):
+        return hash((id(self._index), self._record_index))
+
+    def __repr__(self):
+        return self._index.records.get_record(self._record_index).decode('latin-1')
+
+
+class StepIndex:
+    """
+    Random access to the entity instances of an IFC file without parsing the whole model.
+
+    The byte range of every instance (entity id -> offsets) and a GlobalId -> instance table are built in one scan
+    of the memory-mapped file and saved as NumPy arrays in a folder next to it (`<file>.stepindex`). Later sessions
+    map the arrays back from disk, so a point query like `by_guid` only decodes the instances it touches. The saved
+    index is rebuilt when the size or modification time of the IFC file changes.
+
+    Compressed files (.ifczip, gzip) cannot be mapped, they are extracted to a temporary file, which is mapped and
+    indexed for the session and removed by close().
+    """
+    def __init__(self, file_path, records, schema_name, file, buffer, temp_path=None):
+        self.file_path = file_path
+        self.records = records
+        self.schema_name = schema_name
+        self.schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name)
+        self._file = file
+        self._buffer = buffer
+        self._temp_path = temp_path
+        self._declarations = {}
+        self._type_names_of = {}
+
+    @classmethod
+    def open(cls, file_path, save=True):
+        """Loads the saved index of file_path if it is still valid, otherwise scans the file (and saves the index)."""
+        schema_name = read_schema_from_header(file_path)
+        if get_compression(file_path) is not None:
+            temp_path = extract_step_file(file_path)
+            file = open(temp_path, 'rb')
+            buffer = open_step_buffer(file)
+            records = StepRecords(buffer)
+            cls._add_guid_table(records, schema_name)
+            return cls(file_path, records, schema_name, file, buffer, temp_path)
+
+        file = open(file_path, 'rb')
+        buffer = open_step_buffer(file)
+        index_dir = get_index_dir(file_path)
+        records = cls._load_records(index_dir, file_path, buffer)
+        if records is None:
+            records = StepRecords(buffer)
+            cls._add_guid_table(records, schema_name)
+            if save:
+                cls._save_records(index_dir, file_path, records)
+        return cls(file_path, records, schema_name, file, buffer)
+
+    def close(self):
+        self.records = None
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+        if self._temp_path is not None:
+            os.remove(self._temp_path)
+            self._temp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _get_file_stamp(file_path):
+        stat = os.stat(file_path)
+        return {"version": STEP_INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @staticmethod
+    def _add_guid_table(records, schema_name):
+        rooted_types = get_schema_types(schema_name, ["IfcRoot"])
+        guids = []
+        guid_indices = []
+        for index in records.get_indices_of_types(rooted_types).tolist():
+            match = GLOBAL_ID_PATTERN.search(records.buffer, records.starts[index], records.ends[index])
+            if match:
+                guids.append(match.group(1))
+                guid_indices.append(index)
+        guids = np.array(guids, dtype=bytes) if guids else np.array([], dtype="S22")
+        guid_indices = np.array(guid_indices, dtype=np.int64)
+        order = np.argsort(guids, kind="stable")
+        records.guids = guids[order]
+        records.guid_indices = guid_indices[order]
+
+    @staticmethod
+    def _save_records(index_dir, file_path, records):
+        # Write to a temporary folder first so an interrupted run does not leave a partial index behind
+        temp_dir = index_dir + ".tmp"
+        try:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+            for name in STEP_INDEX_ARRAYS:
+                np.save(os.path.join(temp_dir, f"{name}.npy"), getattr(records, name))
+            meta = dict(StepIndex._get_file_stamp(file_path), type_names=records.type_names,
+                        data_start=records.data_start, data_end=records.data_end)
+            with open(os.path.join(temp_dir, "meta.json"), 'w') as file:
+                json.dump(meta, file)
+            shutil.rmtree(index_dir, ignore_errors=True)
+            os.replace(temp_dir, index_dir)
+        except OSError as error:
+            # The folder of the IFC file may be read-only; the index then only lives for this session
+            print(f"Could not save the STEP index of {file_path}: {error}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _load_records(index_dir, file_path, buffer):
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.isfile(meta_path):
+            return None
+        with open(meta_path) as file:
+            meta = json.load(file)
+        stamp = StepIndex._get_file_stamp(file_path)
+        if any(meta.get(key) != value for key, value in stamp.items()):
+            return None
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r') for name in STEP_INDEX_ARRAYS}
+        return StepRecords.from_arrays(buffer, meta["type_names"], meta["data_start"], meta["data_end"], **arrays)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_declaration(self, type_name):
+        declaration = self._declarations.get(type_name)
+        if declaration is None:
+            declaration = self._declarations[type_name] = self.schema.declaration_by_name(type_name)
+        return declaration
+
+    def get_entity_by_id(self, entity_id):
+        record_index = int(self.records.get_indices([entity_id])[0])
+        return StepEntity(self, record_index) if record_index >= 0 else None
+
+    def by_id(self, entity_id):
+        entity = self.get_entity_by_id(entity_id)
+        if entity is None:
+            raise RuntimeError(f"Instance #{entity_id} not found")
+        return entity
+
+    def by_guid(self, guid):
+        guids = self.records.guids
+        key = np.array(guid.encode(), dtype=guids.dtype) if len(guids) else None
+        position = int(np.searchsorted(guids, key)) if key is not None else 0
+        if position >= len(guids) or guids[position] != guid.encode():
+            raise RuntimeError(f"Instance {guid} not found")
+        return StepEntity(self, int(self.records.guid_indices[position]))
+
+    def by_type(self, ifc_type):
+        record_indices = self.records.get_indices_of_types(self._get_type_names(ifc_type))
+        return [StepEntity(self, int(index)) for index in record_indices]
+
+    def _get_type_names(self, ifc_type):
+        type_names = self._type_names_of.get(ifc_type)
+        if type_names is None:
+            type_names = self._type_names_of[ifc_type] = get_schema_types(self.schema_name, [ifc_type])
+        return type_names
+
+    def get_referencing(self, entity, ifc_type, attribute_name):
+        """
+        Returns the instances of ifc_type whose attribute_name points to entity (the inverse attribute lookup).
+        Only instances of ifc_type whose raw record mentions the entity id are decoded.
+        """
+        reference_pattern = re.compile(rb"#%d(?!\d)" % entity.id())
+        attribute_index = self.get_declaration(ifc_type.upper()).attribute_index(attribute_name)
+        result = []
+        for record_index in self.records.get_indices_of_types(self._get_type_names(ifc_type)).tolist():
+            if not reference_pattern.search(self.records.get_arguments(record_index)):
+                continue
+            candidate = StepEntity(self, record_index)
+            value = candidate[attribute_index]
+            if value == entity or (isinstance(value, tuple) and entity in value):
+                result.append(candidate)
+        return tuple(result)
+
@@ -0,0 +1,269 @@
+import mmap
+import os
+import re
+import tempfile
+import numpy as np
+import ifcopenshell
+import ifcopenshell.ifcopenshell_wrapper
+from data.utils.ifc_input import step_file_path
+
+# Start of an entity instance in the DATA section, e.g. #123=IFCWALL(
+RECORD_START_PATTERN = re.compile(rb"#(\d+)\s*=\s*([A-Za-z0-9_]+)\s*\(")
+# STEP strings escape quotes by doubling them, which the pattern reads as two adjacent strings
+STRING_PATTERN = re.compile(rb"'[^']*'")
+REFERENCE_PATTERN = re.compile(rb"#(\d+)")
+ARGUMENT_TOKEN_PATTERN = re.compile(rb"'[^']*'|[(),]|[^'(),]+")
+DATA_SECTION_PATTERN = re.compile(rb"\bDATA\s*;")
+END_SECTION_PATTERN = re.compile(rb"\bENDSEC\s*;")
+
+
+def open_step_buffer(file):
+    """Maps an opened STEP file into memory, so scanning it does not read the whole model into Python."""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def get_schema_types(schema_name, ifc_types):
+    """Returns the upper case STEP names of the given IFC types and all of their subtypes in the schema."""
+    schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name)
+    type_names = set()
+    pending = []
+    for ifc_type in ifc_types:
+        try:
+            pending.append(schema.declaration_by_name(ifc_type))
+        except RuntimeError:
+            continue  # Type does not exist in this schema version (e.g. IfcRelSpaceBoundary1stLevel in IFC2X3)
+    while pending:
+        declaration = pending.pop()
+        type_names.add(declaration.name().upper())
+        pending.extend(declaration.subtypes())
+    return type_names
+
+
+class StepRecords:
+    """
+    Byte offsets of all entity instances in the DATA section of a STEP file.
+
+    Only the instance ids, types and offsets are kept (as NumPy arrays), the arguments of an instance are decoded
+    from the buffer when they are asked for.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+        data_match = DATA_SECTION_PATTERN.search(buffer)
+        self.data_start = data_match.end() if data_match else 0
+        end_matches = list(END_SECTION_PATTERN.finditer(buffer, self.data_start))
+        self.data_end = end_matches[-1].start() if end_matches else len(buffer)
+
+        ids = []
+        starts = []
+        type_codes = []
+        self.type_names = []
+        type_code_of = {}
+        for match in RECORD_START_PATTERN.finditer(buffer, self.data_start, self.data_end):
+            type_name = match.group(2).decode().upper()
+            type_code = type_code_of.get(type_name)
+            if type_code is None:
+                type_code = type_code_of[type_name] = len(self.type_names)
+                self.type_names.append(type_name)
+            ids.append(int(match.group(1)))
+            starts.append(match.start())
+            type_codes.append(type_code)
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], self.data_end)
+        self.type_codes = np.array(type_codes, dtype=np.int32)
+        self.sorted_order = np.argsort(self.ids, kind="stable")
+        self.sorted_ids = self.ids[self.sorted_order]
+
+    @classmethod
+    def from_arrays(cls, buffer, type_names, data_start, data_end, **arrays):
+        """Restores the offsets of a previous scan (see StepIndex) instead of scanning the buffer again."""
+        records = cls.__new__(cls)
+        records.buffer = buffer
+        records.type_names = list(type_names)
+        records.data_start = data_start
+        records.data_end = data_end
+        for name, array in arrays.items():
+            setattr(records, name, array)
+        return records
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_indices(self, entity_ids):
+        """Maps entity ids to record indices; ids that do not exist in the file are mapped to -1."""
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        positions = np.searchsorted(self.sorted_ids, entity_ids)
+        positions = np.minimum(positions, len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == entity_ids
+        return np.where(found, self.sorted_order[positions], -1)
+
+    def get_type(self, index):
+        return self.type_names[self.type_codes[index]]
+
+    def get_indices_of_types(self, type_names):
+        codes = [code for code, name in enumerate(self.type_names) if name in type_names]
+        return np.flatnonzero(np.isin(self.type_codes, codes))
+
+    def get_record(self, index):
+        """Returns the raw bytes of the instance, from '#id=' up to and including the closing ';'."""
+        record = bytes(self.buffer[self.starts[index]:self.ends[index]]).rstrip()
+        return record
+
+    def get_arguments(self, index):
+        """Returns the raw argument list of the instance without the enclosing parentheses."""
+        record = self.get_record(index)
+        open_idx = record.index(b"(")
+        close_idx = record.rindex(b")")
+        return record[open_idx + 1:close_idx]
+
+    def get_references(self, index):
+        return get_record_references(self.get_arguments(index))
+
+
+def get_record_references(record):
+    """Returns the ids of all '#id' references in a raw record or argument list, ignoring string contents."""
+    return [int(ref) for ref in REFERENCE_PATTERN.findall(STRING_PATTERN.sub(b"''", record))]
+
+
+def split_arguments(arguments):
+    """Splits a raw STEP argument list into its top level arguments."""
+    result = []
+    current = []
+    depth = 0
+    for token in ARGUMENT_TOKEN_PATTERN.findall(arguments):
+        if token == b"(":
+            depth += 1
+        elif token == b")":
+            depth -= 1
+        elif token == b"," and depth == 0:
+            result.append(b"".join(current).strip())
+            current = []
+            continue
+        current.append(token)
+    result.append(b"".join(current).strip())
+    return result
+
+
+def get_reference_id(argument):
+    argument = argument.strip()
+    if argument.startswith(b"#") and argument[1:].isdigit():
+        return int(argument[1:])
+    return None
+
+
+class StepFilter:
+    """
+    Selects the transitive closure of the requested entity types from a STEP file.
+
+    Relationships are copied with all their references to non-rooted entities (owner history, connection geometry)
+    but their references to rooted entities that are not selected are removed from the relating lists. A relationship
+    whose single relating or related object is not selected is dropped.
+    """
+    def __init__(self, records, schema_name):
+        self.records = records
+        self.rooted_types = get_schema_types(schema_name, ["IfcRoot"])
+        self.schema_name = schema_name
+
+    def get_closure(self, start_indices, keep):
+        """Marks start_indices and everything they reference in keep."""
+        frontier = [index for index in start_indices if not keep[index]]
+        keep[frontier] = True
+        while frontier:
+            referenced_ids = []
+            for index in frontier:
+                referenced_ids.extend(self.records.get_references(index))
+            if not referenced_ids:
+                break
+            indices = self.records.get_indices(np.unique(referenced_ids))
+            indices = indices[indices >= 0]
+            indices = indices[~keep[indices]]
+            keep[indices] = True
+            frontier = indices.tolist()
+
+    def rewrite_relationship(self, index, keep):
+        """Returns the rewritten record of a relationship, or None if it does not connect selected objects."""
+        records = self.records
+        reference_ids = records.get_references(index)
+        reference_indices = dict(zip(reference_ids, records.get_indices(reference_ids).tolist()))
+
+        def is_unselected_object(argument):
+            reference_id = get_reference_id(argument)
+            if reference_id is None:
+                return False
+            ref_index = reference_indices.get(reference_id, -1)
+            return ref_index >= 0 and not keep[ref_index] and records.get_type(ref_index) in self.rooted_types
+
+        rewritten = []
+        changed = False
+        for argument in split_arguments(records.get_arguments(index)):
+            if is_unselected_object(argument):
+                return None
+            if argument.startswith(b"(") and argument != b"()":
+                members = split_arguments(argument[1:-1])
+                kept_members = [member for member in members if not is_unselected_object(member)]
+                if not kept_members:
+                    return None
+                if len(kept_members) != len(members):
+                    changed = True
+                    argument = b"(" + b",".join(kept_members) + b")"
+            rewritten.append(argument)
+        if not changed:
+            return records.get_record(index)
+        return b"#%d=%s(%s);" % (records.ids[index], records.get_type(index).encode(), b",".join(rewritten))
+
+    def filter(self, ifc_types, relationship_types):
+        records = self.records
+        keep = np.zeros(len(records), dtype=bool)
+
+        # 1. Requested objects and everything they reference (placements, representations, profiles, ...)
+        object_types = get_schema_types(self.schema_name, ifc_types)
+        self.get_closure(records.get_indices_of_types(object_types).tolist(), keep)
+
+        # 2. Relationships between the selected objects, stripped of unselected objects
+        rewritten_records = {}
+        relationship_indices = records.get_indices_of_types(get_schema_types(self.schema_name, relationship_types))
+        kept_relationships = []
+        for index in relationship_indices:
+            record = self.rewrite_relationship(index, keep)
+            if record is not None:
+                rewritten_records[index] = record
+                kept_relationships.append(index)
+        keep[kept_relationships] = True
+        # Owner history and connection geometry of the kept relationships
+        for index in kept_relationships:
+            references = get_record_references(rewritten_records[index])[1:]  # skip the record's own id
+            if references:
+                self.get_closure([ref for ref in records.get_indices(references).tolist() if ref >= 0], keep)
+
+        # 3. Reassemble a STEP file from the header and the kept records, in their original order
+        parts = [bytes(records.buffer[:records.data_start]), b"\n"]
+        for index in np.flatnonzero(keep):
+            parts.append(rewritten_records.get(index) or records.get_record(index))
+            parts.append(b"\n")
+        parts.append(b"ENDSEC;\nEND-ISO-10303-21;\n")
+        return b"".join(parts), int(keep.sum())
+
+
+def open_filtered_model(file_path, schema_name, ifc_types, relationship_types):
+    """
+    Opens only the requested entity types of an IFC file (with their transitive closure and the given relationships)
+    as an ifcopenshell file. Ids and GlobalIds are the same as in the full model.
+    """
+    # Compressed files are extracted to a temporary file, which is scanned memory-mapped as a plain one
+    with step_file_path(file_path) as path, open(path, 'rb') as file:
+        buffer = open_step_buffer(file)
+        try:
+            records = StepRecords(buffer)
+            step_bytes, _ = StepFilter(records, schema_name).filter(ifc_types, relationship_types)
+        finally:
+            buffer.close()
+    # Parsed from a file as well, from_string would need a decoded copy of the filtered content
+    handle, temp_path = tempfile.mkstemp(suffix=".ifc")
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(step_bytes)
+        del step_bytes
+        return ifcopenshell.open(temp_path)
+    finally:
+        os.remove(temp_path)